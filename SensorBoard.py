@@ -1,13 +1,40 @@
 #!/usr/bin/python3
 
+import os
 import time
-from datetime import datetime, timedelta
-import smbus
-import RPi.GPIO as GPIO
+import functools
+import threading
+import atexit
+import signal
+import sys
+from datetime import datetime
 import numpy as np
-from scipy.signal import find_peaks, butter, filtfilt
 import sqlite3
-import matplotlib.pyplot as plt
+try:
+    from smbus2 import i2c_msg
+except ImportError:
+    i2c_msg = None
+from sensordb import SensorDBWriter, RetentionPruner, create_table, migrate_time, SENSORBOARD_COLUMNS
+from scheduler import LockedBus, PollScheduler, SensorTask
+from ppg import StreamingPPG #scipy is only imported once PPG analysis runs
+from sensorbus import open_bus, open_gpio
+from crc8 import crc8
+from rollup import create_rollup_tables, update_rollups, rollup_pruners
+from archive import archive_rows
+from deadband import COMPRESSORS
+from narrowdb import NarrowDBWriter, migrate, sensor_tables
+from timestamps import time_us
+import metrics
+import i2ctrace
+from metrics import timed, CountingBus
+
+DB_NAME = '/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/SensorBoard.db'
+RETENTION_DAYS = 7
+#rows leaving the retention window are kept as per-day columnar files here, None drops them
+ARCHIVE_DIR = '/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/archive'
+#SENSORBOARD_PUBLISH=1 streams readings to local subscribers (publisher.py, the same switch as publisher.ENABLED);
+#publisher.py and asyncio are only imported when it is set
+PUBLISH = os.environ.get('SENSORBOARD_PUBLISH', '') == '1'
 
 DHT20_ADDRESS = 0x38
 AGS10_ADDRESS = 0x1A
@@ -15,6 +42,10 @@ BH1750FVI_ADDRESS = 0x23 # ADDR_HIGH 0x5C
 BMP581_ADDRESS = 0x46 # SDO_HIGH 0x47
 MPU6500_ADDRESS = 0x68 # SDO_HIGH 0x69 ?
 MAX30102_ADDRESS = 0x57
+#with the ADDR / SDO pins driven high, see Board(strap_high = True)
+BH1750FVI_ADDRESS_HIGH = 0x5C
+BMP581_ADDRESS_HIGH = 0x47
+MPU6500_ADDRESS_HIGH = 0x69
 
 BH1750FVI_ADDR_PIN = 29
 BH1750FVI_DVI_PIN = 31
@@ -26,432 +57,574 @@ MPU6500_FSYNC_PIN = 13
 MPU6500_nCS_PIN = 15
 MAX30102_INT_PIN = 37
 
-GPIO.setmode(GPIO.BOARD)
-i2c = smbus.SMBus(1)
+#polling period of each sensor in seconds, a row is written every DB_PERIOD
+SENSOR_PERIODS = {
+    'DHT20': 2.0,
+    'AGS10': 2.0,
+    'BH1750FVI': 0.5,
+    'BMP581': 0.5,
+    'MPU6500': 0.1,
+    'MAX30102': 0.2,
+}
+#number of values each sensor contributes to a row, in insert_data() order
+SENSOR_FIELDS = {
+    'DHT20': 2,
+    'AGS10': 1,
+    'BH1750FVI': 1,
+    'BMP581': 2,
+    'MPU6500': 7,
+    'MAX30102': 3,
+}
+DB_PERIOD = 0.5
+#None stores every row; 'deadband' only rows where a value moved beyond its deadband.TOLERANCES entry (read back as steps),
+#'swinging_door' only the rows needed to rebuild each value within its tolerance by linear interpolation,
+#both keep a row at least every deadband.HEARTBEAT seconds; rollups are still computed from every row
+COMPRESSION = None
+#'wide' writes a row of every sensor's latest values each DB_PERIOD; 'narrow' logs every reading at its sensor's own
+#rate into per-sensor tables (narrowdb.py), an existing wide table is migrated and SensorBoard becomes a view over them
+STORAGE = 'wide'
+#'poll' reads every sensor on SENSOR_PERIODS; 'interrupt' reads BMP581 (data ready), MAX30102 (FIFO almost full)
+#and MPU6500 (data ready, register mode only) when their INT pin fires, and after INTERRUPT_TIMEOUT without an edge
+ACQUISITION_MODE = 'poll'
+INTERRUPT_TIMEOUT = 2.0
+MAX30102_SAMPLE_RATE = 400 / 16 #raw sample / sample average
+MAX30102_FIFO_DEPTH = 32
+MAX30102_BURST_BYTES = 30
+MAX30102_WINDOW = 300 #samples kept for heart rate / SpO2, 12 s at 25 Hz
+PPG_ANALYSIS = True #False logs only the MAX30102 temperature and never loads scipy
+MAX30102_A_FULL = 15 #free FIFO slots when INT fires: 17 unread samples, 0.68 s at 25 Hz
 
-def DHT20_getdata():
-    if((i2c.read_byte(DHT20_ADDRESS) & 0x18) != 0x18):
-        raise ValueError("DHT20 Init Error")
-    
-    i2c.write_i2c_block_data(DHT20_ADDRESS, 0xAC, [0x33, 0x00])
-    time.sleep(0.1)
-    
-    if((i2c.read_byte(0x38)& 0x80)==0x80):
-        raise ValueError("DHT20 Busy")
-    data = i2c.read_i2c_block_data(DHT20_ADDRESS, 0xAC, 7)
-    
-    humidity = ((data[1] << 12) | data[2] << 4 | (data[3] & 0xF0) >> 4) *100 / (1 << 20)
-    temperature = ((data[3] & 0x0F) << 16 | data[4] << 8 | data[5]) / (1 << 20) * 200 - 50.0
-
-    crc = 0xFF
-    for byte in data[:6]:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x31
-            else:
-                crc <<= 1
-        crc &= 0xFF
-    
-    if crc != data[6]:
-        raise ValueError("DHT20 CRC Check Error")
-    
-    return temperature, humidity
-
-def AGS10_getdata():
-    data = i2c.read_i2c_block_data(AGS10_ADDRESS, 0x00, 5)
-    if((data[0]& 0x01) != 0x00):
-        raise ValueError("AGS10 warming or data not update")
-    TVOC = (data[1] << 16 | data[2] << 8 | data[3]) / 1000
-    crc = 0xFF
-    for byte in data[:4]:
-        crc ^= byte
-        for _ in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0x31
+#'register' reads the latest sample every poll, 'fifo' streams every sample at MPU6500_FIFO_RATE
+#into per-day files in MPU6500_FIFO_DIR and logs the newest one
+MPU6500_MODE = 'register'
+MPU6500_FIFO_RATE = 100 #Hz, 1kHz / (1 + SMPLRT_DIV)
+MPU6500_DRDY_RATE = 10 #Hz, data ready interrupts in interrupt mode
+MPU6500_FIFO_DIR = '/home/xxlxxl/DockerConf/HomeAssistant/SensorDB'
+MPU6500_SAMPLE_BYTES = 14
+MPU6500_BURST_BYTES = 28
+MPU6500_ACCEL_SCALE = 4096.0 #Sensitivity Factor 8g
+MPU6500_GYRO_SCALE = 32.8 #Sensitivity Factor 1000 dps
+#register order from ACCEL_XOUT_H, which is also the FIFO order
+MPU6500_RAW_DTYPE = np.dtype([('accel_x', '>i2'), ('accel_y', '>i2'), ('accel_z', '>i2'), ('temp', '>i2'),
+        ('gyro_x', '>i2'), ('gyro_y', '>i2'), ('gyro_z', '>i2')])
+#time is epoch microseconds (timestamps.time_us()), like MAX30102 sample times and the database
+MPU6500_BLOCK_DTYPE = np.dtype([('time', '<i8'), ('accel_x', '<f4'), ('accel_y', '<f4'), ('accel_z', '<f4'),
+        ('temp', '<f4'), ('gyro_x', '<f4'), ('gyro_y', '<f4'), ('gyro_z', '<f4')])
+
+def MPU6500_decode(raw):
+    #raw register/FIFO bytes -> structured array of signed 16-bit words, one row per sample
+    return np.frombuffer(bytes(raw), dtype = MPU6500_RAW_DTYPE)
+
+def MPU6500_scale(samples, out):
+    out['accel_x'] = samples['accel_x'] / MPU6500_ACCEL_SCALE
+    out['accel_y'] = samples['accel_y'] / MPU6500_ACCEL_SCALE
+    out['accel_z'] = samples['accel_z'] / MPU6500_ACCEL_SCALE
+    out['gyro_x'] = samples['gyro_x'] / MPU6500_GYRO_SCALE
+    out['gyro_y'] = samples['gyro_y'] / MPU6500_GYRO_SCALE
+    out['gyro_z'] = samples['gyro_z'] / MPU6500_GYRO_SCALE
+    out['temp'] = (samples['temp'] - 21.0) / 333.87 + 21.0
+    return out
+
+def MAX30102_decode(raw, red_out, ir_out):
+    #3-byte big-endian red/IR words, decoded for all samples at once
+    samples = np.frombuffer(raw, dtype = np.uint8).reshape(-1, 6).astype(np.uint32)
+    n = len(samples)
+    red, ir = red_out[:n], ir_out[:n]
+    np.left_shift(samples[:, 0], 16, out = red)
+    red |= samples[:, 1] << 8
+    red |= samples[:, 2]
+    np.left_shift(samples[:, 3], 16, out = ir)
+    ir |= samples[:, 4] << 8
+    ir |= samples[:, 5]
+    return red, ir
+
+
+class Board:
+    #one SensorBoard: its I2C bus, GPIO pins, chip addresses and driver state, so one process can run several
+    #strap_high drives the ADDR/SDO pins high, moving BH1750FVI, BMP581 and MPU6500 to their alternate addresses;
+    #DHT20, AGS10 and MAX30102 have fixed addresses, so a second board on the same bus must leave them unpopulated
+    #pins overrides the GPIO.BOARD pin numbers by constant name, e.g. {'MAX30102_INT_PIN': 36}
+    def __init__(self, name = 'SensorBoard', bus_id = 1, strap_high = False, pins = None, periods = None, bus = None, gpio = None):
+        self.name = name
+        #real hardware by default, SENSORBOARD_BUS=sim runs against simboard.py
+        self.GPIO = gpio if gpio is not None else open_gpio(bus_id = bus_id)
+        self.GPIO.setmode(self.GPIO.BOARD)
+        if bus is None:
+            bus = open_bus(bus_id)
+            #SENSORBOARD_TRACE=<dir> records every transaction for i2ctrace.replay(), innermost so it sees bus order
+            if i2ctrace.TRACE_DIR:
+                bus = i2ctrace.RecordingBus(bus, i2ctrace.trace_path(name))
+            #SENSORBOARD_METRICS=1 counts transactions per address and driver; off, the bus is not wrapped at all
+            if metrics.ENABLED:
+                bus = CountingBus(bus)
+        self.i2c = LockedBus(bus)
+
+        self.strap = self.GPIO.HIGH if strap_high else self.GPIO.LOW
+        self.DHT20_ADDRESS = DHT20_ADDRESS
+        self.AGS10_ADDRESS = AGS10_ADDRESS
+        self.BH1750FVI_ADDRESS = BH1750FVI_ADDRESS_HIGH if strap_high else BH1750FVI_ADDRESS
+        self.BMP581_ADDRESS = BMP581_ADDRESS_HIGH if strap_high else BMP581_ADDRESS
+        self.MPU6500_ADDRESS = MPU6500_ADDRESS_HIGH if strap_high else MPU6500_ADDRESS
+        self.MAX30102_ADDRESS = MAX30102_ADDRESS
+
+        pins = pins or {}
+        self.BH1750FVI_ADDR_PIN = pins.get('BH1750FVI_ADDR_PIN', BH1750FVI_ADDR_PIN)
+        self.BH1750FVI_DVI_PIN = pins.get('BH1750FVI_DVI_PIN', BH1750FVI_DVI_PIN)
+        self.BMP581_SDO_PIN = pins.get('BMP581_SDO_PIN', BMP581_SDO_PIN)
+        self.BMP581_INT_PIN = pins.get('BMP581_INT_PIN', BMP581_INT_PIN)
+        self.MPU6500_SDO_PIN = pins.get('MPU6500_SDO_PIN', MPU6500_SDO_PIN)
+        self.MPU6500_INT_PIN = pins.get('MPU6500_INT_PIN', MPU6500_INT_PIN)
+        self.MPU6500_FSYNC_PIN = pins.get('MPU6500_FSYNC_PIN', MPU6500_FSYNC_PIN)
+        self.MPU6500_nCS_PIN = pins.get('MPU6500_nCS_PIN', MPU6500_nCS_PIN)
+        self.MAX30102_INT_PIN = pins.get('MAX30102_INT_PIN', MAX30102_INT_PIN)
+
+        self.periods = dict(SENSOR_PERIODS, **(periods or {}))
+        self.acquisition_mode = ACQUISITION_MODE
+        self.mpu6500_mode = MPU6500_MODE
+        #'local' runs StreamingPPG on the MAX30102 thread, 'pool' leaves the raw samples for take_ppg(), None skips it
+        self.ppg = 'local' if PPG_ANALYSIS else None
+        self.ppg_engine = None
+        self.ppg_pending = []
+        self.ppg_lock = threading.Lock()
+        self.MAX30102_red_buf = np.empty(MAX30102_FIFO_DEPTH, dtype = np.uint32)
+        self.MAX30102_ir_buf = np.empty(MAX30102_FIFO_DEPTH, dtype = np.uint32)
+        #on_block(name, block) gets every MPU6500 FIFO block and the (red, ir, times) samples of every MAX30102 read
+        #(times in epoch microseconds), on the sensor's thread and only until it returns, red and ir are reused
+        self.on_block = None
+
+    @timed
+    def DHT20_getdata(self):
+        if((self.i2c.read_byte(self.DHT20_ADDRESS) & 0x18) != 0x18):
+            raise ValueError("DHT20 Init Error")
+
+        self.i2c.write_i2c_block_data(self.DHT20_ADDRESS, 0xAC, [0x33, 0x00])
+        time.sleep(0.1)
+
+        if((self.i2c.read_byte(self.DHT20_ADDRESS)& 0x80)==0x80):
+            raise ValueError("DHT20 Busy")
+        data = self.i2c.read_i2c_block_data(self.DHT20_ADDRESS, 0xAC, 7)
+
+        humidity = ((data[1] << 12) | data[2] << 4 | (data[3] & 0xF0) >> 4) *100 / (1 << 20)
+        temperature = ((data[3] & 0x0F) << 16 | data[4] << 8 | data[5]) / (1 << 20) * 200 - 50.0
+
+        if crc8(data[:6]) != data[6]:
+            raise ValueError("DHT20 CRC Check Error")
+
+        return temperature, humidity
+
+    @timed
+    def AGS10_getdata(self):
+        data = self.i2c.read_i2c_block_data(self.AGS10_ADDRESS, 0x00, 5)
+        if((data[0]& 0x01) != 0x00):
+            raise ValueError("AGS10 warming or data not update")
+        TVOC = (data[1] << 16 | data[2] << 8 | data[3]) / 1000
+        if crc8(data[:4]) != data[4]:
+            raise ValueError("AGS10 CRC Check Error")
+        return TVOC
+
+    def BH1750FVI_init(self):
+        self.GPIO.setup(self.BH1750FVI_ADDR_PIN, self.GPIO.OUT, initial = self.strap)
+        self.GPIO.setup(self.BH1750FVI_DVI_PIN, self.GPIO.OUT, initial = self.GPIO.LOW)
+        time.sleep(0.1)
+        self.GPIO.output(self.BH1750FVI_ADDR_PIN, self.strap)
+        self.GPIO.output(self.BH1750FVI_DVI_PIN, self.GPIO.HIGH)
+        time.sleep(0.1)
+        self.i2c.write_byte(self.BH1750FVI_ADDRESS, 0x01)
+        time.sleep(0.1)
+        self.i2c.write_byte(self.BH1750FVI_ADDRESS, 0x07)
+        time.sleep(0.1)
+        #set CONTINUOUS_HIGH_RES_MODE
+        self.i2c.write_byte(self.BH1750FVI_ADDRESS, 0x10)
+        time.sleep(0.2)
+
+    @timed
+    def BH1750FVI_getdata(self):
+        data = self.i2c.read_i2c_block_data(self.BH1750FVI_ADDRESS, 0x10,2)
+
+        AL = (data[0] << 8 | data[1])/ 1.2
+
+        return AL
+
+    def BMP581_init(self):
+        self.GPIO.setup(self.BMP581_SDO_PIN, self.GPIO.OUT, initial = self.strap)
+        self.GPIO.setup(self.BMP581_INT_PIN, self.GPIO.IN)
+        time.sleep(0.1)
+        self.GPIO.output(self.BMP581_SDO_PIN, self.strap)
+        time.sleep(0.1)
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x7E, 0xB6) #CMD soft reset, INT_STATUS clears on read so a re-init needs a fresh POR
+        time.sleep(0.01)
+
+        if(self.i2c.read_byte_data(self.BMP581_ADDRESS,0x01) == 0x00):
+            raise ValueError("BMP581 CHIP_ID Check Error")
+        if(self.i2c.read_byte_data(self.BMP581_ADDRESS, 0x28) & 0x02 != 0x02):
+            raise ValueError("BMP581 STATUS_NVM_RDY Check Error")
+        if(self.i2c.read_byte_data(self.BMP581_ADDRESS, 0x28) & 0x04 != 0x00):
+            raise ValueError("BMP581 STATUS_NVM_ERR Check Error")
+        if(self.i2c.read_byte_data(self.BMP581_ADDRESS, 0x27) != 0x10):
+            raise ValueError("BMP581 INT Check Error")
+
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x36, 0x7F)
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x31, 0x09)
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x37, 0xEB)
+
+    def BMP581_interrupt_init(self):
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x15, 0x01) #INT_SOURCE drdy_data_reg_en
+        self.i2c.write_byte_data(self.BMP581_ADDRESS, 0x14, 0x0A) #INT_CONFIG int_en, push-pull, active high, pulsed
+
+    @timed
+    def BMP581_getdata(self):
+        data = self.i2c.read_i2c_block_data(self.BMP581_ADDRESS, 0x1D, 6)
+
+        temp = (data[2] << 16 | data[1] << 8 | data[0]) / (1 << 16)
+        pressure = (data[5] << 16 | data[4] << 8 | data[3]) / (1 << 6)
+
+        return temp, pressure
+
+    def MPU6500_init(self):
+        self.GPIO.setup(self.MPU6500_SDO_PIN, self.GPIO.OUT, initial = self.strap)
+        self.GPIO.setup(self.MPU6500_INT_PIN, self.GPIO.IN)
+        self.GPIO.setup(self.MPU6500_FSYNC_PIN, self.GPIO.OUT, initial = self.GPIO.LOW) #if unuse, to GND
+        self.GPIO.setup(self.MPU6500_nCS_PIN, self.GPIO.OUT, initial = self.GPIO.HIGH)
+        time.sleep(0.1)
+        self.GPIO.output(self.MPU6500_SDO_PIN, self.strap)
+        self.GPIO.setup(self.MPU6500_nCS_PIN, self.GPIO.HIGH)
+        self.GPIO.output(self.MPU6500_FSYNC_PIN, self.GPIO.LOW)
+        time.sleep(0.1)
+
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6B, 0x80) #PWR_MGMT_1
+        time.sleep(0.2)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6B, 0x00) #PWR_MGMT_1
+        time.sleep(0.2)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6A, 0x08) #USER_CTRL DMP reset
+        time.sleep(0.2)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6A, 0x00) #USER_CTRL DMP reset
+        time.sleep(0.2)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1A, 0x00)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1B, 0x10) #1000 degrees pre second (Sensitivity Factor 32.8)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1C, 0x10) #8g (Sensitivity Factor 4096)
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1D, 0x01) #DLPF1
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1E, 0x08) #62.5Hz
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1F, 0xC8) #Wake on Motion 200mg
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x38, 0x40) #INT Wake on Motion
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x69, 0xC0) #ACCEL_INTEL_CTRL
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6A, 0x80) #USER_CTRL DMP enable
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6B, 0x01) #PWR_MGMT_1
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6C, 0x00) #PWR_MGMT_2
+
+    def MPU6500_interrupt_init(self):
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1A, 0x01) #CONFIG DLPF_CFG=1, 1kHz internal rate so SMPLRT_DIV applies
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x19, int(1000 / MPU6500_DRDY_RATE) - 1) #SMPLRT_DIV
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x37, 0x30) #INT_PIN_CFG active high, latched, cleared by any read
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x38, 0x01) #INT_ENABLE RAW_RDY_EN instead of wake on motion
+
+    def MPU6500_fifo_init(self):
+        #stream accel, temp and gyro through the 512 byte FIFO at MPU6500_FIFO_RATE
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x1A, 0x01) #CONFIG DLPF_CFG=1, 1kHz internal rate, FIFO overwrites when full
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x19, int(1000 / MPU6500_FIFO_RATE) - 1) #SMPLRT_DIV
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x23, 0xF8) #FIFO_EN TEMP, GYRO XYZ, ACCEL
+        self.MPU6500_fifo_reset()
+
+    def MPU6500_fifo_reset(self):
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6A, 0x84) #USER_CTRL DMP enable, FIFO reset
+        self.i2c.write_byte_data(self.MPU6500_ADDRESS, 0x6A, 0xC0) #USER_CTRL DMP enable, FIFO enable
+
+    @timed
+    def MPU6500_getdata(self):
+        #ACCEL_XOUT_H .. GYRO_ZOUT_L are contiguous, one 14 byte read per sample
+        sample = MPU6500_scale(MPU6500_decode(self.i2c.read_i2c_block_data(self.MPU6500_ADDRESS, 0x3B, 14)),
+                np.empty(1, dtype = MPU6500_BLOCK_DTYPE))[0]
+        return (float(sample['accel_x']), float(sample['accel_y']), float(sample['accel_z']),
+                float(sample['gyro_x']), float(sample['gyro_y']), float(sample['gyro_z']), float(sample['temp']))
+
+    @timed
+    def MPU6500_read_fifo(self):
+        #drains whole samples from the FIFO, returns a block with one timestamped row per sample
+        if self.i2c.read_byte_data(self.MPU6500_ADDRESS, 0x3A) & 0x10: #INT_STATUS FIFO_OFLOW
+            #an overwritten FIFO is no longer aligned to sample boundaries
+            self.MPU6500_fifo_reset()
+            raise ValueError("MPU6500 FIFO Overflow")
+        count_h, count_l = self.i2c.read_i2c_block_data(self.MPU6500_ADDRESS, 0x72, 2)
+        read_time = time_us()
+        num_samples = ((count_h & 0x1F) << 8 | count_l) // MPU6500_SAMPLE_BYTES
+        if num_samples == 0:
+            #nothing to drain, no zero-length transaction on the shared bus
+            return np.empty(0, dtype = MPU6500_BLOCK_DTYPE)
+
+        raw = self.i2c_read_burst(self.MPU6500_ADDRESS, 0x74, num_samples * MPU6500_SAMPLE_BYTES, MPU6500_BURST_BYTES)
+        block = MPU6500_scale(MPU6500_decode(raw), np.empty(num_samples, dtype = MPU6500_BLOCK_DTYPE))
+        #the newest sample was taken just before the count was read, the others one period apart
+        block['time'] = read_time - np.arange(num_samples - 1, -1, -1, dtype = np.int64) * int(1000000 / MPU6500_FIFO_RATE)
+        return block
+
+    def MPU6500_write_block(self, block, directory = None):
+        #appends a block to a per-day binary file, read back with np.fromfile(path, dtype = MPU6500_BLOCK_DTYPE)
+        if not len(block):
+            return
+        day = datetime.fromtimestamp(block['time'][0] // 1000000).strftime('%Y-%m-%d')
+        prefix = '' if self.name == 'SensorBoard' else self.name + '_'
+        path = os.path.join(directory or MPU6500_FIFO_DIR, '{}MPU6500_{}.bin'.format(prefix, day))
+        with open(path, 'ab') as f:
+            block.tofile(f)
+
+    def MAX30102_init(self):
+        self.GPIO.setup(self.MAX30102_INT_PIN, self.GPIO.IN)
+        time.sleep(0.1)
+
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x09, 0x40) #Reset
+        time.sleep(0.1)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x09, 0x03) #spO2 Mode
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x0A, 0x0F) #400Hz 411us
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x0C, 0x0F) #LED Current 3.0mA
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x0D, 0x0F) #LED Current 3.0mA
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x21, 0x00) #0x01 for one temp sample
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x02, 0x00)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x03, 0x00)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x04, 0x00)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x05, 0x00)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x06, 0x00)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x08, 0x90) #16 samples average
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x21, 0x01)
+
+    def MAX30102_interrupt_init(self):
+        self.GPIO.setup(self.MAX30102_INT_PIN, self.GPIO.IN, pull_up_down = self.GPIO.PUD_UP) #INT is open drain, active low
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x08, 0x90 | MAX30102_A_FULL) #16 samples average, FIFO_A_FULL
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x02, 0x80) #A_FULL_EN
+        self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x00) #clear pending interrupts
+
+    def i2c_read_burst(self, address, register, nbytes, chunk):
+        #FIFO data registers do not auto-increment, a burst read pops consecutive bytes
+        if i2c_msg is not None and hasattr(self.i2c, 'i2c_rdwr'):
+            #smbus2: everything in one combined write/read transaction
+            write = i2c_msg.write(address, [register])
+            read = i2c_msg.read(address, nbytes)
+            self.i2c.i2c_rdwr(write, read)
+            return bytes(read)
+        raw = bytearray()
+        while len(raw) < nbytes:
+            #smbus block reads are limited to 32 bytes, chunk keeps every read on a sample boundary
+            raw += bytes(self.i2c.read_i2c_block_data(address, register, min(nbytes - len(raw), chunk)))
+        return raw
+
+    def MAX30102_read_fifo(self, num_samples):
+        return self.i2c_read_burst(self.MAX30102_ADDRESS, 0x07, num_samples * 6, MAX30102_BURST_BYTES)
+
+    @timed
+    def MAX30102_getdata(self):
+        write_ptr = self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x04)
+        read_ptr = self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x06)
+        overflow_counter = self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x05)
+        read_time = time_us()
+
+        if write_ptr == read_ptr:
+            if overflow_counter == 0:
+                raise ValueError("MAX30102 No new data to read.")
+            #equal pointers after an overflow mean the FIFO is full
+            num_samples = MAX30102_FIFO_DEPTH
+        elif write_ptr > read_ptr:
+            num_samples = write_ptr - read_ptr
+        else:
+            num_samples = (MAX30102_FIFO_DEPTH - read_ptr) + write_ptr
+
+    #     print(f"Number of samples to read: {num_samples}")
+
+        #views into MAX30102_red_buf/MAX30102_ir_buf, only valid until the next call
+        red_data, ir_data = MAX30102_decode(self.MAX30102_read_fifo(num_samples), self.MAX30102_red_buf, self.MAX30102_ir_buf)
+        #the newest sample was taken just before the pointers were read, the others one sample period apart
+        sample_times = read_time - np.arange(num_samples - 1, -1, -1, dtype = np.int64) * int(1000000 / MAX30102_SAMPLE_RATE)
+
+        temp_int = self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x1F)
+        temp_frac = self.i2c.read_byte_data(self.MAX30102_ADDRESS, 0x20)
+        self.i2c.write_byte_data(self.MAX30102_ADDRESS, 0x21, 0x01) #for next
+
+        temp = temp_int + (temp_frac * 0.0625)
+    #     print(temp)
+
+        return red_data, ir_data, temp, sample_times
+
+    def MAX30102_read(self):
+        new_red, new_ir, MAX30102_temp, sample_times = self.MAX30102_getdata()
+        if self.on_block is not None:
+            self.on_block('MAX30102', (new_red, new_ir, sample_times))
+        if self.ppg == 'pool':
+            #copies, the buffers are reused by the next read; heart rate and SpO2 are filled in by multiboard.py
+            with self.ppg_lock:
+                self.ppg_pending.append((new_red.copy(), new_ir.copy()))
+            return None, None, MAX30102_temp
+        if self.ppg is None:
+            return -1.0, -1.0, MAX30102_temp
+        if self.ppg_engine is None:
+            self.ppg_engine = StreamingPPG(MAX30102_SAMPLE_RATE, MAX30102_WINDOW)
+        #only the new samples are filtered, see ppg.StreamingPPG
+        heart_rate, spo2 = self.ppg_engine.update(new_red, new_ir)
+    #     print(f"Heart Rate: {heart_rate:.2f} bpm, SpO2: {spo2:.2f} %")
+    #     print(f"MAX30102_Temperature: {MAX30102_temp:.2f} C")
+        return heart_rate, spo2, MAX30102_temp
+
+    def take_ppg(self):
+        #raw MAX30102 samples read since the last call, in 'pool' mode
+        with self.ppg_lock:
+            pending, self.ppg_pending = self.ppg_pending, []
+        if not pending:
+            return np.empty(0, dtype = np.uint32), np.empty(0, dtype = np.uint32)
+        return np.concatenate([red for red, _ in pending]), np.concatenate([ir for _, ir in pending])
+
+    def MPU6500_read(self):
+        block = self.MPU6500_read_fifo()
+        if not len(block):
+            raise ValueError("MPU6500 No new data to read.")
+        self.MPU6500_write_block(block)
+        if self.on_block is not None:
+            self.on_block('MPU6500', block)
+        last = block[-1]
+        return (float(last['accel_x']), float(last['accel_y']), float(last['accel_z']),
+                float(last['gyro_x']), float(last['gyro_y']), float(last['gyro_z']), float(last['temp']))
+
+    def MPU6500_setup(self):
+        self.MPU6500_init()
+        if self.mpu6500_mode == 'fifo':
+            self.MPU6500_fifo_init()
+
+    def interrupt_setup(self, init, interrupt_init, pin, edge, event):
+        #runs as the task's init, so a backed-off sensor also gets its interrupt configured again
+        init()
+        interrupt_init()
+        self.GPIO.remove_event_detect(pin)
+        #RPi.GPIO calls back on its own thread, the sensor thread waits on the event
+        #the scheduler reads once right after init, which also clears an INT latched before the callback existed
+        self.GPIO.add_event_detect(pin, edge, callback = lambda channel: event.set())
+
+    def sensor_tasks(self):
+        #a failed or backed-off sensor stores None, its fields are written as NULL
+        reads = [
+            ('DHT20', self.DHT20_getdata, None),
+            ('AGS10', lambda: (self.AGS10_getdata(),), None),
+            ('BH1750FVI', lambda: (self.BH1750FVI_getdata(),), self.BH1750FVI_init),
+            ('BMP581', self.BMP581_getdata, self.BMP581_init),
+            ('MPU6500', self.MPU6500_read if self.mpu6500_mode == 'fifo' else self.MPU6500_getdata, self.MPU6500_setup),
+            ('MAX30102', self.MAX30102_read, self.MAX30102_init),
+        ]
+        interrupts = {
+            'BMP581': (self.BMP581_interrupt_init, self.BMP581_INT_PIN, self.GPIO.RISING),
+            'MAX30102': (self.MAX30102_interrupt_init, self.MAX30102_INT_PIN, self.GPIO.FALLING),
+        }
+        if self.mpu6500_mode != 'fifo':
+            #the MPU6500 has no FIFO watermark interrupt, fifo mode stays polled
+            interrupts['MPU6500'] = (self.MPU6500_interrupt_init, self.MPU6500_INT_PIN, self.GPIO.RISING)
+        tasks = []
+        for name, read, init in reads:
+            if self.acquisition_mode == 'interrupt' and name in interrupts:
+                event = threading.Event()
+                init = functools.partial(self.interrupt_setup, init, *interrupts[name], event)
+                tasks.append(SensorTask(name, INTERRUPT_TIMEOUT, read, init = init, event = event))
             else:
-                crc <<= 1
-        crc &= 0xFF
-    
-    if crc != data[4]:
-        raise ValueError("AGS10 CRC Check Error")
-    return TVOC
-    
-def BH1750FVI_init():
-    GPIO.setup(BH1750FVI_ADDR_PIN, GPIO.OUT, initial = GPIO.LOW)
-    GPIO.setup(BH1750FVI_DVI_PIN, GPIO.OUT, initial = GPIO.LOW)
-    time.sleep(0.1)
-    GPIO.output(BH1750FVI_ADDR_PIN, GPIO.LOW)
-    GPIO.output(BH1750FVI_DVI_PIN, GPIO.HIGH)
-    time.sleep(0.1)
-    i2c.write_byte(BH1750FVI_ADDRESS, 0x01)
-    time.sleep(0.1)
-    i2c.write_byte(BH1750FVI_ADDRESS, 0x07)
-    time.sleep(0.1)
-    #set CONTINUOUS_HIGH_RES_MODE
-    i2c.write_byte(BH1750FVI_ADDRESS, 0x10)
-    time.sleep(0.2)
-
-def BH1750FVI_getdata():
-    data = i2c.read_i2c_block_data(BH1750FVI_ADDRESS, 0x10,2)
-    
-    AL = (data[0] << 8 | data[1])/ 1.2
-    
-    return AL
-
-def BMP581_init():
-    GPIO.setup(BMP581_SDO_PIN, GPIO.OUT, initial = GPIO.LOW)
-    GPIO.setup(BMP581_INT_PIN, GPIO.IN)
-    time.sleep(0.1)
-    GPIO.output(BMP581_SDO_PIN, GPIO.LOW)
-    time.sleep(0.1)
-    
-    if(i2c.read_byte_data(BMP581_ADDRESS,0x01) == 0x00):
-        raise ValueError("BMP581 CHIP_ID Check Error")
-    if(i2c.read_byte_data(BMP581_ADDRESS, 0x28) & 0x02 != 0x02):
-        raise ValueError("BMP581 STATUS_NVM_RDY Check Error")
-    if(i2c.read_byte_data(BMP581_ADDRESS, 0x28) & 0x04 != 0x00):
-        raise ValueError("BMP581 STATUS_NVM_ERR Check Error")
-    if(i2c.read_byte_data(BMP581_ADDRESS, 0x27) != 0x10):
-        raise ValueError("BMP581 INT Check Error")
-    
-    i2c.write_byte_data(BMP581_ADDRESS, 0x36, 0x7F)
-    i2c.write_byte_data(BMP581_ADDRESS, 0x31, 0x09)
-    i2c.write_byte_data(BMP581_ADDRESS, 0x37, 0xEB)
-    
-def BMP581_getdata():
-    data = i2c.read_i2c_block_data(BMP581_ADDRESS, 0x1D, 6)
-    
-    temp = (data[2] << 16 | data[1] << 8 | data[0]) / (1 << 16)
-    pressure = (data[5] << 16 | data[4] << 8 | data[3]) / (1 << 6)
-    
-    return temp, pressure
-
-def MPU6500_init():
-    GPIO.setup(MPU6500_SDO_PIN, GPIO.OUT, initial = GPIO.LOW)
-    GPIO.setup(MPU6500_INT_PIN, GPIO.IN)
-    GPIO.setup(MPU6500_FSYNC_PIN, GPIO.OUT, initial = GPIO.LOW) #if unuse, to GND
-    GPIO.setup(MPU6500_nCS_PIN, GPIO.OUT, initial = GPIO.HIGH)
-    time.sleep(0.1)
-    GPIO.output(MPU6500_SDO_PIN, GPIO.LOW)
-    GPIO.setup(MPU6500_nCS_PIN, GPIO.HIGH)
-    GPIO.output(MPU6500_FSYNC_PIN, GPIO.LOW)
-    time.sleep(0.1)
-    
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6B, 0x80) #PWR_MGMT_1
-    time.sleep(0.2)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6B, 0x00) #PWR_MGMT_1
-    time.sleep(0.2)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6A, 0x08) #USER_CTRL DMP reset
-    time.sleep(0.2)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6A, 0x00) #USER_CTRL DMP reset
-    time.sleep(0.2)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1A, 0x00)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1B, 0x10) #1000 degrees pre second (Sensitivity Factor 32.8)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1C, 0x10) #8g (Sensitivity Factor 4096)
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1D, 0x01) #DLPF1
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1E, 0x08) #62.5Hz
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x1F, 0xC8) #Wake on Motion 200mg
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x38, 0x40) #INT Wake on Motion
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x69, 0xC0) #ACCEL_INTEL_CTRL
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6A, 0x80) #USER_CTRL DMP enable
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6B, 0x01) #PWR_MGMT_1
-    i2c.write_byte_data(MPU6500_ADDRESS, 0x6C, 0x00) #PWR_MGMT_2
-
-def MPU6500_sign(value):
-    if value > 32768:
-            value = value - 65536
-    return value
-    
-def MPU6500_getdata():
-    data_accel = i2c.read_i2c_block_data(MPU6500_ADDRESS, 0x3B, 6)
-    accel_x = MPU6500_sign(data_accel[0] << 8 | data_accel[1]) / 4096.0 #Sensitivity Factor
-    accel_y = MPU6500_sign(data_accel[2] << 8 | data_accel[3]) / 4096.0 
-    accel_z = MPU6500_sign(data_accel[4] << 8 | data_accel[5]) / 4096.0 
-#     print(data_accel)
-    data_temp = i2c.read_i2c_block_data(MPU6500_ADDRESS, 0x41, 2)
-    temp = ((data_temp[0] << 8 | data_temp[1]) - 21.0) / 333.87 + 21.0
-#     print(data_temp)
-    data_gyro = i2c.read_i2c_block_data(MPU6500_ADDRESS, 0x43, 6)
-    gyro_x = MPU6500_sign(data_gyro[0] << 8 | data_gyro[1]) / 32.8 #Sensitivity Factor
-    gyro_y = MPU6500_sign(data_gyro[2] << 8 | data_gyro[3]) / 32.8
-    gyro_z = MPU6500_sign(data_gyro[4] << 8 | data_gyro[5]) / 32.8
-#     print(data_gyro)
-    return accel_x, accel_y, accel_z, gyro_x, gyro_y, gyro_z, temp
-
-def MAX30102_init():
-    GPIO.setup(MAX30102_INT_PIN, GPIO.IN)
-    time.sleep(0.1)
-    
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x09, 0x40) #Reset
-    time.sleep(0.1)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x09, 0x03) #spO2 Mode
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x0A, 0x0F) #400Hz 411us
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x0C, 0x0F) #LED Current 3.0mA
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x0D, 0x0F) #LED Current 3.0mA
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x21, 0x00) #0x01 for one temp sample
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x02, 0x00)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x03, 0x00)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x04, 0x00)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x05, 0x00)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x06, 0x00)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x08, 0x90) #16 samples average
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x21, 0x01)
-
-def MAX30102_getdata():
-    write_ptr = i2c.read_byte_data(MAX30102_ADDRESS, 0x04)
-    read_ptr = i2c.read_byte_data(MAX30102_ADDRESS, 0x06)
-    overflow_counter = i2c.read_byte_data(MAX30102_ADDRESS, 0x05)
-    
-    if write_ptr == read_ptr:
-        print("No new data to read.")
-        return [], []
-    elif write_ptr > read_ptr:
-        num_samples = write_ptr - read_ptr
-    else:
-        num_samples = (32 - read_ptr) + write_ptr
-    
-#     print(f"Number of samples to read: {num_samples}")
-
-    red_data = []
-    ir_data = []
-    for _ in range(num_samples):
-        raw_data = i2c.read_i2c_block_data(MAX30102_ADDRESS, 0x07, 6)
-        red = (raw_data[0] << 16) | (raw_data[1] << 8) | raw_data[2]
-        ir = (raw_data[3] << 16) | (raw_data[4] << 8) | raw_data[5]
-        red_data.append(red)
-        ir_data.append(ir)
-#         print(f"RED: {red}, IR: {ir}")
-    
-    temp_int = i2c.read_byte_data(MAX30102_ADDRESS, 0x1F)
-    temp_frac = i2c.read_byte_data(MAX30102_ADDRESS, 0x20)
-    i2c.write_byte_data(MAX30102_ADDRESS, 0x21, 0x01) #for next
-    
-    temp = temp_int + (temp_frac * 0.0625)
-#     print(temp)
-    
-    return red_data, ir_data, temp
+                tasks.append(SensorTask(name, self.periods[name], read, init = init))
+        return tasks
+
+
+writers = {} #table -> SensorDBWriter
 
-def MAX30102_manage_size(data_array, max_length = 300):
-    if len(data_array) > max_length:
-        return data_array[-max_length:]
+def open_writer(table = 'SensorBoard'):
+    #one writer per board table, with its rollups, retention and archive
+    archive = functools.partial(archive_rows, ARCHIVE_DIR) if ARCHIVE_DIR else None
+    #the board's MPU6500 FIFO day files (Board.MPU6500_write_block()) are deleted with its expired rows
+    files = [os.path.join(MPU6500_FIFO_DIR, '{}MPU6500_*.bin'.format('' if table == 'SensorBoard' else table + '_'))]
+    if STORAGE == 'narrow':
+        writer = NarrowDBWriter(DB_NAME, table, compressor = COMPRESSORS[COMPRESSION] if COMPRESSION else None)
+        migrate(writer.conn, table)
+        RetentionPruner(DB_NAME, sensor_tables(table), RETENTION_DAYS, index = False, archive = archive, time_us = True,
+                files = files).start()
     else:
-        return data_array
+        compressor = COMPRESSORS[COMPRESSION](SENSORBOARD_COLUMNS) if COMPRESSION else None
+        writer = SensorDBWriter(DB_NAME, table, SENSORBOARD_COLUMNS, compressor = compressor)
+        #rows are keyed by epoch microseconds, a table from before with TEXT times is migrated once
+        migrate_time(writer.conn, table, SENSORBOARD_COLUMNS)
+        create_table(writer.conn, table, SENSORBOARD_COLUMNS, time_us = True)
+        RetentionPruner(DB_NAME, [table], RETENTION_DAYS, index = False, archive = archive, time_us = True,
+                files = files).start()
+    #per-minute and per-hour min/max/mean, updated in the same transaction as the raw rows
+    create_rollup_tables(writer.conn, table)
+    writer.flush_hooks.append(functools.partial(update_rollups, table = table))
+    atexit.register(writer.close)
+    for pruner in rollup_pruners(DB_NAME, table):
+        pruner.start()
+    return writer
 
-def MAX30102_cal(red_data, ir_data, sampling_rate):
-    #lowpass filter
-    #order = 4, cutoff = 3
-    b, a = butter(4, 3, btype = 'low', analog = False, fs = sampling_rate)
-    ir_data_filtered = filtfilt(b, a, ir_data)
-    
-    peaks, _ = find_peaks(ir_data_filtered, height = 2000, distance=sampling_rate/3)
-    valleys, _ = find_peaks(-ir_data_filtered, distance=sampling_rate/3)
-    
-    if len(peaks) > 1:
-        peak_avg = np.mean(ir_data_filtered[peaks])
-        valley_avg = np.mean(ir_data_filtered[valleys])
-        print(peak_avg - valley_avg)
-        if (peak_avg - valley_avg) > 500 and (peak_avg - valley_avg) < 2000:
-            peak_intervals = np.diff(peaks) / sampling_rate
-            heart_rate = 60.0 / np.mean(peak_intervals)
-        else:
-            heart_rate = -1.0
+def get_writer(table = 'SensorBoard'):
+    writer = writers.get(table)
+    if writer is None:
+        writer = writers[table] = open_writer(table)
+    return writer
+
+def insert_data(row, table = 'SensorBoard', row_time = None):
+    #row holds the 16 values in SENSORBOARD_COLUMNS order, row_time is epoch microseconds (default now, time_us())
+    writer = get_writer(table)
+    if row_time is None:
+        row_time = time_us()
+    if STORAGE == 'narrow':
+        writer.insert_row(row_time, row)
     else:
-        heart_rate = -1.0
-    
-    #plot
-#     plt.clf()
-#     plt.plot(ir_data_filtered)
-#     plt.plot(ir_data)
-#     plt.plot(peaks, ir_data_filtered[peaks], "*")
-#     plt.axhline(y =np.mean(ir_data_filtered), linestyle = '--', color='g')
-#     plt.draw()
-#     plt.pause(0.01)
-    
-    red_ac = np.max(red_data) - np.min(red_data)
-    ir_ac = np.max(ir_data) - np.min(ir_data)
-    red_dc = np.mean(red_data)
-    ir_dc = np.mean(ir_data)
-    
-    ratio = (red_ac / red_dc) / (ir_ac / ir_dc)
-#     spo2 = 104 - 17 * ratio
-    spo2 = - 45.060 * ratio * ratio + 30.354 * ratio + 94.845
-    
-    if spo2 < 90.0 or heart_rate == -1.0:
-        spo2 = -1.0
-        heart_rate = -1.0
-    return heart_rate, spo2
-
-def insert_data(DHT20_temperature, DHT20_humidity, AGS10_TVOC, AL, BMP581_Temperature, BMP581_Pressure,
-        MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp,
-        heart_rate, spo2, MAX30102_temp):
-    conn = sqlite3.connect('/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/SensorBoard.db')
-    cursor = conn.cursor()
-    
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute('''
-        INSERT INTO SensorBoard (time, DHT20_temperature, DHT20_humidity, AGS10_TVOC, AL, BMP581_Temperature, BMP581_Pressure,
-        MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp,
-        heart_rate, spo2, MAX30102_temp)
-        VALUES (?, ?, ?, ?, ?,
-        ?, ?, ?, ?, ?,
-        ?, ?, ?, ?, ?,
-        ?, ?)
-    ''', (current_time, DHT20_temperature, DHT20_humidity, AGS10_TVOC, AL, BMP581_Temperature, BMP581_Pressure,
-        MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp,
-        heart_rate, spo2, MAX30102_temp))
-    
-    delete_timeline = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute('''
-        DELETE FROM SensorBoard WHERE time < ?
-    ''', (delete_timeline,))
-    
-    conn.commit()
-    conn.close()
+        writer.insert((row_time,) + tuple(row))
+
+def reading_logger(table = 'SensorBoard'):
+    #PollScheduler on_read callback for the narrow layout, every reading is stamped when its read returned
+    writer = get_writer(table)
+    def log(name, values, read_time):
+        try:
+            writer.insert(name, read_time, values)
+        except (OSError, sqlite3.Error) as e:
+            print("Sqlite3 Error: ", e)
+    return log
+
+def sensor_row(latest):
+    row = []
+    for name in SENSOR_FIELDS:
+        row.extend(latest.get(name) or (None,) * SENSOR_FIELDS[name])
+    return row
 
 
 if __name__ == '__main__':
-    try:
-        BH1750FVI_init()
-    except OSError as e:
-            print("BH1750FVI Init Error: ", e)
-    except ValueError as e:
-            print(e)
-    try:
-        BMP581_init()
-    except OSError as e:
-            print("BMP581 Init Error: ", e)
-    except ValueError as e:
-            print(e)
-    try:
-        MPU6500_init()
-    except OSError as e:
-            print("MPU6500 Init Error: ", e)
-    except ValueError as e:
-            print(e)
-    try:
-        MAX30102_init()
-        red_data = np.array([])
-        ir_data = np.array([])
-    except OSError as e:
-            print("MAX30102 Init Error: ", e)
-    except ValueError as e:
-            print(e)
-#     plt.ion()
+    #systemd stops us with SIGTERM, turn it into SystemExit so atexit flushes buffered rows
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    #chips are initialized on their sensor's thread, a chip that fails init is retried with backoff
+    #instead of being left unconfigured until the next restart
+    #every sensor is polled on its own thread and period, the bus lock keeps transactions serialized
+    #several boards: see multiboard.py
+    board = Board()
+    callbacks = []
+    if STORAGE == 'narrow':
+        callbacks.append(reading_logger())
+    if PUBLISH:
+        #every reading and sample block also goes to the local subscribers, see publisher.py
+        import publisher
+        publishing = publisher.Publisher().start()
+        callbacks.append(publishing.on_read)
+        board.on_block = publishing.on_block
+
+    def on_read(name, values, read_time):
+        for callback in callbacks:
+            callback(name, values, read_time)
+
+    scheduler = PollScheduler(board.sensor_tasks(), on_read = on_read if callbacks else None)
+    scheduler.start()
+    metrics.start()
     
     while True:
-        #DHT20
-        try:
-            DHT20_temperature, DHT20_humidity = -2.0, -2.0
-            DHT20_temperature, DHT20_humidity = DHT20_getdata()
-    #         print(
-    #             "Temp: {:.2f} C    Humidity: {:.2f}% ".format(
-    #                 DHT20_temperature, DHT20_humidity
-    #             )
-    #         )
-    
-        except OSError as e:
-            print("DHT20 I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
-        
-        #AGS10
-        try:
-            AGS10_TVOC = -2.0
-            AGS10_TVOC = AGS10_getdata()
-    #         print(f"TVOC: {AGS10_TVOC:.3f} ppm")
-
-        except OSError as e:
-            print("AGS10 I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
-            
-        #BH1750FVI
-        try:
-            AL = -2.0
-            AL = BH1750FVI_getdata()
-#             print(f"AL: {AL:.1f} lux")
-            
-        except OSError as e:
-            print("BH1750FVI I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
-        
-        #BMP581
-        try:
-            BMP581_Temperature, BMP581_Pressure = -2.0, -2.0
-            BMP581_Temperature, BMP581_Pressure = BMP581_getdata()
-#             print(
-#                 "BMP581_Temperature: {:.2f} C    BMP581_Pressure: {:.2f} Pa ".format(
-#                 BMP581_Temperature, BMP581_Pressure
-#                     )
-#              )
-            
-        except OSError as e:
-            print("BMP581 I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
-        
-        #MPU6500
-        try:
-            MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z = -2.0, -2.0, -2.0
-            MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z = -2.0, -2.0, -2.0
-            MPU6500_temp = -2.0
-            MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp = MPU6500_getdata()
-            print(
-                "Accel_X: {:.2f} g  Accel_Y: {:.2f} g  Accel_Z: {:.2f} g".format(
-                MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z
-                    )
-             )
-            print(
-                "Gyro_X: {:.2f} dps  Gyro_Y: {:.2f} dps  Gyro_Z: {:.2f} dps(degrees per second)".format(
-                MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z
-                    )
-             )
-            print(f"MPU6500_Temperature: {MPU6500_temp:.1f} C")
-        except OSError as e:
-            print("MPU6500 I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
-        
-        #MAX30102
-        try:
-            heart_rate, spo2, MAX30102_temp = -2.0, -2.0, -2.0
-            new_red, new_ir, MAX30102_temp = MAX30102_getdata()
-            red_data = np.append(red_data, new_red)
-            ir_data = np.append(ir_data, new_ir)
-            
-            red_data = MAX30102_manage_size(red_data)
-            ir_data = MAX30102_manage_size(ir_data)
-            
-            sample_rate = 400 / 16 #raw sample / sample average
-            
-            heart_rate, spo2 = MAX30102_cal(red_data, ir_data, sample_rate)
-#             print(f"Heart Rate: {heart_rate:.2f} bpm, SpO2: {spo2:.2f} %")
-#             print(f"MAX30102_Temperature: {MAX30102_temp:.2f} C")
-            
-        except OSError as e:
-            print("MAX30102 I2C Communication Error: ", e)
-        except ValueError as e:
-            print(e)
+        time.sleep(DB_PERIOD)
+        if STORAGE == 'narrow':
+            continue
         
         #insert data to sqlite3
         try:
-            insert_data(DHT20_temperature, DHT20_humidity, AGS10_TVOC, AL, BMP581_Temperature, BMP581_Pressure,
-        MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp,
-        heart_rate, spo2, MAX30102_temp)
-#             print(f"AL: {AL:.1f} lux")
+            #stamped with the newest bus read in it, a row with no read since the previous one is dropped as a repeat
+            insert_data(sensor_row(scheduler.snapshot()), row_time = scheduler.newest_read_time())
             
-        except OSError as e:
+        except (OSError, sqlite3.Error) as e:
             print("Sqlite3 Error: ", e)
             
 #         if keyboard.is_pressed('q'):
 #             print("Q key pressed. Exiting...")
 #             break
-        time.sleep(0.5)
     
     #cleanup
 #     GPIO.cleanup()
 #     print("GPIO cleaned up and program exited.")
-    
\ No newline at end of file
@@ -0,0 +1,344 @@
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from sensordb import is_time_us, MISSING_VALUES, DEFAULT_MISSING, TIME_FORMAT
+from narrowdb import SENSOR_COLUMNS, sensor_table, is_narrow
+from archive import read_days
+
+#bulk analytics over the sensor database: a time range is loaded as NumPy arrays, a chunk at a time, and every
+#function works on whole arrays; a chunk is {'time': int64 epoch microseconds, column: float64}, missing values
+#(NULL, or the -2.0/-1.0 sentinels of older rows) are NaN
+CHUNK_ROWS = 20000 #rows per chunk; fetched as Python tuples, a chunk of all 16 columns peaks at about 30 MB
+MOTION_THRESHOLD = 0.15 #g away from 1 g that counts as motion
+GAP_DTYPE = np.dtype([('start', '<i8'), ('end', '<i8'), ('rows', '<i8')])
+EVENT_DTYPE = np.dtype([('start', '<i8'), ('end', '<i8'), ('peak', '<f8'), ('rows', '<i8')])
+STATS = ('mean', 'min', 'max', 'count', 'std')
+
+
+def to_us(value):
+    #datetime or epoch seconds
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    return int(value * 1000000)
+
+
+def clean(column, values):
+    #float64 copy with the sentinels of column as NaN
+    values = np.array(values, dtype = np.float64)
+    values[np.isin(values, MISSING_VALUES.get(column, DEFAULT_MISSING))] = np.nan
+    return values
+
+
+def _source(conn, table, columns):
+    #(table or view to read, its time column, NumPy type of the time); a narrow database is read from the sensor table
+    #when all columns belong to one sensor, the view repeats the slower sensors' values at every faster reading
+    if not is_narrow(conn, table):
+        return table, 'time', '<i8' if is_time_us(conn, table) else 'M8[s]'
+    for sensor, sensor_columns in SENSOR_COLUMNS.items():
+        if set(columns) <= set(sensor_columns):
+            return sensor_table(table, sensor), 'time', '<i8'
+    return table, 'rowid', '<i8'
+
+
+def local_us(local):
+    #TIME_FORMAT text parsed as datetime64 (as if it were UTC) to epoch microseconds: the UTC offset is looked up
+    #once per hour of local time, so a range across a DST change is right on both sides
+    seconds = local.astype(np.int64)
+    if not len(seconds):
+        return seconds
+    hours = seconds // 3600
+    starts = np.flatnonzero(np.diff(hours, prepend = hours[0] - 1))
+    offsets = np.array([int(time.mktime(time.gmtime(int(hour) * 3600)[:8] + (-1,))) - int(hour) * 3600
+            for hour in hours[starts]], dtype = np.int64)
+    return (seconds + np.repeat(offsets, np.diff(np.append(starts, len(hours))))) * 1000000
+
+
+def load_chunks(conn, start, end, columns, table = 'SensorBoard', chunk_rows = CHUNK_ROWS, archive_dir = None):
+    #yields chunks of the rows between start and end (datetimes) in time order, at most chunk_rows each, so ranges larger
+    #than memory can be streamed; with archive_dir the days already pruned into the archive come first
+    columns = list(columns)
+    name, time_column, time_type = _source(conn, table, columns)
+    if archive_dir is not None:
+        if time_column == 'rowid':
+            raise ValueError("Narrow archives are per sensor, load one sensor's columns at a time")
+        for day in read_days(archive_dir, name, start, end, columns):
+            for lo in range(0, len(day['time']), chunk_rows):
+                chunk = {'time': np.array(day['time'][lo:lo + chunk_rows])}
+                for column in columns:
+                    chunk[column] = clean(column, day[column][lo:lo + chunk_rows])
+                yield chunk
+    if time_type == 'M8[s]':
+        #compared as text, so the time index is used
+        bounds = (start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT))
+    else:
+        bounds = (to_us(start), to_us(end))
+    cursor = conn.execute('SELECT {0}, {1} FROM {2} WHERE {0} >= ? AND {0} < ? ORDER BY {0}'.format(time_column,
+            ', '.join(columns), name), bounds)
+    #rows go straight into a record array: text times parse as datetime64, NULL becomes NaN
+    dtype = np.dtype([('time', time_type)] + [(column, '<f8') for column in columns])
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        data = np.fromiter(rows, dtype, len(rows))
+        chunk = {'time': local_us(data['time']) if time_type == 'M8[s]' else data['time']}
+        for column in columns:
+            chunk[column] = clean(column, data[column])
+        yield chunk
+
+
+def concat(chunks, columns):
+    chunks = list(chunks)
+    if not chunks:
+        return dict({'time': np.empty(0, dtype = np.int64)}, **{column: np.empty(0) for column in columns})
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+
+def load_range(conn, start, end, columns, table = 'SensorBoard', archive_dir = None):
+    #the whole range as one chunk
+    return concat(load_chunks(conn, start, end, columns, table, archive_dir = archive_dir), columns)
+
+
+def _window_starts(times, window):
+    #index of the first row within window seconds before each row (the window is (t - window, t])
+    return np.searchsorted(times, times - int(window * 1000000), side = 'right')
+
+
+def _range_reduce(values, lo, hi, reduce):
+    #reduce over values[lo[i]:hi[i]] for every i at once: a sparse table of reduce over runs of 2**k rows,
+    #every range is covered by two overlapping runs; only as many levels as the longest range needs
+    length = hi - lo
+    longest = int(length.max()) if len(length) else 0
+    levels = [values]
+    while (1 << len(levels)) <= longest:
+        previous, half = levels[-1], 1 << (len(levels) - 1)
+        levels.append(reduce(previous[:-half], previous[half:]))
+    out = np.full(len(lo), np.nan)
+    nonempty = length > 0
+    k = np.zeros(len(lo), dtype = np.int64)
+    k[nonempty] = np.floor(np.log2(length[nonempty])).astype(np.int64)
+    for level in range(len(levels)):
+        select = nonempty & (k == level)
+        if select.any():
+            table = levels[level]
+            out[select] = reduce(table[lo[select]], table[hi[select] - (1 << level)])
+    return out
+
+
+def rolling(times, values, window, stat = 'mean'):
+    #stat of the valid values within the last window seconds of every row, NaN where there are none
+    if stat not in STATS:
+        raise ValueError("Unknown statistic: {}".format(stat))
+    times = np.asarray(times)
+    values = np.asarray(values, dtype = np.float64)
+    lo = _window_starts(times, window)
+    hi = np.arange(1, len(times) + 1)
+    if stat == 'min':
+        return _range_reduce(values, lo, hi, np.fmin)
+    if stat == 'max':
+        return _range_reduce(values, lo, hi, np.fmax)
+    valid = ~np.isnan(values)
+    count = np.concatenate(([0], np.cumsum(valid)))
+    n = (count[hi] - count[lo]).astype(np.float64)
+    if stat == 'count':
+        return n
+    #sums relative to the first value, so the squares of e.g. pressure do not swamp its variance
+    reference = values[valid][0] if valid.any() else 0.0
+    shifted = np.where(valid, values - reference, 0.0)
+    total = np.concatenate(([0.0], np.cumsum(shifted)))
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = (total[hi] - total[lo]) / n
+        if stat == 'mean':
+            return mean + reference
+        squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+        return np.sqrt(np.maximum((squares[hi] - squares[lo]) / n - mean * mean, 0.0))
+
+
+def rolling_chunks(chunks, column, window, stat = 'mean'):
+    #rolling() over streamed chunks: the rows of the last window seconds are carried into the next chunk;
+    #yields (times, stat) per chunk
+    carry_times = np.empty(0, dtype = np.int64)
+    carry_values = np.empty(0)
+    for chunk in chunks:
+        times = np.concatenate((carry_times, chunk['time']))
+        values = np.concatenate((carry_values, chunk[column]))
+        out = rolling(times, values, window, stat)[len(carry_times):]
+        keep = np.searchsorted(times, times[-1] - int(window * 1000000), side = 'right') if len(times) else 0
+        carry_times, carry_values = times[keep:], values[keep:]
+        yield chunk['time'], out
+
+
+def _partials(times, values, edges):
+    #per bucket [edges[i], edges[i + 1]) of the valid values: count, sum, sum of squares, min, max
+    valid = ~np.isnan(values)
+    times, values = times[valid], values[valid]
+    index = np.searchsorted(times, edges)
+    lo, hi = index[:-1], index[1:]
+    count = hi - lo
+    total = np.concatenate(([0.0], np.cumsum(values)))
+    squares = np.concatenate(([0.0], np.cumsum(values * values)))
+    low = np.full(len(lo), np.nan)
+    high = np.full(len(lo), np.nan)
+    nonempty = count > 0
+    if len(values):
+        #reduceat takes the element at an empty bucket's start, those are dropped again
+        starts = np.minimum(lo, len(values) - 1)
+        low[nonempty] = np.minimum.reduceat(values, starts)[nonempty]
+        high[nonempty] = np.maximum.reduceat(values, starts)[nonempty]
+    return [count, total[hi] - total[lo], squares[hi] - squares[lo], low, high]
+
+
+def _combine(a, b):
+    return [a[0] + b[0], a[1] + b[1], a[2] + b[2], np.fmin(a[3], b[3]), np.fmax(a[4], b[4])]
+
+
+def _finish(partials, stat, reference = 0.0):
+    count, total, squares, low, high = partials
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        n = np.where(count > 0, count, np.nan)
+        if stat == 'count':
+            return count.astype(np.float64)
+        if stat == 'min':
+            return low + reference
+        if stat == 'max':
+            return high + reference
+        mean = total / n
+        if stat == 'mean':
+            return mean + reference
+        return np.sqrt(np.maximum(squares / n - mean * mean, 0.0))
+
+
+def aggregate(times, values, edges, stat = 'mean'):
+    #stat of the valid values per bucket [edges[i], edges[i + 1]), edges in epoch microseconds; NaN for empty buckets
+    if stat not in STATS:
+        raise ValueError("Unknown statistic: {}".format(stat))
+    values = np.asarray(values, dtype = np.float64)
+    valid = values[~np.isnan(values)]
+    reference = valid[0] if len(valid) else 0.0
+    return _finish(_partials(np.asarray(times), values - reference, np.asarray(edges)), stat, reference)
+
+
+def aggregate_chunks(chunks, columns, edges, stats = ('mean',)):
+    #aggregate() over streamed chunks, per bucket sums and extremes are merged chunk by chunk;
+    #returns {(column, stat): values}
+    for stat in stats:
+        if stat not in STATS:
+            raise ValueError("Unknown statistic: {}".format(stat))
+    edges = np.asarray(edges)
+    partials = {}
+    references = {}
+    for chunk in chunks:
+        for column in columns:
+            values = chunk[column]
+            if column not in references:
+                valid = values[~np.isnan(values)]
+                if not len(valid):
+                    continue
+                references[column] = valid[0]
+            part = _partials(chunk['time'], values - references[column], edges)
+            partials[column] = _combine(partials[column], part) if column in partials else part
+    empty = _partials(np.empty(0, dtype = np.int64), np.empty(0), edges)
+    return {(column, stat): _finish(partials.get(column, empty), stat, references.get(column, 0.0))
+            for column in columns for stat in stats}
+
+
+def _step_edges(start_us, end_us, step):
+    step_us = int(step * 1000000)
+    first = start_us - start_us % step_us
+    return np.arange(first, end_us + step_us, step_us, dtype = np.int64)
+
+
+def step_edges(start, end, step):
+    #bucket edges every step seconds covering start to end (datetimes), aligned to multiples of step
+    return _step_edges(to_us(start), to_us(end), step)
+
+
+def day_edges(start, end):
+    #local midnights from the day of start to the one after end, so days with a DST change have their real length
+    day = datetime.combine(start.date(), datetime.min.time())
+    edges = []
+    while day <= end:
+        edges.append(to_us(day))
+        day = datetime.combine((day + timedelta(days = 1)).date(), datetime.min.time())
+    edges.append(to_us(day))
+    return np.array(edges, dtype = np.int64)
+
+
+def resample(times, values, step, stat = 'mean'):
+    #values at fixed step seconds: (bucket start times, stat per bucket), empty buckets are NaN
+    times = np.asarray(times)
+    if not len(times):
+        return np.empty(0, dtype = np.int64), np.empty(0)
+    edges = _step_edges(int(times[0]), int(times[-1]), step)
+    return edges[:-1], aggregate(times, values, edges, stat)
+
+
+def find_gaps(times, values, max_interval = 1.0):
+    #stretches without a valid value: runs of missing rows (NULL or sentinel), and valid rows more than max_interval
+    #seconds apart (nothing was logged); returns GAP_DTYPE records, start is the last valid row before the gap
+    #(or the first row), end the first valid one after it (or the last row), rows the missing rows in between
+    times = np.asarray(times)
+    values = np.asarray(values, dtype = np.float64)
+    if not len(times):
+        return np.empty(0, dtype = GAP_DTYPE)
+    valid = np.flatnonzero(~np.isnan(values))
+    if not len(valid):
+        return np.array([(times[0], times[-1], len(times))], dtype = GAP_DTYPE)
+    #the first and last rows bound leading and trailing runs of missing rows
+    bounds = valid
+    if valid[0] > 0:
+        bounds = np.concatenate(([0], bounds))
+    if valid[-1] < len(times) - 1:
+        bounds = np.concatenate((bounds, [len(times) - 1]))
+    if len(bounds) < 2:
+        return np.empty(0, dtype = GAP_DTYPE)
+    missing = np.diff(bounds) - 1
+    missing[0] += valid[0] > 0
+    missing[-1] += valid[-1] < len(times) - 1
+    start, end = times[bounds[:-1]], times[bounds[1:]]
+    select = (missing > 0) | (end - start > int(max_interval * 1000000))
+    gaps = np.empty(int(select.sum()), dtype = GAP_DTYPE)
+    gaps['start'], gaps['end'], gaps['rows'] = start[select], end[select], missing[select]
+    return gaps
+
+
+def threshold_events(times, values, above = None, below = None, min_seconds = 0.0, merge_seconds = 0.0):
+    #stretches of consecutive rows above `above` (or below `below`); events less than merge_seconds apart are joined,
+    #then those shorter than min_seconds dropped; returns EVENT_DTYPE records, peak is the max (min for below)
+    if (above is None) == (below is None):
+        raise ValueError("Give one of above or below")
+    times = np.asarray(times)
+    values = np.asarray(values, dtype = np.float64)
+    with np.errstate(invalid = 'ignore'):
+        inside = values > above if above is not None else values < below
+    edges = np.diff(np.concatenate(([0], inside.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1) - 1 #last row inside
+    if len(starts) and merge_seconds:
+        separate = times[starts[1:]] - times[ends[:-1]] >= int(merge_seconds * 1000000)
+        starts = starts[np.concatenate(([True], separate))]
+        ends = ends[np.concatenate((separate, [True]))]
+    keep = times[ends] - times[starts] >= int(min_seconds * 1000000)
+    starts, ends = starts[keep], ends[keep]
+    events = np.empty(len(starts), dtype = EVENT_DTYPE)
+    events['start'], events['end'] = times[starts], times[ends]
+    events['rows'] = ends - starts + 1
+    if len(starts):
+        #merged events may include rows outside the threshold, the peak is still over the whole stretch;
+        #reduceat over [start, end + 1) and [end + 1, next start) pairs, the trailing NaN keeps end + 1 in range
+        reduce = np.fmax if above is not None else np.fmin
+        bounds = np.column_stack((starts, ends + 1)).ravel()
+        events['peak'] = reduce.reduceat(np.append(values, np.nan), bounds)[::2]
+    return events
+
+
+def magnitude(*components):
+    return np.sqrt(sum(np.square(component) for component in components))
+
+
+def motion_events(chunk, threshold = MOTION_THRESHOLD, min_seconds = 0.0, merge_seconds = 2.0):
+    #MPU6500 accel stretches more than threshold g away from rest (1 g), from a chunk with the three accel columns
+    deviation = np.abs(magnitude(chunk['MPU6500_accel_x'], chunk['MPU6500_accel_y'], chunk['MPU6500_accel_z']) - 1.0)
+    return threshold_events(chunk['time'], deviation, above = threshold, min_seconds = min_seconds,
+            merge_seconds = merge_seconds)
@@ -0,0 +1,111 @@
+import os
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from sensordb import TIME_FORMAT
+
+#layout: <directory>/<table>/<YYYY-MM-DD>/time.i8 plus one <column>.f4 (or .f8) file per column,
+#all append-only and row-aligned; time is int64 epoch microseconds, missing values are NaN
+TIME_DTYPE = np.dtype('<i8')
+VALUE_DTYPES = {'f4': np.dtype('<f4'), 'f8': np.dtype('<f8')}
+
+
+def day_dir(directory, table, day):
+    return os.path.join(directory, table, day)
+
+
+def to_epoch_us(value):
+    #TIME_FORMAT text, or epoch microseconds already (narrowdb.py)
+    if isinstance(value, int):
+        return value
+    return int(time.mktime(time.strptime(value, TIME_FORMAT))) * 1000000
+
+
+def row_day(value):
+    if isinstance(value, int):
+        return datetime.fromtimestamp(value / 1000000).strftime('%Y-%m-%d')
+    return value[:10]
+
+
+def _append(path, data, length):
+    #appends data after the first length rows of the file: rows beyond them (an append a crash or a failed DELETE left
+    #behind, or a torn partial row) are cut off, a file that is short (a column archived later) is padded with NaN first
+    with open(path, 'ab') as f:
+        size = min(length, f.tell() // data.dtype.itemsize)
+        if f.tell() != size * data.dtype.itemsize:
+            f.truncate(size * data.dtype.itemsize)
+        if size < length:
+            np.full(length - size, np.nan, dtype = data.dtype).tofile(f)
+        data.tofile(f)
+
+
+def archive_rows(directory, table, columns, rows, value_type = 'f4'):
+    #appends rows (time first, in time order) to the day files; used as the RetentionPruner archive hook
+    #safe to repeat: a batch archived before its rows were deleted is archived again by the next prune, rows not newer
+    #than the day's last archived time are skipped
+    days = {}
+    for row in rows:
+        days.setdefault(row_day(row[0]), []).append(row)
+    for day, day_rows in days.items():
+        path = day_dir(directory, table, day)
+        os.makedirs(path, exist_ok = True)
+        time_path = os.path.join(path, 'time.i8')
+        times = np.array([to_epoch_us(row[0]) for row in day_rows], dtype = TIME_DTYPE)
+        length = os.path.getsize(time_path) // TIME_DTYPE.itemsize if os.path.exists(time_path) else 0
+        if length:
+            last = np.fromfile(time_path, dtype = TIME_DTYPE, count = 1, offset = (length - 1) * TIME_DTYPE.itemsize)[0]
+            keep = times > last
+            if not keep.any():
+                continue
+            times = times[keep]
+            day_rows = [row for row, kept in zip(day_rows, keep) if kept]
+        values = np.array([row[1:] for row in day_rows], dtype = np.float64) #None -> NaN
+        #value files first: a crash leaves time.i8 shortest, and readers and the next append trust its length
+        for i, column in enumerate(columns[1:]):
+            _append(os.path.join(path, '{}.{}'.format(column, value_type)),
+                    values[:, i].astype(VALUE_DTYPES[value_type]), length)
+        _append(time_path, times, length)
+
+
+def _map(path, dtype, length):
+    if length == 0:
+        return np.empty(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = 'r', shape = (length,))
+
+
+def read_days(directory, table, start, end, columns):
+    #yields {'time': ..., column: ...} per archived day between start and end (datetimes),
+    #every array is a slice of a read-only memmap, nothing is copied
+    day = start.date()
+    while day <= end.date():
+        path = day_dir(directory, table, day.strftime('%Y-%m-%d'))
+        time_path = os.path.join(path, 'time.i8')
+        if os.path.exists(time_path):
+            length = os.path.getsize(time_path) // TIME_DTYPE.itemsize
+            times = _map(time_path, TIME_DTYPE, length)
+            lo = np.searchsorted(times, int(start.timestamp() * 1000000))
+            hi = np.searchsorted(times, int(end.timestamp() * 1000000))
+            if hi > lo:
+                chunk = {'time': times[lo:hi]}
+                for column in columns:
+                    for value_type, dtype in VALUE_DTYPES.items():
+                        column_path = os.path.join(path, '{}.{}'.format(column, value_type))
+                        if os.path.exists(column_path):
+                            chunk[column] = _map(column_path, dtype, length)[lo:hi]
+                            break
+                    else:
+                        raise ValueError("{} is not archived for {}".format(column, day))
+                yield chunk
+        day += timedelta(days = 1)
+
+
+def read_range(directory, table, start, end, columns):
+    #one array per column; zero-copy when the range lies within one day, concatenated otherwise
+    chunks = list(read_days(directory, table, start, end, columns))
+    if len(chunks) == 1:
+        return chunks[0]
+    keys = ['time'] + list(columns)
+    if not chunks:
+        return {key: np.empty(0, dtype = TIME_DTYPE if key == 'time' else np.float32) for key in keys}
+    return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in keys}
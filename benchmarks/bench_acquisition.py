@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# full acquisition loop (scheduler + PPG + sqlite writer) against the simulated board
+# usage: python3 -m benchmarks.bench_acquisition [--seconds 10] [--fast] [--error-rate 0.0]
+# --fast drops bus latency and polls every sensor back to back, measuring the CPU-bound ceiling
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+os.environ['SENSORBOARD_BUS'] = 'sim'
+
+import SensorBoard
+from scheduler import PollScheduler
+from sensordb import create_table, SENSORBOARD_COLUMNS
+
+
+def run(seconds, fast, error_rate):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    conn = sqlite3.connect(path)
+    create_table(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    SensorBoard.DB_NAME = path
+
+    #chips are initialized by their tasks when the scheduler starts
+    board = SensorBoard.Board()
+    bus = board.i2c.bus
+    bus.error_rate = error_rate
+    db_period = SensorBoard.DB_PERIOD
+    if fast:
+        bus.latency = 0
+        for name in board.periods:
+            board.periods[name] = 0.0
+        db_period = 0.0
+
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        scheduler = PollScheduler(board.sensor_tasks())
+        start_transactions = bus.transactions
+        scheduler.start()
+        start = time.monotonic()
+        rows = 0
+        while time.monotonic() - start < seconds:
+            time.sleep(db_period)
+            SensorBoard.insert_data(SensorBoard.sensor_row(scheduler.snapshot()))
+            rows += 1
+        rates = scheduler.rates()
+        scheduler.stop()
+        SensorBoard.writers['SensorBoard'].flush()
+    elapsed = time.monotonic() - start
+
+    stored = conn.execute('SELECT count(*) FROM SensorBoard').fetchone()[0]
+    conn.close()
+    return {
+        'rows/s': rows / elapsed,
+        'stored rows': stored,
+        'bus transactions/s': (bus.transactions - start_transactions) / elapsed,
+        'rates': rates,
+        'failures': {task.name: task.failures for task in scheduler.tasks},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 10.0)
+    parser.add_argument('--fast', action = 'store_true')
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    args = parser.parse_args()
+
+    result = run(args.seconds, args.fast, args.error_rate)
+    print('rows/s:             {:.1f}'.format(result['rows/s']))
+    print('stored rows:        {}'.format(result['stored rows']))
+    print('bus transactions/s: {:.0f}'.format(result['bus transactions/s']))
+    print('{:<10} {:>10} {:>10}'.format('sensor', 'reads/s', 'failures'))
+    for name, rate in result['rates'].items():
+        print('{:<10} {:>10.1f} {:>10}'.format(name, rate, result['failures'][name]))
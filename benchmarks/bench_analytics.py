@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+# analytics.py vs row-by-row SQL + Python on a synthetic week of 2 Hz SensorBoard rows
+# usage: python3 -m benchmarks.bench_analytics [--days 7] [--rate 2]
+# each task runs from the database both ways, the row-by-row version iterates the cursor as scripts do today;
+# results are checked against each other; peak is the traced Python/NumPy memory of a separate vectorized run
+# the data has logger outages (no rows), NULL and -2.0 light readings, -1.0 heart rate stretches and motion bursts
+
+import argparse
+import collections
+import math
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from analytics import (load_chunks, load_range, rolling_chunks, aggregate_chunks, day_edges, step_edges, find_gaps,
+        motion_events, MOTION_THRESHOLD)
+from sensordb import create_table, create_time_index, is_missing, SENSORBOARD_COLUMNS, TIME_FORMAT
+
+EPOCH = "CAST(strftime('%s', time, 'utc') AS INTEGER)"
+WINDOW = 60.0 #seconds, rolling mean
+RESAMPLE = 300.0 #seconds
+MAX_INTERVAL = 2.0 #seconds without a row that count as a gap
+MERGE = 2.0 #seconds between motion events that are joined
+
+
+def fill(path, days, rate):
+    rng = np.random.default_rng(0)
+    start = int(time.time() - days * 86400)
+    t = start + np.arange(int(days * 86400 * rate)) / rate
+    #a few outages of 10 minutes without any rows
+    for outage in rng.uniform(t[0], t[-1], 5):
+        t = t[(t < outage) | (t >= outage + 600)]
+    n = len(t)
+    day = 2 * np.pi * (t % 86400) / 86400
+    columns = {c: np.zeros(n) for c in SENSORBOARD_COLUMNS[1:]}
+    columns['DHT20_temperature'] = 22 + 3 * np.sin(day) + rng.normal(0, 0.1, n)
+    columns['DHT20_humidity'] = 45 - 10 * np.sin(day) + rng.normal(0, 0.5, n)
+    columns['AGS10_TVOC'] = 0.1 + rng.gamma(2, 0.02, n)
+    columns['AL'] = np.maximum(0, 400 * np.sin(day)) + rng.normal(0, 2, n)
+    columns['BMP581_Temperature'] = columns['DHT20_temperature'] + 1
+    columns['BMP581_Pressure'] = 101325 + 300 * np.sin(day / 3) + rng.normal(0, 5, n)
+    columns['MPU6500_accel_z'] = 1 + rng.normal(0, 0.01, n)
+    columns['MPU6500_accel_x'] = rng.normal(0, 0.01, n)
+    columns['MPU6500_accel_y'] = rng.normal(0, 0.01, n)
+    for burst in rng.integers(0, n - 40, int(days * 50)):
+        columns['MPU6500_accel_x'][burst:burst + rng.integers(2, 40)] += rng.normal(0, 0.5)
+    columns['MPU6500_temp'] = 30 + rng.normal(0, 0.2, n)
+    columns['heart_rate'] = 70 + rng.normal(0, 3, n)
+    columns['spo2'] = 97 + rng.normal(0, 0.5, n)
+    columns['MAX30102_temp'] = 31 + rng.normal(0, 0.2, n)
+    #no finger: -1.0 for a few minutes at a time
+    for stretch in rng.integers(0, n - 600, int(days * 30)):
+        columns['heart_rate'][stretch:stretch + rng.integers(10, 600)] = -1.0
+    al = columns['AL'].astype(object)
+    al[rng.random(n) < 0.002] = None
+    al[rng.random(n) < 0.002] = -2.0
+    columns['AL'] = al
+
+    conn = sqlite3.connect(path)
+    create_table(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    times = [time.strftime(TIME_FORMAT, time.localtime(s)) for s in t]
+    values = [columns[c].tolist() for c in SENSORBOARD_COLUMNS[1:]]
+    with conn:
+        conn.executemany('INSERT INTO SensorBoard VALUES ({})'.format(', '.join('?' * len(SENSORBOARD_COLUMNS))),
+                zip(times, *values))
+    create_time_index(conn, 'SensorBoard')
+    conn.close()
+    return n
+
+
+def rows(conn, start, end, columns, text = False):
+    #the row-by-row access of today's scripts
+    return conn.execute('SELECT {}, {} FROM SensorBoard WHERE time >= ? AND time < ? ORDER BY time'.format(
+            'time' if text else EPOCH, ', '.join(columns)), (start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)))
+
+
+def rows_load(conn, start, end):
+    out = collections.defaultdict(list)
+    for row in rows(conn, start, end, SENSORBOARD_COLUMNS[1:]):
+        out['time'].append(row[0])
+        for column, value in zip(SENSORBOARD_COLUMNS[1:], row[1:]):
+            out[column].append(None if is_missing(column, value) else value)
+    return len(out['time'])
+
+
+def rows_rolling(conn, start, end, column):
+    window = collections.deque()
+    total = 0.0
+    count = 0
+    out = []
+    for t, value in rows(conn, start, end, [column]):
+        if not is_missing(column, value):
+            window.append((t, value))
+            total += value
+            count += 1
+        #time has one second resolution, the window is (t - WINDOW, t]
+        while window and window[0][0] <= t - WINDOW:
+            total -= window.popleft()[1]
+            count -= 1
+        out.append(total / count if count else float('nan'))
+    return np.array(out)
+
+
+def rows_daily(conn, start, end, columns):
+    days = {}
+    for row in rows(conn, start, end, columns, text = True):
+        day = days.setdefault(row[0][:10], [[math.inf, -math.inf] for _ in columns])
+        for extremes, column, value in zip(day, columns, row[1:]):
+            if not is_missing(column, value):
+                extremes[0] = min(extremes[0], value)
+                extremes[1] = max(extremes[1], value)
+    return days
+
+
+def rows_resample(conn, start, end, column):
+    buckets = {}
+    for t, value in rows(conn, start, end, [column]):
+        if not is_missing(column, value):
+            bucket = buckets.setdefault(t - t % int(RESAMPLE), [0.0, 0])
+            bucket[0] += value
+            bucket[1] += 1
+    return {t: total / count for t, (total, count) in buckets.items()}
+
+
+def rows_gaps(conn, start, end, column):
+    gaps = []
+    last = None #time of the last valid row
+    first = None
+    missing = 0
+    t = None
+    for t, value in rows(conn, start, end, [column]):
+        if first is None:
+            first = t
+        if is_missing(column, value):
+            missing += 1
+            continue
+        begin = first if last is None else last
+        if missing or (last is not None and t - last > MAX_INTERVAL):
+            gaps.append((begin, t, missing))
+        last = t
+        missing = 0
+    if missing:
+        gaps.append((first if last is None else last, t, missing))
+    return gaps
+
+
+def rows_motion(conn, start, end):
+    events = [] #[start, end]
+    inside_before = False
+    for t, x, y, z in rows(conn, start, end, ['MPU6500_accel_x', 'MPU6500_accel_y', 'MPU6500_accel_z']):
+        inside = abs(math.sqrt(x * x + y * y + z * z) - 1.0) > MOTION_THRESHOLD
+        if inside:
+            if events and (inside_before or t - events[-1][1] < MERGE):
+                events[-1][1] = t
+            else:
+                events.append([t, t])
+        inside_before = inside
+    return len(events)
+
+
+def vector_load(conn, start, end):
+    return sum(len(chunk['time']) for chunk in load_chunks(conn, start, end, SENSORBOARD_COLUMNS[1:]))
+
+
+def vector_rolling(conn, start, end, column):
+    return np.concatenate([out for _, out in rolling_chunks(load_chunks(conn, start, end, [column]), column, WINDOW)])
+
+
+def vector_daily(conn, start, end, columns):
+    return aggregate_chunks(load_chunks(conn, start, end, columns), columns, day_edges(start, end), ('min', 'max'))
+
+
+def vector_resample(conn, start, end, column):
+    edges = step_edges(start, end, RESAMPLE)
+    return edges, aggregate_chunks(load_chunks(conn, start, end, [column]), [column], edges)[(column, 'mean')]
+
+
+def vector_gaps(conn, start, end, column):
+    #gaps over the whole range, the arrays of one column are small even for a week
+    data = load_range(conn, start, end, [column])
+    return find_gaps(data['time'], data[column], MAX_INTERVAL)
+
+
+def vector_motion(conn, start, end):
+    columns = ['MPU6500_accel_x', 'MPU6500_accel_y', 'MPU6500_accel_z']
+    return len(motion_events(load_range(conn, start, end, columns), merge_seconds = MERGE))
+
+
+def timed(function, *args):
+    t0 = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - t0, result
+
+
+def peak(function, *args):
+    #a separate run, tracing every allocation slows the row-by-row code several times
+    tracemalloc.start()
+    function(*args)
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return traced
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type = float, default = 7)
+    parser.add_argument('--rate', type = float, default = 2.0, help = 'rows per second')
+    args = parser.parse_args()
+    path = os.path.join(tempfile.mkdtemp(), 'week.db')
+    n = fill(path, args.days, args.rate)
+    conn = sqlite3.connect(path)
+    end = datetime.now() + timedelta(seconds = 1)
+    start = end - timedelta(days = args.days + 1)
+    print('{} rows over {:g} days'.format(n, args.days))
+
+    tasks = [
+        ('load all columns', rows_load, vector_load, (), lambda a, b: a == b),
+        ('rolling 60 s mean', rows_rolling, vector_rolling, ('DHT20_temperature',),
+                lambda a, b: np.allclose(a, b, equal_nan = True)),
+        ('daily min/max', rows_daily, vector_daily, (['DHT20_temperature', 'BMP581_Pressure', 'AL'],),
+                lambda a, b: all(np.allclose(sorted(d[i][j] for d in a.values()),
+                        sorted(b[(c, stat)][~np.isnan(b[(c, stat)])]))
+                        for i, c in enumerate(['DHT20_temperature', 'BMP581_Pressure', 'AL'])
+                        for j, stat in enumerate(('min', 'max')))),
+        ('5 min means', rows_resample, vector_resample, ('BMP581_Pressure',),
+                lambda a, b: np.allclose([a[t] for t in sorted(a)], b[1][~np.isnan(b[1])])),
+        ('gaps heart_rate', rows_gaps, vector_gaps, ('heart_rate',),
+                lambda a, b: len(a) == len(b) and all(g[0] * 1000000 == s and g[1] * 1000000 == e and g[2] == r
+                        for g, (s, e, r) in zip(a, b.tolist()))),
+        ('gaps AL', rows_gaps, vector_gaps, ('AL',),
+                lambda a, b: len(a) == len(b) and all(g[2] == r for g, (_, _, r) in zip(a, b.tolist()))),
+        ('motion events', rows_motion, vector_motion, (), lambda a, b: a == b),
+    ]
+    print('{:<20} {:>11} {:>11} {:>9} {:>11} {:>9} {:>8}'.format('task', 'row s', 'vector s', 'speedup', 'rows/s',
+            'peak MB', 'same'))
+    for name, by_row, vectorized, extra, same in tasks:
+        row_time, row_result = timed(by_row, conn, start, end, *extra)
+        vector_time, vector_result = timed(vectorized, conn, start, end, *extra)
+        print('{:<20} {:>11.2f} {:>11.2f} {:>8.1f}x {:>11.0f} {:>9.1f} {:>8}'.format(name, row_time, vector_time,
+                row_time / vector_time, n / vector_time, peak(vectorized, conn, start, end, *extra) / 1e6,
+                bool(same(row_result, vector_result))))
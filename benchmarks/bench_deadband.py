@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+# rows kept and reconstruction error of deadband / swinging door compression on replayed data
+# usage: python3 -m benchmarks.bench_deadband [--hours 24] [--db SensorBoard.db --table SensorBoard]
+# without --db the simulated board is replayed at DB_PERIOD and a DHT22 every 2 s, with the same slow drift and noise as simboard;
+# timestamps have one second resolution, so a reader of the uncompressed table sees the last row of each second:
+# the error is the difference between that row and the stored series read back at its time
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from deadband import COMPRESSORS, RECONSTRUCTION, TOLERANCES, query_series, reconstruct, row_seconds
+from sensordb import SensorDBWriter, create_table, SENSORBOARD_COLUMNS, DHT22_COLUMNS, TIME_FORMAT
+from simboard import Environment
+
+DB_PERIOD = 0.5
+DHT22_PERIOD = 2.0
+FAILED_READS = 0.002 #share of sensor reads that come back as None
+
+
+def simulated_rows(hours, period, seed = 0):
+    #SensorBoard rows, DHT22 rows are their first two values
+    env = Environment(seed)
+    rng = random.Random(seed)
+    t = 0.0
+    env.now = lambda: t
+    start = datetime.now().replace(microsecond = 0) - timedelta(hours = hours)
+    rows = []
+    for i in range(int(hours * 3600 / period)):
+        t = i * period
+        accel, gyro = env.motion()
+        temperature = env.temperature()
+        values = [temperature - 0.3, env.humidity(), env.tvoc(), env.lux(), temperature, env.pressure(),
+                *accel, *gyro, temperature + 2.0 + rng.gauss(0, 0.05),
+                72.0 + 3.0 * math.sin(t / 120) + rng.gauss(0, 0.7), 97.5 + rng.gauss(0, 0.3), temperature + 7.0 + rng.gauss(0, 0.03)]
+        values = [None if rng.random() < FAILED_READS else round(v, 4) for v in values]
+        rows.append(((start + timedelta(seconds = t)).strftime(TIME_FORMAT),) + tuple(values))
+    return rows
+
+
+def recorded_rows(path, table, columns):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT {} FROM {} ORDER BY time'.format(', '.join(columns), table)).fetchall()
+    conn.close()
+    return rows
+
+
+def replay(rows, table, columns, mode, path):
+    #rows through a SensorDBWriter with the compressor, like SensorBoard.insert_data()
+    compressor = COMPRESSORS[mode](columns) if mode else None
+    writer = SensorDBWriter(path, table, columns, compressor = compressor)
+    create_table(writer.conn, table, columns)
+    t0 = time.perf_counter()
+    for row in rows:
+        writer.insert(row)
+    writer.close()
+    elapsed = time.perf_counter() - t0
+    conn = sqlite3.connect(path)
+    stored = conn.execute('SELECT * FROM {} ORDER BY time, rowid'.format(table)).fetchall()
+    conn.close()
+    return stored, elapsed
+
+
+def errors(rows, stored, columns, method):
+    #max |original - reconstructed| per column, and how many present values came back missing
+    last = [row for row, after in zip(rows, rows[1:] + [(None,)]) if row[0] != after[0]]
+    times = [row_seconds(row[0]) for row in last]
+    stored_times = [row_seconds(row[0]) for row in stored]
+    result = {}
+    for i, column in enumerate(columns[1:], 1):
+        original = np.array([np.nan if row[i] is None else row[i] for row in last])
+        rebuilt = reconstruct(stored_times, [row[i] for row in stored], times, method)
+        diff = np.abs(original - rebuilt)[~np.isnan(original)]
+        result[column] = (np.nanmax(diff) if np.any(~np.isnan(diff)) else 0.0, int(np.isnan(diff).sum()))
+    return result
+
+
+def report(rows, table, columns, directory):
+    print('{}: {} rows replayed'.format(table, len(rows)))
+    results = {}
+    for mode in (None, 'deadband', 'swinging_door'):
+        path = os.path.join(directory, '{}_{}.db'.format(table, mode))
+        stored, elapsed = replay(rows, table, columns, mode, path)
+        results[mode] = stored
+        print('{:<14} {:>9} rows {:>7.1f}x {:>9.2f} MB {:>7.2f} us/row'.format(str(mode), len(stored), len(rows) / len(stored),
+                os.path.getsize(path) / 1e6, elapsed / len(rows) * 1e6))
+    print('{:<20} {:>10} {:>15} {:>6} {:>15} {:>6}'.format('max error', 'tolerance', 'deadband (step)', 'gaps',
+            'swinging (lin)', 'gaps'))
+    step = errors(rows, results['deadband'], columns, RECONSTRUCTION['deadband'])
+    linear = errors(rows, results['swinging_door'], columns, RECONSTRUCTION['swinging_door'])
+    for column in columns[1:]:
+        print('{:<20} {:>10g} {:>15.4f} {:>6} {:>15.4f} {:>6}'.format(column, TOLERANCES.get(column, 0.0),
+                *step[column], *linear[column]))
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type = float, default = 24.0)
+    parser.add_argument('--db', help = 'replay the rows of an existing database instead of the simulated board')
+    parser.add_argument('--table', default = 'SensorBoard')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+
+    if args.db:
+        columns = DHT22_COLUMNS if args.table == 'dht22' else SENSORBOARD_COLUMNS
+        report(recorded_rows(args.db, args.table, columns), args.table, columns, directory)
+    else:
+        report(simulated_rows(args.hours, DB_PERIOD), 'SensorBoard', SENSORBOARD_COLUMNS, directory)
+        report([row[:3] for row in simulated_rows(args.hours, DHT22_PERIOD, seed = 1)], 'dht22', DHT22_COLUMNS, directory)
+
+        #what a reader sees: a regular half-second series rebuilt from the last hour of stored rows
+        conn = sqlite3.connect(os.path.join(directory, 'SensorBoard_swinging_door.db'))
+        end = datetime.now().replace(microsecond = 0)
+        start = (end - timedelta(hours = 1)).strftime(TIME_FORMAT)
+        t0 = time.perf_counter()
+        at, series = query_series(conn, 'SensorBoard', SENSORBOARD_COLUMNS[1:], start, end.strftime(TIME_FORMAT))
+        print('query_series: last hour, {} points x {} columns in {:.1f} ms'.format(len(at), len(series),
+                (time.perf_counter() - t0) * 1000))
+        conn.close()
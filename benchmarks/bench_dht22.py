@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+# effective sample rate per DHT22 with N simulated sensors at several failure rates: the old dht22.py loop
+# (read, then sleep 2 s whether it worked or not) run over N sensors, vs dht22.py's thread per sensor with and without
+# short retries; every reading goes through one MultiTableWriter
+# usage: python3 -m benchmarks.bench_dht22 [--sensors 1,4,8] [--failure-rates 0,0.1,0.3,0.5] [--seconds 30] [--scale 0.1]
+# times are scaled by --scale (period, read time, retries, backoffs), rates are reported in real time:
+# readings per sensor per minute, at most 30 with a 2 s period
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+from dht22 import dht22_tasks, reading_logger, DHT22_PERIOD, DHT22_RETRY
+from scheduler import PollScheduler, MIN_BACKOFF, MAX_BACKOFF
+from sensordb import MultiTableWriter, create_table, DHT22_COLUMNS
+from simboard import SimDHT22
+from timestamps import time_us
+
+
+def blocking(devices, writer, seconds, period):
+    #the old loop, one sensor after the other
+    on_read = reading_logger(writer)
+    stopped = time.monotonic() + seconds
+    while time.monotonic() < stopped:
+        for name, device in devices.items():
+            try:
+                on_read(name, device.read(), time_us())
+            except RuntimeError:
+                pass
+            time.sleep(period)
+
+
+def concurrent(devices, writer, seconds, period, retry, scale):
+    scheduler = PollScheduler(dht22_tasks(devices, period = period, retry = retry, min_backoff = MIN_BACKOFF * scale,
+            max_backoff = MAX_BACKOFF * scale), on_read = reading_logger(writer), log_errors = False)
+    #backoff messages
+    with contextlib.redirect_stdout(io.StringIO()):
+        scheduler.start()
+        time.sleep(seconds)
+        scheduler.stop()
+
+
+def run(strategy, sensors, failure_rate, seconds, scale):
+    path = os.path.join(tempfile.mkdtemp(), 'dht22.db')
+    names = ['dht22_{}'.format(i) for i in range(sensors)]
+    conn = sqlite3.connect(path)
+    for name in names:
+        create_table(conn, name, DHT22_COLUMNS, time_us = True)
+    conn.close()
+    writer = MultiTableWriter(path, {name: DHT22_COLUMNS for name in names}, flush_rows = 5 * sensors)
+    devices = {name: SimDHT22(failure_rate, SimDHT22.READ_TIME * scale, seed = i) for i, name in enumerate(names)}
+    period = DHT22_PERIOD * scale
+    if strategy == 'blocking':
+        blocking(devices, writer, seconds, period)
+    else:
+        concurrent(devices, writer, seconds, period, DHT22_RETRY * scale if strategy == 'threads+retry' else None, scale)
+    writer.close()
+    conn = sqlite3.connect(path)
+    rows = [conn.execute('SELECT COUNT(*) FROM {}'.format(name)).fetchone()[0] for name in names]
+    conn.close()
+    reads = sum(device.reads for device in devices.values())
+    #per sensor per real minute
+    per_minute = 60.0 * scale / seconds
+    return min(rows) * per_minute, sum(rows) / sensors * per_minute, reads / sensors * per_minute
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sensors', default = '1,4,8')
+    parser.add_argument('--failure-rates', default = '0,0.1,0.3,0.5')
+    parser.add_argument('--seconds', type = float, default = 30.0, help = 'per run, scaled time')
+    parser.add_argument('--scale', type = float, default = 0.1, help = 'simulated seconds per real second')
+    args = parser.parse_args()
+
+    print('readings per sensor per minute (real time), 2 s period: at most 30')
+    print('{:>8} {:>9} {:<15} {:>10} {:>10} {:>12}'.format('sensors', 'failures', 'strategy', 'mean', 'worst', 'attempts'))
+    for sensors in [int(n) for n in args.sensors.split(',')]:
+        for failure_rate in [float(f) for f in args.failure_rates.split(',')]:
+            for strategy in ('blocking', 'threads', 'threads+retry'):
+                worst, mean, attempts = run(strategy, sensors, failure_rate, args.seconds, args.scale)
+                print('{:>8} {:>9.0%} {:<15} {:>10.1f} {:>10.1f} {:>12.1f}'.format(sensors, failure_rate, strategy, mean,
+                        worst, attempts))
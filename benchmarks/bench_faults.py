@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# read rate and period stability of the healthy sensors while others are dead, with and without backoff
+# usage: python3 -m benchmarks.bench_faults [--seconds 20] [--dead MPU6500,BMP581] [--timeout 0.025] [--min-rate 0.8]
+# runs SensorBoard.Board's own drivers and sensor_tasks() on the simulated board under PollScheduler;
+# dead chips hold the bus for --timeout per transaction, like a hung MPU6500 stretching SCL
+# exits 1 when, with backoff on, a healthy sensor reads less than --min-rate of its 1 / period
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+os.environ['SENSORBOARD_BUS'] = 'sim'
+
+import SensorBoard
+from scheduler import PollScheduler
+from simboard import SimBus, SimGPIO
+
+
+def run(seconds, dead, timeout, backoff):
+    sim = SimBus(timeout = timeout)
+    board = SensorBoard.Board(bus = sim, gpio = SimGPIO(sim))
+    sim.dead = {getattr(board, name + '_ADDRESS') for name in dead}
+    tasks = board.sensor_tasks()
+    stamps = {task.name: [] for task in tasks}
+
+    def timed_read(name, read):
+        def timed():
+            values = read()
+            stamps[name].append(time.monotonic())
+            return values
+        return timed
+
+    for task in tasks:
+        task.read = timed_read(task.name, task.read)
+        if not backoff:
+            task.failure_threshold = float('inf')
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        scheduler = PollScheduler(tasks)
+        start_failed = sim.failed
+        scheduler.start()
+        time.sleep(seconds)
+        rates = scheduler.rates()
+        scheduler.stop()
+
+    failed = sim.failed - start_failed
+    result = {'bus blocked by dead chips (s)': failed * (timeout or 0.0), 'failed transactions': failed, 'sensors': {}}
+    for task in tasks:
+        intervals = [b - a for a, b in zip(stamps[task.name], stamps[task.name][1:])]
+        result['sensors'][task.name] = {
+            'samples': task.samples,
+            'attempts': task.samples + task.failures,
+            'state': task.state,
+            'rate': rates[task.name] * task.period, #fraction of the reads its period asks for
+            'jitter': statistics.pstdev(intervals) if len(intervals) > 1 else float('nan'),
+            'worst': max((abs(i - task.period) for i in intervals), default = float('nan')),
+        }
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 20.0)
+    parser.add_argument('--dead', default = 'MPU6500,BMP581')
+    parser.add_argument('--timeout', type = float, default = 0.025)
+    parser.add_argument('--min-rate', type = float, default = 0.8, help = 'fraction of 1 / period a healthy sensor must reach')
+    args = parser.parse_args()
+    dead = [name for name in args.dead.split(',') if name]
+
+    problems = []
+    for backoff in (False, True):
+        result = run(args.seconds, dead, args.timeout, backoff)
+        print('backoff {}: {} failed transactions, bus blocked {:.2f} s of {:.0f} s'.format(
+                'on' if backoff else 'off', result['failed transactions'], result['bus blocked by dead chips (s)'], args.seconds))
+        print('{:<10} {:>8} {:>9} {:>9} {:>7} {:>11} {:>11}'.format('sensor', 'samples', 'attempts', 'state', 'rate',
+                'jitter ms', 'worst ms'))
+        for name, stats in result['sensors'].items():
+            print('{:<10} {:>8} {:>9} {:>9} {:>7.2f} {:>11.2f} {:>11.2f}'.format(name, stats['samples'], stats['attempts'],
+                    stats['state'], stats['rate'], stats['jitter'] * 1000, stats['worst'] * 1000))
+            if backoff and name not in dead and stats['rate'] < args.min_rate:
+                problems.append('{} read {:.2f} of its rate'.format(name, stats['rate']))
+        print()
+    print('healthy sensors with backoff: {}'.format('; '.join(problems) if problems else 'ok'))
+    if problems:
+        sys.exit(1)
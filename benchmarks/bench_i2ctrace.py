@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+# i2ctrace.py: cost of recording every bus transaction, trace size, and replay speed of the unchanged drivers
+# usage: python3 -m benchmarks.bench_i2ctrace [--seconds 10] [--transactions 200000]
+# records a simulated board polled as SensorBoard.py does (SENSOR_PERIODS), then replays the trace through a fresh Board
+# as fast as possible and checks that every sensor decodes the same values it did live; overhead is per transaction,
+# a zero-latency SimBus read with and without the recorder in front of it
+
+import argparse
+import os
+import tempfile
+import time
+
+from i2ctrace import RecordingBus, ReplayBus, read_trace, replay
+from scheduler import PollScheduler
+from simboard import SimBus, SimGPIO, AGS10_ADDRESS
+from SensorBoard import Board
+
+
+def overhead(path, transactions):
+    bus = SimBus(latency = 0)
+    recorder = RecordingBus(SimBus(latency = 0), path)
+    results = {}
+    for name, target in (('SimBus', bus), ('RecordingBus(SimBus)', recorder)):
+        t0 = time.perf_counter()
+        for _ in range(transactions):
+            target.read_i2c_block_data(AGS10_ADDRESS, 0x00, 5)
+        results[name] = (time.perf_counter() - t0) / transactions * 1e6
+    recorder.close()
+    return results
+
+
+def record(path, seconds):
+    bus = SimBus(latency = 0, seed = 1)
+    recorder = RecordingBus(bus, path)
+    board = Board(bus = recorder, gpio = SimGPIO(bus))
+    live = {}
+
+    def on_read(name, values, read_time):
+        if values is not None:
+            live.setdefault(name, []).append(tuple(values))
+    scheduler = PollScheduler(board.sensor_tasks(), on_read = on_read)
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    recorder.close()
+    return live, recorder.transactions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 10.0, help = 'of recording')
+    parser.add_argument('--transactions', type = int, default = 200000, help = 'for the overhead measurement')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+
+    print('per transaction, zero-latency bus:')
+    for name, us in overhead(os.path.join(directory, 'overhead.i2c'), args.transactions).items():
+        print('  {:<22} {:>7.2f} us'.format(name, us))
+
+    path = os.path.join(directory, 'board.i2c')
+    live, transactions = record(path, args.seconds)
+    size = os.path.getsize(path)
+    print('recorded {:.0f} s: {} transactions, {} bytes, {:.1f} bytes/transaction, {:.0f} bytes/s'.format(args.seconds,
+            transactions, size, size / transactions, size / args.seconds))
+
+    t0 = time.perf_counter()
+    count = sum(1 for _ in read_trace(path))
+    parse = time.perf_counter() - t0
+    print('parse: {:.0f} transactions/s'.format(count / parse))
+
+    t0 = time.perf_counter()
+    results = replay(Board(bus = ReplayBus(path), gpio = SimGPIO()))
+    elapsed = time.perf_counter() - t0
+    print('replay: {:.3f} s, {:.0f} transactions/s, {:.0f}x real time'.format(elapsed, count / elapsed, args.seconds / elapsed))
+    print('{:<10} {:>8} {:>8} {:>8}  {}'.format('sensor', 'live', 'replay', 'errors', 'same values'))
+    for name, (values, errors) in results.items():
+        values = [tuple(v) for v in values]
+        print('{:<10} {:>8} {:>8} {:>8}  {}'.format(name, len(live.get(name, [])), len(values), errors,
+                values == live.get(name, [])))
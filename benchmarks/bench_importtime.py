@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+# cold import time of the entry modules from `python -X importtime`, checked against importtime_budget.json
+# usage: python3 -m benchmarks.bench_importtime [--runs 5] [--top 10]
+# exits non-zero when a module is over budget or pulls in a forbidden dependency
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'importtime_budget.json')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def importtime(module):
+    #{imported module: (self us, cumulative us)} for one fresh interpreter
+    env = dict(os.environ, SENSORBOARD_BUS = 'sim')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+            cwd = ROOT, env = env, capture_output = True, text = True)
+    if result.returncode != 0:
+        raise SystemExit("import {} failed:\n{}".format(module, result.stderr.strip().splitlines()[-1]))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type = int, default = 5, help = 'best of N runs is reported')
+    parser.add_argument('--top', type = int, default = 10)
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as f:
+        budget = json.load(f)
+
+    failed = False
+    for module, budget_ms in budget['budget_ms'].items():
+        runs = [importtime(module) for _ in range(args.runs)]
+        best = min(runs, key = lambda times: times[module][1])
+        total_ms = best[module][1] / 1000
+        status = 'ok' if total_ms <= budget_ms else 'OVER BUDGET'
+        print('{}: {:.1f} ms (budget {} ms) {}'.format(module, total_ms, budget_ms, status))
+        failed = failed or total_ms > budget_ms
+
+        for dependency in budget['forbidden'].get(module, []):
+            if dependency in best:
+                print('  imports {} at load time'.format(dependency))
+                failed = True
+
+        heaviest = sorted(best.items(), key = lambda item: item[1][0], reverse = True)[:args.top]
+        for name, (self_us, cumulative_us) in heaviest:
+            print('  {:<40} self {:>8.1f} ms  cumulative {:>8.1f} ms'.format(name, self_us / 1000, cumulative_us / 1000))
+    if failed:
+        raise SystemExit(1)
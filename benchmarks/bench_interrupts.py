@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+# polling vs INT pin driven reads on the simulated board: bus transactions and data freshness
+# usage: python3 -m benchmarks.bench_interrupts [--seconds 10]
+# freshness is how old the data was when it was read: time since the BMP581 conversion / MPU6500 sample,
+# and how long each MAX30102 sample waited in the FIFO
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import time
+
+os.environ['SENSORBOARD_BUS'] = 'sim'
+
+import SensorBoard
+import metrics
+from scheduler import PollScheduler
+
+SENSORS = {
+    'BMP581': SensorBoard.BMP581_ADDRESS,
+    'MPU6500': SensorBoard.MPU6500_ADDRESS,
+    'MAX30102': SensorBoard.MAX30102_ADDRESS,
+}
+
+
+def run(board, mode, seconds):
+    sim = board.i2c.bus.bus
+    board.acquisition_mode = mode
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        scheduler = PollScheduler(board.sensor_tasks())
+        scheduler.start()
+        #chip init sleeps up to a second, measure the steady state
+        time.sleep(1.5)
+        metrics.registry.counters.clear()
+        for address in SENSORS.values():
+            del sim.chips[address].ages[:]
+        start = time.monotonic()
+        time.sleep(seconds)
+        elapsed = time.monotonic() - start
+        counters = dict(metrics.registry.counters)
+        scheduler.stop(1.0)
+    for pin in (board.BMP581_INT_PIN, board.MPU6500_INT_PIN, board.MAX30102_INT_PIN):
+        board.GPIO.remove_event_detect(pin)
+
+    result = {}
+    for name, address in SENSORS.items():
+        label = '0x{:02X}'.format(address)
+        transactions = sum(value for (key, labels), value in counters.items()
+                if key == 'i2c_transactions_total' and ('address', label) in labels)
+        ages = sim.chips[address].ages
+        result[name] = {
+            'transactions/s': transactions / elapsed,
+            'samples': len(ages),
+            'mean age ms': statistics.mean(ages) * 1000 if ages else float('nan'),
+            'max age ms': max(ages) * 1000 if ages else float('nan'),
+        }
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 10.0)
+    args = parser.parse_args()
+
+    board = SensorBoard.Board()
+    #count transactions per address under the scheduler's bus lock
+    board.i2c.bus = metrics.CountingBus(board.i2c.bus)
+    board.ppg = None
+    for mode in ('poll', 'interrupt'):
+        result = run(board, mode, args.seconds)
+        print(mode)
+        print('{:<10} {:>15} {:>8} {:>12} {:>11}'.format('sensor', 'transactions/s', 'samples', 'mean age ms', 'max age ms'))
+        for name, stats in result.items():
+            print('{:<10} {:>15.1f} {:>8} {:>12.1f} {:>11.1f}'.format(name, stats['transactions/s'], stats['samples'],
+                    stats['mean age ms'], stats['max age ms']))
+        print()
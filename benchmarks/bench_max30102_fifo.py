@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+# MAX30102 FIFO drain: per-sample reads vs burst reads, on a simulated bus
+# usage: python3 -m benchmarks.bench_max30102_fifo [--rounds 2000]
+
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault('SENSORBOARD_BUS', 'sim')
+
+import SensorBoard
+
+
+class FIFOBus:
+    #MAX30102 FIFO model: pointer registers plus a FIFO_DATA register popping 6-byte samples
+    def __init__(self, samples = 32):
+        self.samples = samples
+        self.transactions = 0
+        self.refill()
+
+    def refill(self):
+        #same words every time so both read paths can be compared
+        rng = random.Random(0)
+        self.fifo = [rng.randrange(1 << 18) for _ in range(2 * self.samples)]
+        self.pos = 0
+
+    def read_byte_data(self, addr, reg):
+        self.transactions += 1
+        if reg == 0x04: #FIFO_WR_PTR
+            return self.samples % 32
+        if reg == 0x05: #OVF_COUNTER
+            return 1 if self.samples == 32 else 0
+        return 0
+
+    def write_byte_data(self, addr, reg, value):
+        self.transactions += 1
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self.transactions += 1
+        out = []
+        for word in self.fifo[self.pos:self.pos + length // 3]:
+            out += [(word >> 16) & 0xFF, (word >> 8) & 0xFF, word & 0xFF]
+        self.pos += length // 3
+        return out
+
+
+def legacy_getdata(i2c, num_samples):
+    #the per-sample loop MAX30102_getdata() used before burst reads
+    red_data = []
+    ir_data = []
+    for _ in range(num_samples):
+        raw_data = i2c.read_i2c_block_data(SensorBoard.MAX30102_ADDRESS, 0x07, 6)
+        red = (raw_data[0] << 16) | (raw_data[1] << 8) | raw_data[2]
+        ir = (raw_data[3] << 16) | (raw_data[4] << 8) | raw_data[5]
+        red_data.append(red)
+        ir_data.append(ir)
+    return red_data, ir_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type = int, default = 2000)
+    args = parser.parse_args()
+
+    bus = FIFOBus()
+    board = SensorBoard.Board(bus = bus)
+
+    bus.transactions = 0
+    legacy_getdata(bus, 32)
+    legacy_transactions = bus.transactions + 6 #3 pointer reads, 3 temperature transactions
+    bus.refill()
+    bus.transactions = 0
+    red, ir = board.MAX30102_getdata()[:2]
+    burst_transactions = bus.transactions
+    bus.refill()
+    assert list(red) == legacy_getdata(bus, 32)[0], "burst decode differs from per-sample decode"
+
+    bus.refill()
+    raw = board.MAX30102_read_fifo(32)
+    rows = [list(raw[i:i + 6]) for i in range(0, len(raw), 6)]
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        for raw_data in rows:
+            red = (raw_data[0] << 16) | (raw_data[1] << 8) | raw_data[2]
+            ir = (raw_data[3] << 16) | (raw_data[4] << 8) | raw_data[5]
+    legacy_us = (time.perf_counter() - t0) / args.rounds * 1e6
+
+    t0 = time.perf_counter()
+    for _ in range(args.rounds):
+        SensorBoard.MAX30102_decode(raw, board.MAX30102_red_buf, board.MAX30102_ir_buf)
+    burst_us = (time.perf_counter() - t0) / args.rounds * 1e6
+
+    print('full 32-sample FIFO')
+    print('{:<12} {:>14} {:>16}'.format('', 'transactions', 'decode (us)'))
+    print('{:<12} {:>14} {:>16.1f}'.format('per-sample', legacy_transactions, legacy_us))
+    print('{:<12} {:>14} {:>16.1f}'.format('burst', burst_transactions, burst_us))
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# aggregate sensor reads/s with N simulated boards: all boards as threads of one process vs multiboard.run()
+# (one acquisition process per board, PPG in a process pool, one writer)
+# usage: python3 -m benchmarks.bench_multiboard [--boards 1,2,4,8] [--seconds 5]
+# each board has its own simulated bus answering as fast as the CPU allows, and its MPU6500, BMP581 and
+# BH1750FVI are read back to back, so the read rate is bound by CPU rather than bus time
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+os.environ['SENSORBOARD_BUS'] = 'sim'
+os.environ['SENSORBOARD_SIM_LATENCY'] = '0'
+
+import SensorBoard
+import multiboard
+from scheduler import PollScheduler
+
+FAST_PERIODS = {'BH1750FVI': 0.0, 'BMP581': 0.0, 'MPU6500': 0.0}
+
+
+def boards(n, first_bus):
+    return [{'name': 'Board_{}'.format(i), 'bus_id': first_bus + i, 'periods': FAST_PERIODS} for i in range(n)]
+
+
+def use_db(path):
+    for writer in SensorBoard.writers.values():
+        writer.close()
+    SensorBoard.writers.clear()
+    SensorBoard.DB_NAME = path
+    SensorBoard.ARCHIVE_DIR = None
+
+
+def run_threads(configs, seconds):
+    instances = [SensorBoard.Board(**config) for config in configs]
+    schedulers = [PollScheduler(board.sensor_tasks()) for board in instances]
+    for scheduler in schedulers:
+        scheduler.start()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        time.sleep(SensorBoard.DB_PERIOD)
+        for board, scheduler in zip(instances, schedulers):
+            SensorBoard.insert_data(SensorBoard.sensor_row(scheduler.snapshot()), board.name)
+    rates = {board.name: scheduler.rates() for board, scheduler in zip(instances, schedulers)}
+    for scheduler in schedulers:
+        scheduler.stop(1.0)
+    return rates
+
+
+def stored_rows(path, configs):
+    for writer in SensorBoard.writers.values():
+        writer.flush()
+    conn = sqlite3.connect(path)
+    count = sum(conn.execute('SELECT count(*) FROM {}'.format(config['name'])).fetchone()[0] for config in configs)
+    conn.close()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boards', default = '1,2,4,8')
+    parser.add_argument('--seconds', type = float, default = 5.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+
+    print('{} CPUs'.format(os.cpu_count()))
+    print('{:>6} {:>18} {:>20} {:>10}'.format('boards', 'threads reads/s', 'processes reads/s', 'rows (proc)'))
+    first_bus = 1
+    for n in [int(n) for n in args.boards.split(',')]:
+        result = []
+        for mode in ('threads', 'processes'):
+            #fresh simulated buses for every run
+            configs = boards(n, first_bus)
+            first_bus += n
+            path = os.path.join(directory, '{}_{}.db'.format(mode, n))
+            use_db(path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                if mode == 'threads':
+                    rates = run_threads(configs, args.seconds)
+                else:
+                    rates = multiboard.run(configs, seconds = args.seconds)
+            result.append(sum(sum(board.values()) for board in rates.values()))
+            rows = stored_rows(path, configs)
+        print('{:>6} {:>18.0f} {:>20.0f} {:>10}'.format(n, result[0], result[1], rows))
@@ -0,0 +1,125 @@
+#!/usr/bin/python3
+# storage size and insert throughput of the wide SensorBoard table vs the narrow per-sensor tables (narrowdb.py)
+# usage: python3 -m benchmarks.bench_narrow [--hours 6]
+# every sensor is read on SENSOR_PERIODS (MPU6500 at 10 Hz, DHT20 every 2 s ...): the wide table either keeps a row
+# of the latest values every DB_PERIOD, dropping most MPU6500/MAX30102 readings, or a row at the fastest sensor's
+# period, repeating the slow sensors' values; the narrow tables keep every reading once
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from narrowdb import NarrowDBWriter, SENSOR_COLUMNS, migrate, create_sensor_tables, create_view
+from sensordb import SensorDBWriter, create_table, create_time_index, SENSORBOARD_COLUMNS, TIME_FORMAT
+
+SENSOR_PERIODS = {'DHT20': 2.0, 'AGS10': 2.0, 'BH1750FVI': 0.5, 'BMP581': 0.5, 'MPU6500': 0.1, 'MAX30102': 0.2}
+BASE = {'DHT20': (23.0, 45.0), 'AGS10': (0.15,), 'BH1750FVI': (300.0,), 'BMP581': (23.0, 101325.0),
+        'MPU6500': (0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 25.0), 'MAX30102': (72.0, 97.5, 30.0)}
+
+
+def readings(hours, seed = 0):
+    #(epoch seconds, sensor, values) in time order, each sensor on its own period with a little jitter
+    rng = random.Random(seed)
+    start = time.time() - hours * 3600
+    out = []
+    for sensor, period in SENSOR_PERIODS.items():
+        for i in range(int(hours * 3600 / period)):
+            t = start + i * period + rng.uniform(0, period / 10)
+            out.append((t, sensor, tuple(round(v + rng.gauss(0, 0.01 * (abs(v) + 1)), 4) for v in BASE[sensor])))
+    out.sort(key = lambda reading: reading[0])
+    return out
+
+
+def wide_rows(readings, period):
+    #a row of every sensor's latest values each period, like the SensorBoard.py loop
+    latest = {}
+    rows = []
+    next_time = readings[0][0]
+    for t, sensor, values in readings:
+        while t >= next_time:
+            row = [datetime.fromtimestamp(next_time).strftime(TIME_FORMAT)]
+            for name, columns in SENSOR_COLUMNS.items():
+                row.extend(latest.get(name) or (None,) * len(columns))
+            rows.append(row)
+            next_time += period
+        latest[sensor] = values
+    return rows
+
+
+def size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def latest_ms(path):
+    conn = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        conn.execute('SELECT * FROM SensorBoard ORDER BY rowid DESC LIMIT 1').fetchone()
+    elapsed = (time.perf_counter() - t0) * 10
+    conn.close()
+    return elapsed
+
+
+def run_wide(path, rows):
+    writer = SensorDBWriter(path, 'SensorBoard', SENSORBOARD_COLUMNS)
+    create_table(writer.conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    create_time_index(writer.conn, 'SensorBoard')
+    t0 = time.perf_counter()
+    for row in rows:
+        writer.insert(row)
+    writer.close()
+    return time.perf_counter() - t0
+
+
+def run_narrow(path, readings):
+    writer = NarrowDBWriter(path)
+    create_sensor_tables(writer.conn, 'SensorBoard')
+    create_view(writer.conn, 'SensorBoard')
+    t0 = time.perf_counter()
+    for t, sensor, values in readings:
+        writer.insert(sensor, int(t * 1000000), values)
+    writer.close()
+    return time.perf_counter() - t0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type = float, default = 6.0)
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    data = readings(args.hours)
+    print('{:.0f} h, {} sensor readings'.format(args.hours, len(data)))
+    print('{:<16} {:>9} {:>10} {:>9} {:>14} {:>14} {:>10}'.format('layout', 'rows', 'readings', 'MB',
+            'bytes/reading', 'inserts/s', 'latest ms'))
+
+    for name, period in (('wide 0.5 s', 0.5), ('wide 0.1 s', 0.1)):
+        rows = wide_rows(data, period)
+        path = os.path.join(directory, 'wide_{}.db'.format(period))
+        elapsed = run_wide(path, rows)
+        #readings that made it into a row, each sensor counted once per new value
+        kept = sum(len({tuple(row[SENSORBOARD_COLUMNS.index(columns[0]):][:len(columns)]) for row in rows})
+                for columns in SENSOR_COLUMNS.values())
+        print('{:<16} {:>9} {:>10} {:>9.2f} {:>14.1f} {:>14.0f} {:>10.3f}'.format(name, len(rows), kept, size(path) / 1e6,
+                size(path) / kept, len(rows) / elapsed, latest_ms(path)))
+
+    path = os.path.join(directory, 'narrow.db')
+    elapsed = run_narrow(path, data)
+    print('{:<16} {:>9} {:>10} {:>9.2f} {:>14.1f} {:>14.0f} {:>10.3f}'.format('narrow', len(data), len(data),
+            size(path) / 1e6, size(path) / len(data), len(data) / elapsed, latest_ms(path)))
+
+    #migrating the DB_PERIOD wide table in place
+    path = os.path.join(directory, 'wide_0.5.db')
+    conn = sqlite3.connect(path)
+    t0 = time.perf_counter()
+    counts = migrate(conn)
+    elapsed = time.perf_counter() - t0
+    conn.close()
+    print()
+    print('migrate wide 0.5 s: {:.2f} s, readings per sensor {}'.format(elapsed, counts))
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+# StreamingPPG vs batch MAX30102_cal on a recorded (or synthetic) PPG: agreement and CPU per sample
+# usage: python3 -m benchmarks.bench_ppg [--file ppg.npy|ppg.csv] [--seconds 600]
+# a recording is an (n, 2) array of red, ir samples at 25 Hz
+
+import argparse
+import contextlib
+import io
+import time
+
+import numpy as np
+
+from ppg import MAX30102_cal, replay
+
+SAMPLE_RATE = 400 / 16
+CHUNK = 5 #samples per MAX30102 poll
+WINDOW = 300
+
+
+def synthetic(seconds, bpm = 72, seed = 0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    #slow heart rate drift and some sensor noise
+    phase = 2 * np.pi * np.cumsum(bpm / 60 + 0.1 * np.sin(2 * np.pi * t / 60)) / SAMPLE_RATE
+    ir = 100000 + 700 * np.sin(phase) + rng.normal(0, 30, len(t))
+    red = 80000 + 280 * np.sin(phase) + rng.normal(0, 30, len(t))
+    return red, ir
+
+
+def replay_batch(red, ir):
+    #what the acquisition loop computed before: MAX30102_cal over the trailing window after every poll
+    out = []
+    for end in range(CHUNK, len(ir) + CHUNK, CHUNK):
+        start = max(0, end - WINDOW)
+        try:
+            out.append(MAX30102_cal(red[start:end], ir[start:end], SAMPLE_RATE))
+        except ValueError:
+            #filtfilt needs more samples than the first polls provide
+            out.append((-1.0, -1.0))
+    return np.array(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file')
+    parser.add_argument('--seconds', type = float, default = 600)
+    args = parser.parse_args()
+
+    if args.file:
+        data = np.loadtxt(args.file, delimiter = ',') if args.file.endswith('.csv') else np.load(args.file)
+        red, ir = data[:, 0].astype(np.float64), data[:, 1].astype(np.float64)
+    else:
+        red, ir = synthetic(args.seconds)
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = replay_batch(red, ir)
+    batch_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    stream = replay(red, ir, SAMPLE_RATE, CHUNK, WINDOW)
+    stream_time = time.perf_counter() - t0
+
+    #compare once the window is full
+    batch, stream = batch[WINDOW // CHUNK:], stream[WINDOW // CHUNK:]
+    both = (batch[:, 0] > 0) & (stream[:, 0] > 0)
+    agree = np.mean((batch[:, 0] > 0) == (stream[:, 0] > 0))
+    print('samples: {}'.format(len(ir)))
+    print('valid/invalid agreement: {:.1%}'.format(agree))
+    if both.any():
+        hr_err = np.abs(batch[both, 0] - stream[both, 0])
+        spo2_err = np.abs(batch[both, 1] - stream[both, 1])
+        print('heart rate |diff| bpm: mean {:.2f}  p95 {:.2f}'.format(hr_err.mean(), np.percentile(hr_err, 95)))
+        print('SpO2 |diff| %:         mean {:.3f}  p95 {:.3f}'.format(spo2_err.mean(), np.percentile(spo2_err, 95)))
+    print('CPU per sample: batch {:.1f} us  streaming {:.1f} us'.format(
+        batch_time / len(ir) * 1e6, stream_time / len(ir) * 1e6))
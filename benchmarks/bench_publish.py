@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# fan-out of publisher.py to hundreds of local subscribers: end-to-end latency, delivered messages/s, drops of slow ones
+# usage: python3 -m benchmarks.bench_publish [--subscribers 300] [--slow 30] [--rates 20,50,200,500] [--seconds 5]
+# subscribers run in a second process; the slow ones sleep after every message and have a small socket buffer,
+# a third of them on each policy; slow recv/drop is messages received per slow subscriber / dropped by all of them
+# latency is from publish() to the subscriber having parsed the line, fast subscribers only
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import statistics
+import time
+
+from publisher import Publisher, POLICIES
+
+TOPICS = ['DHT20', 'AGS10', 'BH1750FVI', 'BMP581', 'MPU6500', 'MAX30102']
+SLOW_DELAY = 0.02 #seconds a slow subscriber spends per message
+SLOW_RCVBUF = 4096
+
+
+def message_time(line):
+    #messages start with {"topic": ..., "time": ..., enough to not parse the whole line
+    start = line.index(b'"time": ') + 8
+    return float(line[start:line.index(b',', start)])
+
+
+async def subscribe(port, request, slow, done, result):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if slow:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_RCVBUF)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    #the reader stops taking from the socket beyond its limit, a slow subscriber must not buffer much either
+    reader, writer = await asyncio.open_connection(sock = sock, limit = SLOW_RCVBUF if slow else 1 << 20)
+    writer.write((json.dumps(request) + '\n').encode())
+    latencies = []
+    received = 0
+    while not done.is_set():
+        try:
+            #a slow subscriber takes one message at a time, a fast one whatever has arrived
+            data = await asyncio.wait_for(reader.readline() if slow else reader.read(1 << 16), 0.2)
+        except asyncio.TimeoutError:
+            continue
+        if not data:
+            break
+        if not slow:
+            #whole lines only, the rest waits for the next read
+            data, _, rest = data.rpartition(b'\n')
+            if rest:
+                data += b'\n' + await reader.readuntil(b'\n')
+        now = time.time()
+        for line in data.splitlines():
+            latencies.append(now - message_time(line))
+            received += 1
+        if slow:
+            await asyncio.sleep(SLOW_DELAY)
+    writer.close()
+    result.append((request.get('policy', 'drop_oldest'), slow, received, latencies))
+
+
+def subscribers(port, fast, slow, connected, done, results):
+    async def main():
+        result = []
+        tasks = [asyncio.ensure_future(subscribe(port, {}, False, done, result)) for _ in range(fast)]
+        tasks += [asyncio.ensure_future(subscribe(port, {'policy': POLICIES[i % len(POLICIES)]}, True, done, result))
+                for i in range(slow)]
+        connected.set()
+        await asyncio.gather(*tasks)
+        return result
+    results.put(asyncio.run(main()))
+
+
+def run(subscriber_count, slow_count, rate, seconds):
+    publisher = Publisher(port = 0).start()
+    connected = multiprocessing.Event()
+    done = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target = subscribers, args = (publisher.port, subscriber_count - slow_count, slow_count,
+            connected, done, results))
+    process.start()
+    connected.wait()
+    while len(publisher.subscribers) < subscriber_count:
+        time.sleep(0.05)
+
+    start = time.monotonic()
+    published = 0
+    while time.monotonic() - start < seconds:
+        publisher.publish(TOPICS[published % len(TOPICS)], {'time': time.time(), 'values': [23.0, 45.0, 1.0]})
+        published += 1
+        time.sleep(max(0.0, start + published / rate - time.monotonic()))
+    elapsed = time.monotonic() - start
+    #let the fast subscribers catch up
+    time.sleep(1.0)
+    dropped = {policy: 0 for policy in POLICIES}
+    for subscriber in list(publisher.subscribers):
+        dropped[subscriber.policy] += subscriber.dropped
+    done.set()
+    result = results.get()
+    process.join()
+    publisher.stop()
+
+    fast = [r for r in result if not r[1]]
+    latencies = sorted(latency for r in fast for latency in r[3]) or [float('nan')]
+    slow = {policy: [r[2] for r in result if r[1] and r[0] == policy] for policy in POLICIES}
+    return {
+        'delivered/s': sum(r[2] for r in result) / elapsed,
+        'fast received %': 100.0 * sum(r[2] for r in fast) / max(1, len(fast) * published),
+        'p50 ms': statistics.median(latencies) * 1000,
+        'p99 ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'slow': {policy: (statistics.mean(counts) if counts else 0, dropped[policy]) for policy, counts in slow.items()},
+        'published': published,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type = int, default = 300)
+    parser.add_argument('--slow', type = int, default = 30)
+    parser.add_argument('--rates', default = '20,50,200,500', help = 'messages/s published, the board makes about 35')
+    parser.add_argument('--seconds', type = float, default = 5.0)
+    args = parser.parse_args()
+
+    print('{} subscribers, {} of them slow ({} ms per message), {} s per rate'.format(args.subscribers, args.slow,
+            SLOW_DELAY * 1000, args.seconds))
+    print('{:>6} {:>12} {:>8} {:>8} {:>8}   {}'.format('rate', 'delivered/s', 'fast %', 'p50 ms', 'p99 ms',
+            '  '.join('{:>24}'.format(policy + ' recv/drop') for policy in POLICIES)))
+    for rate in [float(rate) for rate in args.rates.split(',')]:
+        stats = run(args.subscribers, args.slow, rate, args.seconds)
+        print('{:>6.0f} {:>12.0f} {:>8.1f} {:>8.1f} {:>8.1f}   {}'.format(rate, stats['delivered/s'], stats['fast received %'],
+                stats['p50 ms'], stats['p99 ms'], '  '.join('{:>24}'.format('{:.0f} / {}'.format(*stats['slow'][policy]))
+                for policy in POLICIES)))
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# latest-reading queries: spawning querySensorBoard.py per poll vs the resident --serve mode
+# usage: python3 -m benchmarks.bench_query_service [--spawns 50] [--requests 5000] [--clients 4]
+
+import argparse
+import http.client
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import querySensorBoard
+from sensordb import create_table, create_time_index, SENSORBOARD_COLUMNS, TIME_FORMAT
+
+
+def make_db(rows):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    conn = sqlite3.connect(path)
+    create_table(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    create_time_index(conn, 'SensorBoard')
+    start = datetime.now() - timedelta(seconds = rows / 2)
+    with conn:
+        conn.executemany('INSERT INTO SensorBoard VALUES ({})'.format(', '.join('?' * len(SENSORBOARD_COLUMNS))),
+                ([(start + timedelta(seconds = i / 2)).strftime(TIME_FORMAT)] + [float(i)] * 16 for i in range(rows)))
+    conn.close()
+    return path
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def bench_spawn(path, count):
+    script = os.path.join(os.path.dirname(os.path.abspath(querySensorBoard.__file__)), 'querySensorBoard.py')
+    latencies = []
+    t0 = time.perf_counter()
+    for _ in range(count):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script, '--db', path], check = True, capture_output = True)
+        latencies.append(time.perf_counter() - start)
+    return count / (time.perf_counter() - t0), percentiles(latencies)
+
+
+def bench_service(path, count, clients, port):
+    server = querySensorBoard.serve(path, '127.0.0.1', port)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    latencies = []
+    lock = threading.Lock()
+
+    def client(n):
+        #one keep-alive connection per client, like a long-running consumer
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        local = []
+        for _ in range(n):
+            start = time.perf_counter()
+            conn.request('GET', '/latest')
+            conn.getresponse().read()
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target = client, args = (count // clients,)) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    server.shutdown()
+    return len(latencies) / elapsed, percentiles(latencies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 1200000, help = 'table size, a week at 2 Hz by default')
+    parser.add_argument('--spawns', type = int, default = 50)
+    parser.add_argument('--requests', type = int, default = 5000)
+    parser.add_argument('--clients', type = int, default = 4)
+    parser.add_argument('--port', type = int, default = 18765)
+    args = parser.parse_args()
+
+    path = make_db(args.rows)
+    print('{:<20} {:>12} {:>10} {:>10}'.format('', 'requests/s', 'p50 ms', 'p99 ms'))
+    rate, (p50, p99) = bench_spawn(path, args.spawns)
+    print('{:<20} {:>12.1f} {:>10.2f} {:>10.2f}'.format('spawn script', rate, p50, p99))
+    rate, (p50, p99) = bench_service(path, args.requests, args.clients, args.port)
+    print('{:<20} {:>12.1f} {:>10.2f} {:>10.2f}'.format('--serve /latest', rate, p50, p99))
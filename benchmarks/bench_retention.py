@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# insert latency while a table grows towards a full retention window
+# usage: python3 -m benchmarks.bench_retention [--days 8] [--rate 2]
+# text is the pre-retention layout (TIME_FORMAT times, unindexed delete on every flush), integer the one the loggers
+# use (time INTEGER PRIMARY KEY in epoch microseconds, batched prune() as RetentionPruner(index = False, time_us = True))
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sensordb import SensorDBWriter, create_table, prune, DHT22_COLUMNS, TIME_FORMAT
+from timestamps import time_us
+
+
+def fill(conn, start, seconds, rate, layout):
+    step = 1.0 / rate
+    if layout == 'text':
+        rows = ((datetime.fromtimestamp(start + i * step).strftime(TIME_FORMAT), 20.0, 50.0)
+                for i in range(int(seconds * rate)))
+    else:
+        rows = ((int((start + i * step) * 1000000), 20.0, 50.0) for i in range(int(seconds * rate)))
+    with conn:
+        conn.executemany('INSERT INTO dht22 (time, temperature, humidity) VALUES (?, ?, ?)', rows)
+
+
+def measure(writer, conn, layout, rounds = 20):
+    #one round = one flush of flush_rows rows, as seen by the acquisition loop
+    delete_timeline = (datetime.now() - timedelta(days = 7)).strftime(TIME_FORMAT)
+    latencies = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for _ in range(writer.flush_rows):
+            stamp = datetime.now().strftime(TIME_FORMAT) if layout == 'text' else time_us()
+            writer.insert((stamp, 20.0, 50.0))
+        if layout == 'text':
+            #the pre-retention behaviour: unindexed delete on every write
+            with conn:
+                conn.execute('DELETE FROM dht22 WHERE time < ?', (delete_timeline,))
+        latencies.append(time.perf_counter() - t0)
+    latencies.sort()
+    return latencies[len(latencies) // 2] * 1000
+
+
+def run(days, rate, layout):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    conn = sqlite3.connect(path)
+    create_table(conn, 'dht22', DHT22_COLUMNS, time_us = layout == 'integer')
+    #flush_interval is never reached, every flush_rows-th insert() flushes
+    writer = SensorDBWriter(path, 'dht22', DHT22_COLUMNS, flush_rows = 20, flush_interval = 3600.0)
+
+    start = time.time() - days * 86400
+    results = []
+    for day in range(days):
+        fill(conn, start + day * 86400, 86400, rate, layout)
+        rows = conn.execute('SELECT count(*) FROM dht22').fetchone()[0]
+        latency = measure(writer, conn, layout)
+        if layout == 'integer':
+            t0 = time.perf_counter()
+            prune(conn, 'dht22', time_us = True)
+            prune_ms = (time.perf_counter() - t0) * 1000
+        else:
+            prune_ms = 0.0
+        results.append((rows, latency, prune_ms))
+    writer.close()
+    conn.close()
+    os.remove(path)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type = int, default = 8)
+    parser.add_argument('--rate', type = float, default = 2.0, help = 'rows per second')
+    args = parser.parse_args()
+
+    for layout in ('text', 'integer'):
+        print('TEXT time, per-flush unindexed delete' if layout == 'text' else 'INTEGER PRIMARY KEY time, batched prune')
+        print('{:>10} {:>16} {:>12}'.format('rows', 'flush p50 (ms)', 'prune (ms)'))
+        for rows, latency, prune_ms in run(args.days, args.rate, layout):
+            print('{:>10} {:>16.3f} {:>12.1f}'.format(rows, latency, prune_ms))
+        print()
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# 7-day history query on raw rows vs rollup tables, plus the rollup cost per flush
+# usage: python3 -m benchmarks.bench_rollup [--days 7] [--rate 2]
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sensordb import SensorDBWriter, create_table, create_time_index, SENSORBOARD_COLUMNS, TIME_FORMAT
+from rollup import create_rollup_tables, update_rollups, query_range
+
+
+def fill(path, days, rate, rollups):
+    writer = SensorDBWriter(path, 'SensorBoard', SENSORBOARD_COLUMNS)
+    if rollups:
+        create_rollup_tables(writer.conn)
+        writer.flush_hooks.append(update_rollups)
+    rng = random.Random(0)
+    start = datetime.now() - timedelta(days = days)
+    step = timedelta(seconds = 1.0 / rate)
+    row_values = [rng.uniform(0, 100) for _ in SENSORBOARD_COLUMNS[1:]]
+    t0 = time.perf_counter()
+    for i in range(int(days * 86400 * rate)):
+        writer.insert([(start + i * step).strftime(TIME_FORMAT)] + row_values)
+    writer.close()
+    return time.perf_counter() - t0
+
+
+def timed(function):
+    t0 = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - t0) * 1000, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type = float, default = 7)
+    parser.add_argument('--rate', type = float, default = 2.0, help = 'rows per second')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    insert_time = {}
+    for rollups in (False, True):
+        path = os.path.join(directory, 'rollup.db' if rollups else 'raw.db')
+        conn = sqlite3.connect(path)
+        create_table(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+        create_time_index(conn, 'SensorBoard')
+        conn.close()
+        insert_time[rollups] = fill(path, args.days, args.rate, rollups)
+    rows = int(args.days * 86400 * args.rate)
+    print('insert {} rows: raw only {:.1f} s, with rollups {:.1f} s ({:.1f} us/row overhead)'.format(
+        rows, insert_time[False], insert_time[True], (insert_time[True] - insert_time[False]) / rows * 1e6))
+
+    conn = sqlite3.connect(os.path.join(directory, 'rollup.db'))
+    end = datetime.now()
+    start = end - timedelta(days = args.days)
+    columns = ['DHT20_temperature', 'BMP581_Pressure', 'AL']
+    bounds = (start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT))
+
+    raw_ms, raw_rows = timed(lambda: conn.execute(
+        'SELECT time, {} FROM SensorBoard WHERE time >= ? AND time < ?'.format(', '.join(columns)), bounds).fetchall())
+    grouped_ms, grouped_rows = timed(lambda: conn.execute(
+        'SELECT substr(time, 1, 13), {} FROM SensorBoard WHERE time >= ? AND time < ? GROUP BY substr(time, 1, 13)'.format(
+        ', '.join('avg({})'.format(c) for c in columns)), bounds).fetchall())
+    rollup_ms, (resolution, rollup_rows) = timed(lambda: query_range(conn, start, end, columns))
+
+    print('{:<32} {:>10} {:>10}'.format('{:g}-day query'.format(args.days), 'rows', 'ms'))
+    print('{:<32} {:>10} {:>10.1f}'.format('raw rows', len(raw_rows), raw_ms))
+    print('{:<32} {:>10} {:>10.1f}'.format('raw GROUP BY hour', len(grouped_rows), grouped_ms))
+    print('{:<32} {:>10} {:>10.1f}'.format('query_range ({})'.format(resolution), len(rollup_rows), rollup_ms))
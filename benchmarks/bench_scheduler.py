@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# achieved per-sensor sample rates, serial loop vs PollScheduler, on a fake bus
+# usage: python3 -m benchmarks.bench_scheduler [--seconds 10]
+
+import argparse
+import threading
+import time
+
+from scheduler import LockedBus, PollScheduler, SensorTask
+
+#same periods as SENSOR_PERIODS in SensorBoard.py
+PERIODS = {
+    'DHT20': 2.0,
+    'AGS10': 2.0,
+    'BH1750FVI': 0.5,
+    'BMP581': 0.5,
+    'MPU6500': 0.1,
+    'MAX30102': 0.2,
+}
+
+
+class FakeBus:
+    #each transaction takes as long as it would at 100 kHz and fails if two overlap
+    def __init__(self, bit_rate = 100000):
+        self.bit_rate = bit_rate
+        self.busy = threading.Lock()
+        self.transactions = 0
+
+    def _transfer(self, nbytes):
+        if not self.busy.acquire(blocking = False):
+            raise RuntimeError("concurrent bus access")
+        try:
+            self.transactions += 1
+            time.sleep((nbytes + 2) * 9 / self.bit_rate)
+        finally:
+            self.busy.release()
+
+    def read_byte(self, addr):
+        self._transfer(1)
+        return 0x18
+
+    def read_byte_data(self, addr, reg):
+        self._transfer(2)
+        return 0
+
+    def write_byte_data(self, addr, reg, value):
+        self._transfer(2)
+
+    def write_i2c_block_data(self, addr, reg, data):
+        self._transfer(1 + len(data))
+
+    def read_i2c_block_data(self, addr, reg, length):
+        self._transfer(1 + length)
+        return [0] * length
+
+
+def fake_sensors(bus):
+    #transaction pattern and conversion waits of the real drivers
+    def DHT20():
+        bus.read_byte(0x38)
+        bus.write_i2c_block_data(0x38, 0xAC, [0x33, 0x00])
+        time.sleep(0.1)
+        bus.read_byte(0x38)
+        bus.read_i2c_block_data(0x38, 0xAC, 7)
+
+    def MAX30102():
+        for reg in (0x04, 0x06, 0x05):
+            bus.read_byte_data(0x57, reg)
+        for _ in range(5):
+            bus.read_i2c_block_data(0x57, 0x07, 6)
+        bus.read_byte_data(0x57, 0x1F)
+        bus.read_byte_data(0x57, 0x20)
+        bus.write_byte_data(0x57, 0x21, 0x01)
+
+    def MPU6500():
+        bus.read_i2c_block_data(0x68, 0x3B, 6)
+        bus.read_i2c_block_data(0x68, 0x41, 2)
+        bus.read_i2c_block_data(0x68, 0x43, 6)
+
+    return {
+        'DHT20': DHT20,
+        'AGS10': lambda: bus.read_i2c_block_data(0x1A, 0x00, 5),
+        'BH1750FVI': lambda: bus.read_i2c_block_data(0x23, 0x10, 2),
+        'BMP581': lambda: bus.read_i2c_block_data(0x46, 0x1D, 6),
+        'MPU6500': MPU6500,
+        'MAX30102': MAX30102,
+    }
+
+
+def run_serial(seconds):
+    #the original main loop: every sensor in turn, then sleep 0.5 s
+    sensors = fake_sensors(FakeBus())
+    counts = dict.fromkeys(sensors, 0)
+    start = time.monotonic()
+    while time.monotonic() - start < seconds:
+        for name, read in sensors.items():
+            read()
+            counts[name] += 1
+        time.sleep(0.5)
+    elapsed = time.monotonic() - start
+    return {name: n / elapsed for name, n in counts.items()}
+
+
+def run_scheduler(seconds):
+    fake = FakeBus()
+    sensors = fake_sensors(LockedBus(fake))
+    scheduler = PollScheduler([SensorTask(name, PERIODS[name], read, errors = ()) for name, read in sensors.items()])
+    scheduler.start()
+    time.sleep(seconds)
+    rates = scheduler.rates()
+    scheduler.stop()
+    return rates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 10.0)
+    args = parser.parse_args()
+
+    serial = run_serial(args.seconds)
+    scheduled = run_scheduler(args.seconds)
+
+    print('{:<10} {:>10} {:>10} {:>12}  {}'.format('sensor', 'target Hz', 'serial Hz', 'scheduler Hz', ''))
+    ok = True
+    for name, period in PERIODS.items():
+        target = 1.0 / period
+        #allow for sleep jitter on a loaded machine
+        reached = scheduled[name] >= 0.9 * target
+        ok = ok and reached
+        print('{:<10} {:>10.2f} {:>10.2f} {:>12.2f}  {}'.format(
+            name, target, serial[name], scheduled[name], 'ok' if reached else 'LOW'))
+    if not ok:
+        raise SystemExit("scheduler missed a target rate")
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+# SensorBoard rows keyed by TIME_FORMAT text (with the time index) vs epoch microseconds as INTEGER PRIMARY KEY
+# usage: python3 -m benchmarks.bench_timestamps [--days 1] [--rate 2] [--queries 200]
+# inserts go through a SensorDBWriter in flush_rows batches; stamping is the cost of making one row's timestamp
+# (datetime.strftime as insert_data() did, timestamps.time_us() now); range queries fetch every column of random
+# windows, avg queries only average one column in SQLite; shared is the number of rows whose timestamp is also another
+# row's, which ORDER BY time cannot tell apart; ratio is how many times better integer is
+# first migrate_time() is checked on a legacy schema (id key first, time further on) and run twice, --check stops there;
+# exits 1 when the check fails
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sensordb import SensorDBWriter, create_table, create_time_index, migrate_time, SENSORBOARD_COLUMNS, TIME_FORMAT
+from timestamps import time_us
+
+WINDOWS = (('10 min', 600), ('1 h', 3600))
+HIGHER_IS_BETTER = ('insert rows/s',)
+
+
+def stamp_cost(layout, count = 100000):
+    if layout == 'text':
+        stamp = lambda: datetime.now().strftime(TIME_FORMAT)
+    else:
+        stamp = time_us
+    t0 = time.perf_counter()
+    for _ in range(count):
+        stamp()
+    return (time.perf_counter() - t0) / count
+
+
+def epochs(days, rate):
+    start = time.time() - days * 86400
+    return [start + i / rate for i in range(int(days * 86400 * rate))]
+
+
+def fill(path, layout, times):
+    conn = sqlite3.connect(path)
+    create_table(conn, 'SensorBoard', SENSORBOARD_COLUMNS, time_us = layout == 'integer')
+    if layout == 'text':
+        create_time_index(conn, 'SensorBoard')
+    conn.close()
+    writer = SensorDBWriter(path, 'SensorBoard', SENSORBOARD_COLUMNS)
+    values = tuple(float(i) for i in range(len(SENSORBOARD_COLUMNS) - 1))
+    t0 = time.perf_counter()
+    for t in times:
+        if layout == 'text':
+            writer.insert((datetime.fromtimestamp(t).strftime(TIME_FORMAT),) + values)
+        else:
+            writer.insert((int(t * 1000000),) + values)
+    writer.close()
+    return len(times) / (time.perf_counter() - t0)
+
+
+def bounds(layout, start, seconds):
+    if layout == 'text':
+        return (datetime.fromtimestamp(start).strftime(TIME_FORMAT),
+                datetime.fromtimestamp(start + seconds).strftime(TIME_FORMAT))
+    return (int(start * 1000000), int((start + seconds) * 1000000))
+
+
+def range_queries(conn, layout, times, seconds, queries, sql):
+    rng = random.Random(0)
+    t0 = time.perf_counter()
+    rows = 0
+    for _ in range(queries):
+        rows += len(conn.execute(sql, bounds(layout, rng.uniform(times[0], times[-1] - seconds), seconds)).fetchall())
+    return (time.perf_counter() - t0) / queries, rows / queries
+
+
+def latest(conn, count = 10000):
+    t0 = time.perf_counter()
+    for _ in range(count):
+        conn.execute('SELECT * FROM SensorBoard ORDER BY time DESC LIMIT 1').fetchone()
+    return (time.perf_counter() - t0) / count
+
+
+def check_migration(path):
+    #a table like sqltest.py's: an AUTOINCREMENT id before time, and a column SensorBoard no longer has
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE SensorBoard (id INTEGER PRIMARY KEY AUTOINCREMENT, time TEXT, {}, retired REAL)'.format(
+            ', '.join('{} REAL'.format(c) for c in SENSORBOARD_COLUMNS[1:])))
+    now = datetime.now().replace(microsecond = 0)
+    rows = [(now.strftime(TIME_FORMAT), float(i)) for i in range(4)] + [(None, 9.0)]
+    with conn:
+        conn.executemany('INSERT INTO SensorBoard (time, AL) VALUES (?, ?)', rows)
+    problems = []
+    moved = migrate_time(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    if moved != 4:
+        problems.append('moved {} rows, expected 4'.format(moved))
+    columns = [row[0] for row in conn.execute('SELECT name FROM pragma_table_info(?)', ('SensorBoard',))]
+    if columns != list(SENSORBOARD_COLUMNS):
+        problems.append('columns after migration: {}'.format(columns))
+    start = int(now.timestamp() * 1000000)
+    expected = [(start + i * 250000, float(i)) for i in range(4)]
+    if conn.execute('SELECT time, AL FROM SensorBoard ORDER BY time').fetchall() != expected:
+        problems.append('migrated rows differ')
+    try:
+        if migrate_time(conn, 'SensorBoard', SENSORBOARD_COLUMNS) != 0:
+            problems.append('second migration moved rows')
+    except (ValueError, sqlite3.Error) as e:
+        problems.append('second migration failed: {}'.format(e))
+    #a second TEXT table with the backup already there must stop with a clear error, not half-migrate
+    create_table(conn, 'Other', SENSORBOARD_COLUMNS)
+    create_table(conn, 'Other_text', SENSORBOARD_COLUMNS)
+    try:
+        migrate_time(conn, 'Other', SENSORBOARD_COLUMNS)
+        problems.append('migration over an existing Other_text did not raise')
+    except ValueError:
+        pass
+    conn.close()
+    return problems
+
+
+def shared(conn):
+    return conn.execute('SELECT COALESCE(SUM(n), 0) FROM (SELECT COUNT(*) AS n FROM SensorBoard GROUP BY time HAVING n > 1)'
+            ).fetchone()[0]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type = float, default = 1.0)
+    parser.add_argument('--rate', type = float, default = 2.0, help = 'rows per second')
+    parser.add_argument('--queries', type = int, default = 200, help = 'per window size')
+    parser.add_argument('--check', action = 'store_true', help = 'only check migrate_time()')
+    args = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    problems = check_migration(os.path.join(directory, 'legacy.db'))
+    print('migrate_time check: {}'.format('; '.join(problems) if problems else 'ok'))
+    if problems:
+        sys.exit(1)
+    if args.check:
+        sys.exit(0)
+    times = epochs(args.days, args.rate)
+    print('{} rows over {:g} days'.format(len(times), args.days))
+
+    results = {}
+    for layout in ('text', 'integer'):
+        path = os.path.join(directory, layout + '.db')
+        result = results[layout] = {'stamp us': stamp_cost(layout) * 1e6, 'insert rows/s': fill(path, layout, times)}
+        result['size MB'] = os.path.getsize(path) / 1e6
+        conn = sqlite3.connect(path)
+        for name, seconds in WINDOWS:
+            query_time, rows = range_queries(conn, layout, times, seconds, args.queries,
+                    'SELECT * FROM SensorBoard WHERE time >= ? AND time < ? ORDER BY time')
+            result['{} ms'.format(name)] = query_time * 1000
+            result['{} rows'.format(name)] = rows
+            result['{} avg ms'.format(name)] = range_queries(conn, layout, times, seconds, args.queries,
+                    'SELECT AVG(AL) FROM SensorBoard WHERE time >= ? AND time < ?')[0] * 1000
+        result['latest us'] = latest(conn) * 1e6
+        result['shared'] = shared(conn)
+        conn.close()
+
+    print('{:<16} {:>12} {:>12} {:>9}'.format('', 'text', 'integer', 'ratio'))
+    for key in results['text']:
+        text, integer = results['text'][key], results['integer'][key]
+        ratio = integer / text if key in HIGHER_IS_BETTER else text / integer if integer else None
+        print('{:<16} {:>12.2f} {:>12.2f} {:>9}'.format(key, text, integer,
+                '-' if ratio is None else '{:.2f}x'.format(ratio)))
+
+    conn = sqlite3.connect(os.path.join(directory, 'text.db'))
+    t0 = time.perf_counter()
+    moved = migrate_time(conn, 'SensorBoard', SENSORBOARD_COLUMNS)
+    print('migrate_time: {} rows in {:.2f} s'.format(moved, time.perf_counter() - t0))
+    conn.close()
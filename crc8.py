@@ -0,0 +1,35 @@
+#CRC-8 used by DHT20 and AGS10: polynomial 0x31 (x8 + x5 + x4 + 1), init 0xFF, no reflection
+CRC8_POLY = 0x31
+CRC8_INIT = 0xFF
+
+
+def _crc8_table(poly):
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ poly) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+CRC8_TABLE = _crc8_table(CRC8_POLY)
+
+
+def crc8(data, crc = CRC8_INIT):
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ byte]
+    return crc
+
+
+def crc8_frames(frames, crc = CRC8_INIT):
+    #CRC of every row of an (n, length) byte array at once, for validating logged frames
+    import numpy as np
+    table = np.frombuffer(CRC8_TABLE, dtype = np.uint8)
+    frames = np.asarray(frames, dtype = np.uint8)
+    result = np.full(len(frames), crc, dtype = np.uint8)
+    for column in frames.T:
+        result = table[result ^ column]
+    return result
@@ -0,0 +1,176 @@
+import time
+from sensordb import is_time_us, TIME_FORMAT
+from timestamps import parse_time
+
+#largest error a column may have after reconstruction; columns not listed are kept on any change
+TOLERANCES = {
+    'DHT20_temperature': 0.1,
+    'DHT20_humidity': 0.5,
+    'AGS10_TVOC': 0.005,
+    'AL': 2.0,
+    'BMP581_Temperature': 0.05,
+    'BMP581_Pressure': 5.0,
+    'MPU6500_accel_x': 0.05,
+    'MPU6500_accel_y': 0.05,
+    'MPU6500_accel_z': 0.05,
+    'MPU6500_gyro_x': 2.0,
+    'MPU6500_gyro_y': 2.0,
+    'MPU6500_gyro_z': 2.0,
+    'MPU6500_temp': 0.2,
+    'heart_rate': 2.0,
+    'spo2': 1.0,
+    'MAX30102_temp': 0.25,
+    'temperature': 0.1, #dht22
+    'humidity': 0.5,
+}
+HEARTBEAT = 60.0 #seconds, a row is kept at least this often even when nothing moved
+
+
+def row_seconds(value):
+    #TIME_FORMAT text or epoch microseconds (narrowdb.py, create_table(time_us = True)) -> epoch seconds
+    if isinstance(value, int):
+        return value / 1000000
+    return time.mktime(time.strptime(value, TIME_FORMAT))
+
+
+class Deadband:
+    #keeps a row when any value moved more than its tolerance away from the last kept row,
+    #read back with step reconstruction; a value turning missing (None) or back also keeps the row
+    def __init__(self, columns, tolerances = TOLERANCES, heartbeat = HEARTBEAT):
+        self.tolerances = [tolerances.get(column, 0.0) for column in columns[1:]]
+        self.heartbeat = heartbeat
+        self.kept = None #(seconds, row)
+
+    def add(self, row):
+        #returns the rows to store, the first column is the timestamp
+        t = row_seconds(row[0])
+        if self.kept is None or t - self.kept[0] >= self.heartbeat or self._moved(row):
+            self.kept = (t, row)
+            return [row]
+        return []
+
+    def _moved(self, row):
+        for value, last, tolerance in zip(row[1:], self.kept[1][1:], self.tolerances):
+            if value is None or last is None:
+                if value is not last:
+                    return True
+            elif abs(value - last) > tolerance:
+                return True
+        return False
+
+    def finish(self):
+        return []
+
+
+class SwingingDoor:
+    #keeps the rows needed to rebuild every column within its tolerance by linear interpolation:
+    #each column has a corridor of slopes from the last kept row that still covers every row since,
+    #when a new row falls outside any corridor the row before it is kept and the corridors restart there
+    def __init__(self, columns, tolerances = TOLERANCES, heartbeat = HEARTBEAT):
+        self.tolerances = [tolerances.get(column, 0.0) for column in columns[1:]]
+        self.heartbeat = heartbeat
+        self.kept = None #(seconds, row)
+        self.held = None #newest row that fits, not stored yet
+        self.latest = None #newest row, not compressed yet
+        self.upper = []
+        self.lower = []
+
+    def add(self, row):
+        #rows within one TIME_FORMAT second read back as the last of them, only that one is compressed
+        t = row_seconds(row[0])
+        previous, self.latest = self.latest, (t, row)
+        if previous is None or previous[0] == t:
+            return []
+        return self._compress(*previous)
+
+    def _compress(self, t, row):
+        if self.kept is None:
+            self._keep(t, row)
+            return [row]
+        out = []
+        if self.held is not None and (t - self.kept[0] >= self.heartbeat or not self._fits(t, row)):
+            out.append(self.held[1])
+            self._keep(*self.held)
+        if not self._fits(t, row):
+            #a value turned missing, or jumped while the clock went back
+            out.append(row)
+            self._keep(t, row)
+            return out
+        self.held = (t, row)
+        return out
+
+    def _fits(self, t, row):
+        #True when the line from the kept row to this one passes within tolerance of every row since,
+        #which is what makes it safe to keep this row instead of the held one; narrows the corridors
+        t0, kept = self.kept
+        dt = t - t0
+        for i, (value, base, tolerance) in enumerate(zip(row[1:], kept[1:], self.tolerances)):
+            if value is None or base is None:
+                if value is not base:
+                    return False
+                continue
+            if dt <= 0:
+                if abs(value - base) > tolerance:
+                    return False
+                continue
+            slope = (value - base) / dt
+            if not self.lower[i] <= slope <= self.upper[i]:
+                return False
+            self.upper[i] = min(self.upper[i], slope + tolerance / dt)
+            self.lower[i] = max(self.lower[i], slope - tolerance / dt)
+        return True
+
+    def _keep(self, t, row):
+        self.kept = (t, row)
+        self.held = None
+        self.upper = [float('inf')] * len(self.tolerances)
+        self.lower = [float('-inf')] * len(self.tolerances)
+
+    def finish(self):
+        #the newest row ends the stored series
+        out = [] if self.latest is None else self._compress(*self.latest)
+        self.latest = None
+        if self.held is not None:
+            out.append(self.held[1])
+            self._keep(*self.held)
+        return out
+
+
+COMPRESSORS = {'deadband': Deadband, 'swinging_door': SwingingDoor}
+#how each compressor's rows are read back
+RECONSTRUCTION = {'deadband': 'step', 'swinging_door': 'linear'}
+
+
+def reconstruct(times, values, at, method = 'linear'):
+    #values of a compressed column at the times `at` (epoch seconds); missing values are NaN and
+    #linear interpolation does not bridge them; after the last stored row its value is held
+    #TIME_FORMAT has one second resolution, of several rows at the same time the last one is used
+    import numpy as np
+    times = np.asarray(times, dtype = np.float64)
+    values = np.array([np.nan if v is None else v for v in values], dtype = np.float64)
+    at = np.asarray(at, dtype = np.float64)
+    if not len(times):
+        return np.full(len(at), np.nan)
+    last = np.append(times[1:] != times[:-1], True)
+    times, values = times[last], values[last]
+    index = np.searchsorted(times, at, side = 'right') - 1
+    step = values[np.maximum(index, 0)]
+    step[index < 0] = np.nan
+    if method == 'step':
+        return step
+    #a value is held up to the row where it went missing, like the step reader sees it
+    out = np.interp(at, times, values, left = np.nan, right = values[-1])
+    return np.where(np.isnan(out), step, out)
+
+
+def query_series(conn, table, columns, start, end, step = 0.5, method = 'linear'):
+    #regular series between two TIME_FORMAT strings, rebuilt from the stored rows
+    #returns (epoch seconds, {column: values}); the last row before start anchors the first values
+    import numpy as np
+    select = 'SELECT time, {} FROM {}'.format(', '.join(columns), table)
+    bounds = (parse_time(start), parse_time(end)) if is_time_us(conn, table) else (start, end)
+    rows = conn.execute(select + ' WHERE time < ? ORDER BY time DESC LIMIT 1', bounds[:1]).fetchall()
+    rows += conn.execute(select + ' WHERE time >= ? AND time <= ? ORDER BY time', bounds).fetchall()
+    times = [row_seconds(row[0]) for row in rows]
+    at = np.arange(row_seconds(start), row_seconds(end) + step / 2, step)
+    return at, {column: reconstruct(times, [row[i + 1] for row in rows], at, method) for i, column in enumerate(columns)}
@@ -1,61 +1,71 @@
 #!/home/xxlxxl/MySensor/bin/python3
 
 import time
-import board
-import os
-import adafruit_dht
+import sys
+import atexit
+import signal
 import sqlite3
-from datetime import datetime, timedelta
-
-os.system('pkill -f libgpiod')
-# Initial the dht device, with data pin connected to:
-dhtDevice = adafruit_dht.DHT22(board.D18)
-
-# you can pass DHT22 use_pulseio=False if you wouldn't like to use pulseio.
-# This may be necessary on a Linux single board computer like the Raspberry Pi,
-# but it will not work in CircuitPython.
-# dhtDevice = adafruit_dht.DHT22(board.D18, use_pulseio=False)
-
-
-def insert_data(temperature,humidity):
-    conn = sqlite3.connect('/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/SingleSensor.db')
-    cursor = conn.cursor()
-    
-    current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute('''
-        INSERT INTO dht22 (time, temperature, humidity)
-        VALUES (?, ?, ?)
-    ''', (current_time, temperature, humidity))
-    
-    delete_timeline = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute('''
-        DELETE FROM dht22 WHERE time < ?
-    ''', (delete_timeline,))
-    
-    conn.commit()
-    conn.close()
-
-while True:
-    try:
-        # Print the values to the serial port
-        temperature_c = dhtDevice.temperature
-        temperature_f = temperature_c * (9 / 5) + 32
-        humidity = dhtDevice.humidity
-#         print(
-#             "Temp: {:.1f} F / {:.1f} C    Humidity: {}% ".format(
-#                 temperature_f, temperature_c, humidity
-#             )
-#         )
-        insert_data(temperature_c, humidity)
-        
-    except RuntimeError as error:
-        # Errors happen fairly often, DHT's are hard to read, just keep going
-#         print(error.args[0])
-        time.sleep(2.0)
-        continue
-    except Exception as error:
-        dhtDevice.exit()
-        raise error
-
-    time.sleep(2.0)
+from sensordb import MultiTableWriter, RetentionPruner, create_table, migrate_time, DHT22_COLUMNS
+from scheduler import PollScheduler, SensorTask
+from sensorbus import open_dht22
+from deadband import COMPRESSORS
+
+DB_NAME = '/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/SingleSensor.db'
+RETENTION_DAYS = 7
+COMPRESSION = None #or 'deadband' / 'swinging_door', see SensorBoard.COMPRESSION
+
+#table -> data pin (BCM numbering, 18 is board.D18), every sensor has its own table, the first keeps dht22
+DHT22_SENSORS = {
+    'dht22': 18,
+    # 'dht22_2': 23,
+}
+DHT22_PERIOD = 2.0 #seconds between reads, the DHT22 does not measure faster
+DHT22_RETRY = 0.5 #seconds before retrying a failed read, doubling with every failure in a row up to DHT22_PERIOD
+DHT22_FAILURE_THRESHOLD = 6 #failed reads in a row before a sensor is backed off (see scheduler.py)
+
+
+def dht22_tasks(devices, period = DHT22_PERIOD, retry = DHT22_RETRY, failure_threshold = DHT22_FAILURE_THRESHOLD,
+        **kwargs):
+    #one task per sensor, each on its own thread: a slow or failing sensor never delays the others
+    #DHT22 reads fail fairly often (missed edges), they are retried shortly instead of a whole period later;
+    #other exceptions are logged by the scheduler and retried the same way, the thread keeps running
+    return [SensorTask(name, period, device.read, errors = (RuntimeError,), retry = retry,
+            failure_threshold = failure_threshold, **kwargs) for name, device in devices.items()]
+
+
+def reading_logger(writer):
+    #PollScheduler on_read callback; failed reads are not stored, rows are keyed by the read's epoch microseconds
+    def on_read(name, values, read_time):
+        if values is not None:
+            try:
+                writer.insert(name, (read_time,) + tuple(values))
+            except (OSError, sqlite3.Error) as e:
+                print("Sqlite3 Error: ", e)
+    return on_read
+
+
+if __name__ == '__main__':
+    #one connection for every sensor's table, rows are committed in batches
+    db_writer = MultiTableWriter(DB_NAME, {name: DHT22_COLUMNS for name in DHT22_SENSORS},
+            flush_rows = 5 * len(DHT22_SENSORS), flush_interval = 10.0,
+            compressor = COMPRESSORS[COMPRESSION] if COMPRESSION else None)
+    #tables with TEXT times from before are migrated once, see sensordb.migrate_time()
+    for name in DHT22_SENSORS:
+        migrate_time(db_writer.conn, name, DHT22_COLUMNS)
+        create_table(db_writer.conn, name, DHT22_COLUMNS, time_us = True)
+    atexit.register(db_writer.close)
+    RetentionPruner(DB_NAME, list(DHT22_SENSORS), RETENTION_DAYS, index = False, time_us = True).start()
+
+    #every device is exit()ed on the way out, so no pulsein helper is left holding a pin
+    #(and other GPIO users on the host are left alone)
+    devices = {name: open_dht22(pin) for name, pin in DHT22_SENSORS.items()}
+    for device in devices.values():
+        atexit.register(device.exit)
+    scheduler = PollScheduler(dht22_tasks(devices), on_read = reading_logger(db_writer), log_errors = False)
+    #stopped before the devices and the writer are closed, atexit runs in reverse order
+    atexit.register(scheduler.stop)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    scheduler.start()
+
+    while True:
+        time.sleep(60)
@@ -0,0 +1,263 @@
+import atexit
+import collections
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+#SENSORBOARD_TRACE=<directory> records every I2C transaction of every Board to <directory>/<board>_<start>.i2c
+TRACE_DIR = os.environ.get('SENSORBOARD_TRACE') or None
+FLUSH_BYTES = 65536 #buffered trace bytes before a write
+FLUSH_INTERVAL = 5.0 #seconds, the most a crash loses
+
+#file: MAGIC, FILE_HEADER (monotonic and wall clock at the start), then one RECORD per transaction followed by its bytes:
+#the bytes read, or written; a failed transaction has ERROR set in op, its bytes are those written and the errno
+#dt is microseconds since the previous record, the first one since the start
+MAGIC = b'I2CTRC1\n'
+FILE_HEADER = struct.Struct('<dd')
+RECORD = struct.Struct('<IBBBH') #dt, op, address, register, length
+READ_BYTE, WRITE_BYTE, READ_BYTE_DATA, WRITE_BYTE_DATA, READ_BLOCK, WRITE_BLOCK, RDWR = range(7)
+OPS = {
+    'read_byte': READ_BYTE,
+    'write_byte': WRITE_BYTE,
+    'read_byte_data': READ_BYTE_DATA,
+    'write_byte_data': WRITE_BYTE_DATA,
+    'read_i2c_block_data': READ_BLOCK,
+    'write_i2c_block_data': WRITE_BLOCK,
+    'i2c_rdwr': RDWR,
+}
+ERROR = 0x80
+
+Transaction = collections.namedtuple('Transaction', 'time op address register data errno')
+
+
+def trace_path(name, directory = None):
+    return os.path.join(directory or TRACE_DIR, '{}_{}.i2c'.format(name, datetime.now().strftime('%Y%m%d-%H%M%S')))
+
+
+def _call(op, args):
+    #(address, register, bytes written) of a bus call; the register of a read_byte/write_byte is the byte itself
+    #for write_byte and 0 for read_byte, an i2c_rdwr is a register write followed by a read, as i2c_read_burst() does
+    if op == RDWR:
+        return args[0].addr, bytes(args[0])[0], b''
+    address = args[0]
+    if op == READ_BYTE:
+        return address, 0, b''
+    if op == WRITE_BYTE:
+        return address, args[1], b''
+    if op == WRITE_BYTE_DATA:
+        return address, args[1], bytes([args[2]])
+    if op == WRITE_BLOCK:
+        return address, args[1], bytes(args[2])
+    return address, args[1], b''
+
+
+class RecordingBus:
+    #wraps a bus and appends every transaction to a trace file; innermost, so records are in bus order
+    #a record is packed into a buffer under a lock, the file is written every FLUSH_BYTES or FLUSH_INTERVAL
+    def __init__(self, bus, path):
+        self.bus = bus
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+        self.file = open(path, 'wb')
+        self.start = time.monotonic()
+        self.file.write(MAGIC + FILE_HEADER.pack(self.start, time.time()))
+        self.last = self.start
+        self.last_flush = self.start
+        self.buffer = bytearray()
+        self.lock = threading.Lock()
+        self.transactions = 0
+        atexit.register(self.flush)
+
+    def __getattr__(self, name):
+        attr = getattr(self.bus, name)
+        op = OPS.get(name)
+        if op is None or not callable(attr):
+            return attr
+
+        def recorded(*args):
+            now = time.monotonic()
+            try:
+                result = attr(*args)
+            except OSError as e:
+                self._record(now, op | ERROR, args, None, (e.errno or 0) & 0xFF)
+                raise
+            if op == READ_BYTE or op == READ_BYTE_DATA:
+                data = bytes([result])
+            elif op == READ_BLOCK:
+                data = bytes(result)
+            elif op == RDWR:
+                data = b''.join(bytes(msg) for msg in args[1:])
+            else:
+                data = None
+            self._record(now, op, args, data)
+            return result
+        setattr(self, name, recorded)
+        return recorded
+
+    def _record(self, now, op, args, data, errno = None):
+        address, register, written = _call(op & ~ERROR, args)
+        if data is None:
+            data = written
+        if errno is not None:
+            data += bytes([errno])
+        with self.lock:
+            dt = min(int((now - self.last) * 1000000), 0xFFFFFFFF)
+            self.last = now
+            self.buffer += RECORD.pack(dt, op, address, register, len(data))
+            self.buffer += data
+            self.transactions += 1
+            if len(self.buffer) >= FLUSH_BYTES or now - self.last_flush >= FLUSH_INTERVAL:
+                self._flush(now)
+
+    def _flush(self, now):
+        self.file.write(self.buffer)
+        self.file.flush()
+        self.buffer = bytearray()
+        self.last_flush = now
+
+    def flush(self):
+        with self.lock:
+            if not self.file.closed:
+                self._flush(time.monotonic())
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.file.close()
+        self.bus.close()
+
+
+def read_trace(path):
+    #yields Transactions, time is the monotonic time of the recording
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if not raw.startswith(MAGIC):
+        raise ValueError("{} is not an I2C trace".format(path))
+    offset = len(MAGIC)
+    t, _ = FILE_HEADER.unpack_from(raw, offset)
+    offset += FILE_HEADER.size
+    while offset + RECORD.size <= len(raw):
+        dt, op, address, register, length = RECORD.unpack_from(raw, offset)
+        offset += RECORD.size
+        data = raw[offset:offset + length]
+        offset += length
+        if len(data) < length:
+            break #cut short by a crash
+        t += dt / 1000000
+        if op & ERROR:
+            yield Transaction(t, op & ~ERROR, address, register, data[:-1], data[-1])
+        else:
+            yield Transaction(t, op, address, register, data, None)
+
+
+class TraceEnd(Exception):
+    #an address has no recorded transactions left
+    pass
+
+
+class TraceMismatch(Exception):
+    #the driver asked for something else than what was recorded, it no longer does what it did then
+    pass
+
+
+class ReplayBus:
+    #serves a trace back to the drivers: every call takes the next recorded transaction of its address, which has to be
+    #the same operation and register (and the same bytes for writes when strict), and returns what the chip answered
+    #then, or raises its OSError; each address keeps its own order, so sensors may be read in any interleaving
+    def __init__(self, trace, strict = True):
+        self.strict = strict
+        self.queues = collections.defaultdict(collections.deque)
+        for transaction in (read_trace(trace) if isinstance(trace, str) else trace):
+            self.queues[transaction.address].append(transaction)
+        #i2c_read_burst() takes the i2c_rdwr path only when the bus has it, as the recording bus did
+        if any(t.op == RDWR for queue in self.queues.values() for t in queue):
+            self.i2c_rdwr = self._i2c_rdwr
+
+    def remaining(self, address):
+        return len(self.queues[address])
+
+    def _next(self, op, address, register, written = b''):
+        queue = self.queues.get(address)
+        if not queue:
+            raise TraceEnd("No recorded transactions left for 0x{:02X}".format(address))
+        transaction = queue.popleft()
+        if (transaction.op != op or transaction.register != register
+                or (self.strict and op in (WRITE_BYTE_DATA, WRITE_BLOCK) and transaction.data != written)):
+            raise TraceMismatch("0x{:02X}: recorded op {} register 0x{:02X} {}, got op {} register 0x{:02X} {}".format(
+                    address, transaction.op, transaction.register, transaction.data.hex(), op, register, bytes(written).hex()))
+        if transaction.errno is not None:
+            raise OSError(transaction.errno, os.strerror(transaction.errno))
+        return transaction.data
+
+    def read_byte(self, address):
+        return self._next(READ_BYTE, address, 0)[0]
+
+    def write_byte(self, address, value):
+        self._next(WRITE_BYTE, address, value)
+
+    def read_byte_data(self, address, register):
+        return self._next(READ_BYTE_DATA, address, register)[0]
+
+    def write_byte_data(self, address, register, value):
+        self._next(WRITE_BYTE_DATA, address, register, bytes([value]))
+
+    def read_i2c_block_data(self, address, register, length = 32):
+        data = self._next(READ_BLOCK, address, register)
+        if len(data) != length:
+            raise TraceMismatch("0x{:02X}: recorded a {} byte read of 0x{:02X}, got {}".format(address, len(data), register, length))
+        return list(data)
+
+    def write_i2c_block_data(self, address, register, data):
+        self._next(WRITE_BLOCK, address, register, bytes(data))
+
+    def _i2c_rdwr(self, write, read):
+        import ctypes
+        data = self._next(RDWR, write.addr, bytes(write)[0])
+        if len(data) != read.len:
+            raise TraceMismatch("0x{:02X}: recorded a {} byte burst, got {}".format(write.addr, len(data), read.len))
+        ctypes.memmove(read.buf, data, len(data))
+
+    def close(self):
+        pass
+
+
+class _NoSleep:
+    #SensorBoard's time module during a replay: the recorded chips already took their conversion time
+    def __init__(self, module):
+        self.module = module
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+    def sleep(self, seconds):
+        pass
+
+
+def replay(board):
+    #runs every sensor task of a Board on a ReplayBus until its chip's transactions run out, as fast as possible;
+    #the board needs the acquisition and MPU6500 modes of the recording, and is read in poll mode;
+    #returns {sensor: (values of every successful read, failed reads)}
+    import SensorBoard
+    #FIFO blocks were already written when they were recorded
+    board.MPU6500_write_block = lambda block, directory = None: None
+    results = {}
+    SensorBoard.time = _NoSleep(time)
+    try:
+        for task in board.sensor_tasks():
+            values = []
+            errors = 0
+            while True:
+                try:
+                    values.append(task.poll())
+                    task.succeeded()
+                except task.errors:
+                    errors += 1
+                    task.failed()
+                except TraceEnd:
+                    break
+            results[task.name] = (values, errors)
+    finally:
+        SensorBoard.time = time
+    return results
@@ -0,0 +1,182 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+#SENSORBOARD_METRICS=1 turns instrumentation on; when off, timed() returns the function unchanged
+#and no bus wrapper is installed, so the only cost left is a few `if metrics.ENABLED` checks
+ENABLED = os.environ.get('SENSORBOARD_METRICS', '') == '1'
+METRICS_FILE = os.environ.get('SENSORBOARD_METRICS_FILE', '/tmp/sensorboard_metrics.prom')
+METRICS_INTERVAL = 10.0 #seconds between metrics file updates
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+PREFIX = 'sensorboard_'
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+
+class Registry:
+    #counters and histograms keyed by (name, sorted labels), rendered in Prometheus text format
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                #one count per bucket plus +Inf, then sum
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram[-1] += value
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append('# TYPE {}{} counter'.format(PREFIX, name))
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append('{}{}{} {}'.format(PREFIX, name, _labels(labels), value))
+        for name in sorted({name for name, _ in histograms}):
+            lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+            for (key_name, labels), histogram in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram[:-1]):
+                    cumulative += count
+                    lines.append('{}{}_bucket{} {}'.format(PREFIX, name, _labels(labels + (('le', str(bound)),)), cumulative))
+                lines.append('{}{}_sum{} {}'.format(PREFIX, name, _labels(labels), histogram[-1]))
+                lines.append('{}{}_count{} {}'.format(PREFIX, name, _labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+_current = threading.local()
+
+
+def timed(func):
+    #call latency histogram and error counts by exception type for a driver function;
+    #bus transactions made inside the call are attributed to it
+    if not ENABLED:
+        return func
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_current, 'function', None)
+        _current.function = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            registry.inc('errors_total', function = name, type = type(e).__name__)
+            raise
+        finally:
+            registry.observe('call_seconds', time.perf_counter() - start, function = name)
+            _current.function = outer
+    return wrapper
+
+
+class CountingBus:
+    #counts I2C transactions, payload bytes and failures per device address and calling driver function
+    def __init__(self, bus):
+        self.bus = bus
+
+    def __getattr__(self, name):
+        attr = getattr(self.bus, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args):
+            if name == 'i2c_rdwr':
+                address = args[0].addr
+                nbytes = sum(msg.len for msg in args)
+            else:
+                address = args[0]
+                if name == 'read_i2c_block_data':
+                    nbytes = args[2] if len(args) > 2 else 32
+                elif name == 'write_i2c_block_data':
+                    nbytes = len(args[2])
+                else:
+                    nbytes = 1
+            labels = {'address': '0x{:02X}'.format(address), 'function': getattr(_current, 'function', None) or 'none'}
+            registry.inc('i2c_transactions_total', **labels)
+            registry.inc('i2c_bytes_total', nbytes, **labels)
+            try:
+                return attr(*args)
+            except OSError:
+                registry.inc('i2c_errors_total', **labels)
+                raise
+        setattr(self, name, counted)
+        return counted
+
+
+def write_file(path = METRICS_FILE):
+    #written next to the target and renamed, readers never see a partial file
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(registry.render())
+    os.replace(tmp, path)
+
+
+def serve(host = METRICS_HOST, port = METRICS_PORT):
+    #GET /metrics, for a Prometheus scrape or curl
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            data = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target = server.serve_forever, name = 'MetricsServer', daemon = True).start()
+    return server
+
+
+def start(path = METRICS_FILE, interval = METRICS_INTERVAL, port = METRICS_PORT):
+    #metrics file every interval seconds plus the scrape endpoint, nothing when disabled
+    if not ENABLED:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_file(path)
+            except OSError as e:
+                print("Metrics Error: ", e)
+    threading.Thread(target = run, name = 'MetricsFile', daemon = True).start()
+    try:
+        serve(METRICS_HOST, port)
+    except OSError as e:
+        print("Metrics Server Error: ", e)
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+import multiprocessing
+import queue
+import signal
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from SensorBoard import Board, insert_data, sensor_row, DB_PERIOD, MAX30102_SAMPLE_RATE, MAX30102_WINDOW
+from ppg import window_estimate
+from ringbuffer import RingBuffer
+from scheduler import PollScheduler
+from sensordb import SENSORBOARD_COLUMNS
+
+#one entry per board, keyword arguments of SensorBoard.Board; the name is also the table its rows go to
+BOARDS = [
+    {'name': 'SensorBoard', 'bus_id': 1},
+#     {'name': 'SensorBoard_2', 'bus_id': 3, 'pins': {'BMP581_INT_PIN': 36, 'MPU6500_INT_PIN': 38, 'MAX30102_INT_PIN': 40}},
+]
+PPG_INTERVAL = 1.0 #seconds between heart rate / SpO2 updates of a board
+PPG_WORKERS = None #analysis processes, None = one per CPU
+QUEUE_ROWS = 1000 #rows buffered between the board processes and the writer
+#positions in a row, which has no time column
+HEART_RATE = SENSORBOARD_COLUMNS.index('heart_rate') - 1
+SPO2 = SENSORBOARD_COLUMNS.index('spo2') - 1
+MAX30102_TEMP = SENSORBOARD_COLUMNS.index('MAX30102_temp') - 1
+
+
+def board_worker(config, rows, stopped, db_period):
+    #acquisition process of one board: queues a row every db_period together with the raw PPG samples read since the last one
+    signal.signal(signal.SIGINT, signal.SIG_IGN) #Ctrl-C goes to the writer, which stops us through `stopped`
+    board = Board(**config)
+    if board.ppg is not None:
+        board.ppg = 'pool'
+    scheduler = PollScheduler(board.sensor_tasks())
+    scheduler.start()
+    next_time = time.monotonic()
+    while True:
+        next_time += db_period
+        if stopped.wait(max(0.0, next_time - time.monotonic())):
+            break
+        red, ir = board.take_ppg()
+        #stamped with the newest bus read in the row, None before the first read (insert_data() stamps it then)
+        rows.put(('row', board.name, scheduler.newest_read_time(), sensor_row(scheduler.snapshot()), red, ir))
+    scheduler.stop(1.0)
+    rows.put(('rates', board.name, scheduler.rates()))
+
+
+class PPGPool:
+    #each board's last MAX30102_WINDOW samples, analysed in a process pool at most every interval seconds;
+    #rows get the newest finished result, so the writer never waits for scipy
+    def __init__(self, executor, interval = PPG_INTERVAL):
+        self.executor = executor
+        self.interval = interval
+        self.windows = {} #name -> (red, ir) RingBuffers
+        self.pending = {} #name -> Future
+        self.results = {} #name -> (heart_rate, spo2)
+        self.submitted = {} #name -> monotonic time
+
+    def update(self, name, red, ir):
+        if name not in self.windows:
+            self.windows[name] = (RingBuffer(MAX30102_WINDOW), RingBuffer(MAX30102_WINDOW))
+        red_window, ir_window = self.windows[name]
+        red_window.extend(red)
+        ir_window.extend(ir)
+
+        future = self.pending.get(name)
+        if future is not None and future.done():
+            del self.pending[name]
+            try:
+                self.results[name] = future.result()
+            except ValueError as e:
+                print("PPG Error: ", e)
+        now = time.monotonic()
+        if name not in self.pending and len(ir_window) and now - self.submitted.get(name, 0.0) >= self.interval:
+            self.submitted[name] = now
+            #the views are overwritten by the next extend(), the pool gets copies
+            self.pending[name] = self.executor.submit(window_estimate, red_window.view().copy(), ir_window.view().copy(),
+                    MAX30102_SAMPLE_RATE, MAX30102_WINDOW)
+        return self.results.get(name, (-1.0, -1.0))
+
+
+def run(boards = BOARDS, db_period = DB_PERIOD, seconds = None, workers = PPG_WORKERS):
+    #one acquisition process per board, PPG analysis in a process pool, and every row written from this process
+    #through SensorBoard.insert_data(), so sqlite only ever sees one writer; returns each board's sensor rates
+    rows = multiprocessing.Queue(QUEUE_ROWS)
+    stopped = multiprocessing.Event()
+    processes = [multiprocessing.Process(target = board_worker, args = (config, rows, stopped, db_period),
+            name = config.get('name', 'SensorBoard'), daemon = True) for config in boards]
+    for process in processes:
+        process.start()
+    rates = {}
+
+    def handle(message):
+        if message[0] == 'rates':
+            rates[message[1]] = message[2]
+            return
+        _, name, row_time, row, red, ir = message
+        if len(red) or name in ppg.windows:
+            heart_rate, spo2 = ppg.update(name, red, ir)
+            #None only when the board left PPG to us; a failed MAX30102 read has no temperature either
+            if row[HEART_RATE] is None and row[MAX30102_TEMP] is not None:
+                row[HEART_RATE], row[SPO2] = heart_rate, spo2
+        try:
+            insert_data(row, name, row_time)
+        except (OSError, sqlite3.Error) as e:
+            print("Sqlite3 Error: ", e)
+
+    with ProcessPoolExecutor(workers) as executor:
+        ppg = PPGPool(executor)
+        end = None if seconds is None else time.monotonic() + seconds
+        try:
+            while end is None or time.monotonic() < end:
+                try:
+                    handle(rows.get(timeout = 0.5))
+                except queue.Empty:
+                    pass
+        finally:
+            stopped.set()
+            #keep draining so no worker blocks on a full queue before reporting its rates
+            while len(rates) < len(processes):
+                try:
+                    handle(rows.get(timeout = 5.0))
+                except queue.Empty:
+                    break
+            for process in processes:
+                process.join(5.0)
+    return rates
+
+
+if __name__ == '__main__':
+    #systemd stops us with SIGTERM, turn it into SystemExit so the workers are stopped and atexit flushes buffered rows
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    run(BOARDS)
@@ -0,0 +1,201 @@
+import sqlite3
+import threading
+import time
+import metrics
+from sensordb import count_dropped, insert_sql, is_time_us, MAX_FLUSH_FAILURES, SENSORBOARD_COLUMNS, TIME_FORMAT
+
+#narrow layout: one table per sensor, <table>_<sensor> (time INTEGER PRIMARY KEY, value columns), time in epoch
+#microseconds; every reading is a row at its sensor's own rate and a failed read is a row of NULLs
+SENSOR_COLUMNS = {
+    'DHT20': ('DHT20_temperature', 'DHT20_humidity'),
+    'AGS10': ('AGS10_TVOC',),
+    'BH1750FVI': ('AL',),
+    'BMP581': ('BMP581_Temperature', 'BMP581_Pressure'),
+    'MPU6500': ('MPU6500_accel_x', 'MPU6500_accel_y', 'MPU6500_accel_z', 'MPU6500_gyro_x', 'MPU6500_gyro_y',
+            'MPU6500_gyro_z', 'MPU6500_temp'),
+    'MAX30102': ('heart_rate', 'spo2', 'MAX30102_temp'),
+}
+WIDE_SUFFIX = '_wide' #the wide table is kept under <table>_wide after migration, drop it once checked
+
+
+def sensor_table(table, sensor):
+    return '{}_{}'.format(table, sensor)
+
+
+def sensor_tables(table, sensors = SENSOR_COLUMNS):
+    return [sensor_table(table, sensor) for sensor in sensors]
+
+
+def create_sensor_tables(conn, table, sensors = SENSOR_COLUMNS):
+    for sensor, columns in sensors.items():
+        conn.execute('CREATE TABLE IF NOT EXISTS {} (time INTEGER PRIMARY KEY, {})'.format(
+                sensor_table(table, sensor), ', '.join('{} REAL'.format(c) for c in columns)))
+    conn.commit()
+
+
+def is_narrow(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (table,)).fetchone() is not None
+
+
+def create_view(conn, table, sensors = SENSOR_COLUMNS):
+    #`table` with the wide columns: a row per reading of any sensor, holding every sensor's latest values at that time;
+    #rowid is the reading's timestamp, so rowid order is time order and get_latest_data() works unchanged;
+    #the union is merged in time order, the newest rows are read without scanning the sensor tables
+    union = ' UNION ALL '.join('SELECT time AS t FROM {}'.format(sensor_table(table, sensor)) for sensor in sensors)
+    fields = ["strftime('{}', t / 1000000, 'unixepoch', 'localtime') AS time".format(TIME_FORMAT)]
+    for sensor, columns in sensors.items():
+        fields += ['(SELECT {0} FROM {1} WHERE time <= t ORDER BY time DESC LIMIT 1) AS {0}'.format(
+                c, sensor_table(table, sensor)) for c in columns]
+    conn.execute('CREATE VIEW IF NOT EXISTS {} AS SELECT t AS rowid, {} FROM ({})'.format(table, ', '.join(fields), union))
+    conn.commit()
+
+
+def migrate(conn, table = 'SensorBoard', sensors = SENSOR_COLUMNS):
+    #moves the rows of the wide table into the sensor tables, renames it to <table>_wide and puts the view in its place;
+    #a sensor slower than DB_PERIOD repeats its values over several wide rows, only the first of them becomes a reading,
+    #and the rows written in the same TEXT second are spread over it; returns the readings written per sensor
+    if is_narrow(conn, table):
+        return {}
+    create_sensor_tables(conn, table, sensors)
+    wide = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    if wide and is_time_us(conn, table):
+        t = 'time'
+    else:
+        t = '''CAST(strftime('%s', time, 'utc') AS INTEGER) * 1000000
+                                + (ROW_NUMBER() OVER second - 1) * 1000000 / COUNT(*) OVER whole_second'''
+    counts = {}
+    with conn:
+        if wide:
+            for sensor, columns in sensors.items():
+                changed = ' OR '.join('{0} IS NOT LAG({0}) OVER w'.format(c) for c in columns)
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO {0} (time, {1})
+                    SELECT t, {1} FROM (
+                        SELECT {4} AS t,
+                            {1}, {2} AS changed
+                        FROM {3}
+                        WINDOW w AS (ORDER BY rowid), second AS (PARTITION BY time ORDER BY rowid),
+                            whole_second AS (PARTITION BY time))
+                    WHERE changed
+                '''.format(sensor_table(table, sensor), ', '.join(columns), changed, table, t))
+                counts[sensor] = cursor.rowcount
+            conn.execute('ALTER TABLE {0} RENAME TO {0}{1}'.format(table, WIDE_SUFFIX))
+    create_view(conn, table, sensors)
+    return counts
+
+
+class NarrowDBWriter:
+    #SensorDBWriter for the narrow layout: readings of every sensor are buffered and committed in one transaction
+    #once flush_rows readings are queued or flush_interval seconds have passed; flush_hooks get wide rows
+    #(epoch microseconds, a value per SENSORBOARD_COLUMNS column, None for the other sensors) for update_rollups;
+    #compressor (a deadband.py class) is applied per sensor; repeated times and failing flushes are handled, and counted
+    #in dropped, as in SensorDBWriter
+    def __init__(self, db_name, table = 'SensorBoard', sensors = SENSOR_COLUMNS, flush_rows = 50, flush_interval = 10.0,
+            compressor = None):
+        self.table = table
+        self.sensors = dict(sensors)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.insert_sql = {sensor: insert_sql(sensor_table(table, sensor), ('time',) + columns)
+                for sensor, columns in self.sensors.items()}
+        self.compressors = {sensor: compressor(('time',) + columns) for sensor, columns in self.sensors.items()} if compressor else None
+        #positions in a wide row, after its time column
+        self.offsets = {sensor: SENSORBOARD_COLUMNS.index(columns[0]) for sensor, columns in self.sensors.items()}
+        self.readings = [] #(sensor, row) in arrival order
+        self.kept = {sensor: [] for sensor in self.sensors}
+        self.last = {} #sensor -> values of the last insert_row()
+        self.flush_hooks = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.failures = 0
+        self.dropped = 0
+
+        self.conn = sqlite3.connect(db_name, check_same_thread = False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def insert(self, sensor, time_us, values):
+        #values None for a failed read
+        columns = self.sensors[sensor]
+        values = (None,) * len(columns) if values is None else tuple(values)
+        if len(values) != len(columns):
+            raise ValueError("{} expects {} values, got {}".format(sensor, len(columns), len(values)))
+        row = (time_us,) + values
+        with self.lock:
+            self.readings.append((sensor, row))
+            if self.compressors is None:
+                self.kept[sensor].append(row)
+            else:
+                self.kept[sensor].extend(self.compressors[sensor].add(row))
+            if (len(self.readings) >= self.flush_rows
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush()
+
+    def insert_row(self, time_us, row):
+        #a wide row without its time column, as SensorBoard.sensor_row() builds it; a sensor whose values are the same
+        #as in the previous row was not read in between and is skipped
+        for sensor, columns in self.sensors.items():
+            offset = self.offsets[sensor] - 1
+            values = tuple(row[offset:offset + len(columns)])
+            if self.last.get(sensor) != values:
+                self.last[sensor] = values
+                self.insert(sensor, time_us, values)
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _wide_rows(self):
+        rows = []
+        for sensor, row in self.readings:
+            wide = [None] * len(SENSORBOARD_COLUMNS)
+            wide[0] = row[0]
+            offset = self.offsets[sensor]
+            wide[offset:offset + len(row) - 1] = row[1:]
+            rows.append(tuple(wide))
+        return rows
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        count = sum(len(rows) for rows in self.kept.values())
+        if not self.readings and not count:
+            return
+        #readings stay buffered if the transaction fails, so the next flush retries them, up to MAX_FLUSH_FAILURES times
+        start = time.perf_counter()
+        stored = 0
+        try:
+            with self.conn:
+                for sensor, rows in self.kept.items():
+                    if rows:
+                        stored += self.conn.executemany(self.insert_sql[sensor], rows).rowcount
+                if self.flush_hooks:
+                    wide = self._wide_rows()
+                    for hook in self.flush_hooks:
+                        hook(self.conn, wide)
+        except Exception:
+            self.failures += 1
+            if self.failures >= MAX_FLUSH_FAILURES:
+                self.dropped += count
+                count_dropped(self.table, count, 'failed')
+                self.readings = []
+                self.kept = {sensor: [] for sensor in self.sensors}
+                self.failures = 0
+            raise
+        self.failures = 0
+        self.dropped += count - stored
+        count_dropped(self.table, count - stored, 'duplicate')
+        if metrics.ENABLED:
+            metrics.observe('db_flush_seconds', time.perf_counter() - start, table = self.table)
+            metrics.inc('db_rows_total', stored, table = self.table)
+        self.readings = []
+        self.kept = {sensor: [] for sensor in self.sensors}
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.compressors is not None:
+                    for sensor, compressor in self.compressors.items():
+                        self.kept[sensor].extend(compressor.finish())
+                self._flush()
+            finally:
+                self.conn.close()
@@ -0,0 +1,170 @@
+import functools
+from collections import deque
+import numpy as np
+from ringbuffer import RingBuffer
+
+#scipy.signal and matplotlib are imported inside the functions that use them,
+#importing this module stays cheap until heart rate is actually computed
+
+PLOT = False #draw every MAX30102_cal() window with matplotlib
+PEAK_HEIGHT = 2000
+#accepted peak-to-valley amplitude of the filtered IR signal
+AMPLITUDE_MIN = 500
+AMPLITUDE_MAX = 2000
+
+
+@functools.lru_cache(maxsize = None)
+def lowpass(order, cutoff, fs, output = 'ba'):
+    #butter() is slow compared to a 300 sample filter, design each filter once
+    from scipy.signal import butter
+    return butter(order, cutoff, btype = 'low', analog = False, fs = fs, output = output)
+
+def spo2_from_ratio(ratio):
+#     spo2 = 104 - 17 * ratio
+    return - 45.060 * ratio * ratio + 30.354 * ratio + 94.845
+
+def plot(ir_data, ir_data_filtered, peaks):
+    import matplotlib.pyplot as plt
+    plt.ion()
+    plt.clf()
+    plt.plot(ir_data_filtered)
+    plt.plot(ir_data)
+    plt.plot(peaks, ir_data_filtered[peaks], "*")
+    plt.axhline(y =np.mean(ir_data_filtered), linestyle = '--', color='g')
+    plt.draw()
+    plt.pause(0.01)
+
+def MAX30102_cal(red_data, ir_data, sampling_rate):
+    from scipy.signal import find_peaks, filtfilt
+    #lowpass filter
+    #order = 4, cutoff = 3
+    b, a = lowpass(4, 3, sampling_rate)
+    ir_data_filtered = filtfilt(b, a, ir_data)
+    
+    peaks, _ = find_peaks(ir_data_filtered, height = PEAK_HEIGHT, distance=sampling_rate/3)
+    valleys, _ = find_peaks(-ir_data_filtered, distance=sampling_rate/3)
+    
+    if len(peaks) > 1:
+        peak_avg = np.mean(ir_data_filtered[peaks])
+        valley_avg = np.mean(ir_data_filtered[valleys])
+        print(peak_avg - valley_avg)
+        if (peak_avg - valley_avg) > AMPLITUDE_MIN and (peak_avg - valley_avg) < AMPLITUDE_MAX:
+            peak_intervals = np.diff(peaks) / sampling_rate
+            heart_rate = 60.0 / np.mean(peak_intervals)
+        else:
+            heart_rate = -1.0
+    else:
+        heart_rate = -1.0
+    
+    if PLOT:
+        plot(ir_data, ir_data_filtered, peaks)
+    
+    red_ac = np.max(red_data) - np.min(red_data)
+    ir_ac = np.max(ir_data) - np.min(ir_data)
+    red_dc = np.mean(red_data)
+    ir_dc = np.mean(ir_data)
+    
+    spo2 = spo2_from_ratio((red_ac / red_dc) / (ir_ac / ir_dc))
+    
+    if spo2 < 90.0 or heart_rate == -1.0:
+        spo2 = -1.0
+        heart_rate = -1.0
+    return heart_rate, spo2
+
+
+class StreamingPPG:
+    #heart rate / SpO2 over the last `window` samples, updated with new samples only:
+    #the IR lowpass keeps its sosfilt state between calls and peaks/valleys are tracked
+    #as samples arrive, so each update costs O(new samples) plus a few window reductions
+    def __init__(self, sampling_rate, window = 300, order = 4, cutoff = 3):
+        from scipy.signal import sosfilt, sosfilt_zi
+        self.sosfilt = sosfilt
+        self.sosfilt_zi = sosfilt_zi
+        self.sampling_rate = sampling_rate
+        self.window = window
+        self.distance = sampling_rate / 3
+        self.sos = lowpass(order, cutoff, sampling_rate, 'sos')
+        self.zi = None
+        self.red = RingBuffer(window)
+        self.ir = RingBuffer(window)
+        self.count = 0 #samples seen so far
+        self.last = [] #last two filtered values
+        self.peaks = deque() #(sample index, filtered value)
+        self.valleys = deque()
+
+    def update(self, red, ir):
+        red = np.asarray(red, dtype = np.float64)
+        ir = np.asarray(ir, dtype = np.float64)
+        if len(ir):
+            if self.zi is None:
+                #start in steady state at the first sample instead of ringing up from 0
+                self.zi = self.sosfilt_zi(self.sos) * ir[0]
+            filtered, self.zi = self.sosfilt(self.sos, ir, zi = self.zi)
+            for value in filtered.tolist():
+                self._track(value)
+            self.red.extend(red)
+            self.ir.extend(ir)
+        return self.estimate()
+
+    def _track(self, value):
+        #the previous sample is an extremum once the sample after it is known
+        if len(self.last) == 2:
+            before, current = self.last
+            index = self.count - 1
+            if before < current >= value and current >= PEAK_HEIGHT:
+                self._add(self.peaks, index, current, 1)
+            if before > current <= value:
+                self._add(self.valleys, index, current, -1)
+            self.last[0] = current
+            self.last[1] = value
+        else:
+            self.last.append(value)
+        self.count += 1
+
+    def _add(self, extrema, index, value, sign):
+        #same rule as find_peaks(distance = ...): within the distance only the most prominent survives
+        if extrema and index - extrema[-1][0] < self.distance:
+            if sign * value > sign * extrema[-1][1]:
+                extrema[-1] = (index, value)
+            return
+        extrema.append((index, value))
+
+    def estimate(self):
+        start = self.count - self.window
+        for extrema in (self.peaks, self.valleys):
+            while extrema and extrema[0][0] < start:
+                extrema.popleft()
+
+        heart_rate = -1.0
+        if len(self.peaks) > 1 and self.valleys:
+            peak_avg = sum(v for _, v in self.peaks) / len(self.peaks)
+            valley_avg = sum(v for _, v in self.valleys) / len(self.valleys)
+            if AMPLITUDE_MIN < peak_avg - valley_avg < AMPLITUDE_MAX:
+                #mean of the peak intervals
+                interval = (self.peaks[-1][0] - self.peaks[0][0]) / (len(self.peaks) - 1) / self.sampling_rate
+                heart_rate = 60.0 / interval
+        if heart_rate == -1.0:
+            return -1.0, -1.0
+
+        red, ir = self.red.view(), self.ir.view()
+        ratio = ((red.max() - red.min()) / red.mean()) / ((ir.max() - ir.min()) / ir.mean())
+        spo2 = spo2_from_ratio(ratio)
+        if spo2 < 90.0:
+            return -1.0, -1.0
+        return heart_rate, spo2
+
+
+def window_estimate(red, ir, sampling_rate, window = 300):
+    #(heart_rate, spo2) of one window without carried state, for a process pool worker
+    return StreamingPPG(sampling_rate, window).update(red, ir)
+
+
+def replay(red, ir, sampling_rate, chunk = 5, window = 300):
+    #offline mode: feed a recorded PPG through StreamingPPG in poll-sized chunks,
+    #returns one (heart_rate, spo2) row per chunk
+    engine = StreamingPPG(sampling_rate, window)
+    starts = range(0, len(ir), chunk)
+    out = np.empty((len(starts), 2))
+    for k, start in enumerate(starts):
+        out[k] = engine.update(red[start:start + chunk], ir[start:start + chunk])
+    return out
@@ -0,0 +1,195 @@
+import asyncio
+import collections
+import json
+import os
+import socket
+import threading
+import metrics
+
+#SENSORBOARD_PUBLISH=1 streams every reading to local subscribers as it is read, see Publisher
+ENABLED = os.environ.get('SENSORBOARD_PUBLISH', '') == '1'
+PUBLISH_HOST = '127.0.0.1'
+PUBLISH_PORT = 8766
+QUEUE_MESSAGES = 256 #per subscriber
+WRITE_BUFFER_BYTES = 16384 #per subscriber socket, kernel and asyncio each; beyond it messages are queued
+#what a subscriber that does not keep up loses: 'drop_oldest' keeps the newest QUEUE_MESSAGES messages,
+#'drop_newest' keeps the oldest, 'coalesce' keeps only the newest message of each topic
+POLICIES = ('drop_oldest', 'drop_newest', 'coalesce')
+DEFAULT_POLICY = 'drop_oldest'
+
+
+class Subscriber:
+    #one connection: messages go straight to the socket while it keeps up; once WRITE_BUFFER_BYTES are waiting for it
+    #they queue up to size messages, and the policy decides what a full queue loses
+    def __init__(self, writer, topics = None, policy = DEFAULT_POLICY, size = QUEUE_MESSAGES):
+        self.writer = writer
+        #a string would subscribe to its single characters and silently receive nothing
+        if topics is not None and not (isinstance(topics, (list, tuple)) and all(isinstance(t, str) for t in topics)):
+            raise TypeError("topics must be a list of names, got {!r}".format(topics))
+        self.topics = set(topics) if topics else None
+        self.policy = policy
+        self.size = size
+        self.queue = collections.deque()
+        self.latest = {} #topic -> message, for 'coalesce'
+        self.waiting = False #the socket is behind, messages are queued
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, topic, data):
+        if self.topics is not None and topic not in self.topics:
+            return
+        transport = self.writer.transport
+        if transport.is_closing():
+            return
+        if not self.waiting and transport.get_write_buffer_size() <= WRITE_BUFFER_BYTES:
+            self.writer.write(data)
+            self.sent += 1
+            return
+        self.waiting = True
+        if self.policy == 'coalesce':
+            #re-inserted, so topics go out in the order of their newest message
+            if self.latest.pop(topic, None) is not None:
+                self.dropped += 1
+            self.latest[topic] = data
+        elif len(self.queue) >= self.size:
+            self.dropped += 1
+            if self.policy == 'drop_newest':
+                return
+            self.queue.popleft()
+            self.queue.append(data)
+        else:
+            self.queue.append(data)
+        self.ready.set()
+
+    def take(self):
+        if self.policy == 'coalesce':
+            chunks, self.latest = list(self.latest.values()), {}
+        else:
+            chunks = list(self.queue)
+            self.queue.clear()
+        return chunks
+
+    async def run(self):
+        #only busy while the socket is behind
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            await self.writer.drain()
+            chunks = self.take()
+            self.writer.write(b''.join(chunks))
+            self.sent += len(chunks)
+            if self.writer.transport.get_write_buffer_size() <= WRITE_BUFFER_BYTES:
+                self.waiting = False
+            else:
+                self.ready.set()
+
+
+class Publisher:
+    #asyncio server on its own thread streaming newline-delimited JSON over TCP; publish() may be called from any thread
+    #a subscriber connects and sends one line, {"topics": [...], "policy": "coalesce", "queue": 64} with every key optional
+    #(an empty line subscribes to everything), then reads one message per line:
+    #  {"topic": "BMP581", "time": 1700000000.123456, "values": [23.1, 101325.0]}, values null when the read failed,
+    #  time is when the read returned (epoch seconds)
+    #  {"topic": "MPU6500_block", "time": ..., "samples": {"time": [...], "accel_x": [...], ...}}
+    #  {"topic": "MAX30102_block", "time": ..., "times": [...], "red": [...], "ir": [...]}, a time per sample
+    def __init__(self, host = PUBLISH_HOST, port = PUBLISH_PORT, queue_messages = QUEUE_MESSAGES, policy = DEFAULT_POLICY):
+        self.host = host
+        self.port = port
+        self.queue_messages = queue_messages
+        self.policy = policy
+        self.subscribers = set()
+        self.connections = set() #_serve() tasks
+        self.loop = None
+        self.server = None
+        self.started = threading.Event()
+        self.published = 0
+
+    def start(self):
+        threading.Thread(target = self._run, name = 'Publisher', daemon = True).start()
+        self.started.wait()
+        return self
+
+    def stop(self, timeout = None):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def _close(self):
+        self.server.close()
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+        await asyncio.gather(*self.connections, return_exceptions = True)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(self._serve, self.host, self.port))
+        #port 0 picks a free one
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def _serve(self, reader, writer):
+        try:
+            line = await reader.readline()
+            request = json.loads(line) if line.strip() else {}
+            policy = request.get('policy', self.policy)
+            if policy not in POLICIES:
+                raise ValueError("Unknown policy: {}".format(policy))
+            size = int(request.get('queue', self.queue_messages))
+            if size < 1:
+                raise ValueError("queue must be at least 1, got {}".format(size))
+            subscriber = Subscriber(writer, request.get('topics'), policy, size)
+        except (ValueError, TypeError, AttributeError, ConnectionError) as e:
+            #TypeError: a queue of null or a list, topics that are not a list of names
+            writer.write((json.dumps({'error': str(e)}) + '\n').encode())
+            writer.close()
+            return
+        #small buffers, so a lagging subscriber reaches its queue and policy instead of piling up stale data in the socket
+        writer.get_extra_info('socket').setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, WRITE_BUFFER_BYTES)
+        writer.transport.set_write_buffer_limits(high = WRITE_BUFFER_BYTES)
+        self.subscribers.add(subscriber)
+        self.connections.add(asyncio.current_task())
+        #a subscriber sends nothing more, reading only tells us when it hangs up
+        tasks = [asyncio.ensure_future(subscriber.run()), asyncio.ensure_future(reader.read())]
+        try:
+            await asyncio.wait(tasks, return_when = asyncio.FIRST_COMPLETED)
+        finally:
+            self.subscribers.discard(subscriber)
+            self.connections.discard(asyncio.current_task())
+            for task in tasks:
+                task.cancel()
+            writer.close()
+            if metrics.ENABLED and subscriber.dropped:
+                metrics.inc('publish_dropped_total', subscriber.dropped, policy = policy)
+
+    def publish(self, topic, message):
+        #message is a dict, encoded here once for every subscriber
+        if self.loop is None:
+            return
+        data = (json.dumps(dict(topic = topic, **message), default = float) + '\n').encode()
+        self.published += 1
+        self.loop.call_soon_threadsafe(self._fan_out, topic, data)
+
+    def _fan_out(self, topic, data):
+        for subscriber in self.subscribers:
+            subscriber.offer(topic, data)
+
+    def on_read(self, name, values, read_time):
+        #PollScheduler on_read callback
+        self.publish(name, {'time': read_time / 1000000, 'values': None if values is None else list(values)})
+
+    def on_block(self, name, block):
+        #Board on_block callback: MPU6500 FIFO blocks (structured arrays) and MAX30102 (red, ir, times) samples;
+        #encoded before returning, the MAX30102 buffers are reused by the next read; epoch microseconds are sent as seconds
+        if isinstance(block, tuple):
+            red, ir, times = block
+            times = (times / 1000000).tolist()
+            message = {'time': times[-1] if times else None, 'times': times, 'red': red.tolist(), 'ir': ir.tolist()}
+        else:
+            samples = {field: block[field].tolist() for field in block.dtype.names}
+            samples['time'] = (block['time'] / 1000000).tolist()
+            message = {'time': samples['time'][-1] if len(block) else None, 'samples': samples}
+        self.publish(name + '_block', message)
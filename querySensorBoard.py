@@ -1,18 +1,52 @@
 import sqlite3
 import json
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import deque
 
-DB_NAME = '/config/SensorDB/SensorBoard.db'
+DB_NAME = os.environ.get('SENSORBOARD_DB', '/config/SensorDB/SensorBoard.db')
 # DB_NAME = '/home/xxlxxl/DockerConf/HomeAssistant/SensorDB/SensorBoard.db'
 
+#JSON key -> SensorBoard column, in the order get_latest_data() returns them
+FIELDS = [
+    ('DHT20_T', 'DHT20_temperature'),
+    ('DHT20_H', 'DHT20_humidity'),
+    ('TVOC', 'AGS10_TVOC'),
+    ('AL', 'AL'),
+    ('BMP581_T', 'BMP581_Temperature'),
+    ('BMP581_P', 'BMP581_Pressure'),
+    ('Accel_X', 'MPU6500_accel_x'),
+    ('Accel_Y', 'MPU6500_accel_y'),
+    ('Accel_Z', 'MPU6500_accel_z'),
+    ('Gyro_X', 'MPU6500_gyro_x'),
+    ('Gyro_Y', 'MPU6500_gyro_y'),
+    ('Gyro_Z', 'MPU6500_gyro_z'),
+    ('MPU6500_T', 'MPU6500_temp'),
+    ('Heart_Rate', 'heart_rate'),
+    ('Spo2', 'spo2'),
+    ('MAX30102_T', 'MAX30102_temp'),
+]
+COLUMNS = ', '.join(column for _, column in FIELDS)
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+REFRESH_INTERVAL = 0.25 #seconds between change checks in service mode
+RECENT_SECONDS = 600 #window kept in memory for /recent
+RECENT_ROWS = RECENT_SECONDS * 2 #rows at DB_PERIOD = 0.5 s
+#rows keyed further ahead of this process's clock are left over from before the logger's clock stepped back
+FUTURE_US = 1000000
+
 def get_latest_data():
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
-    
+
+    #rows are appended in time order, the largest rowid is the newest row
     cursor.execute('''
-        SELECT DHT20_temperature, DHT20_humidity, AGS10_TVOC, AL, BMP581_Temperature, BMP581_Pressure,
-        MPU6500_accel_x, MPU6500_accel_y, MPU6500_accel_z, MPU6500_gyro_x, MPU6500_gyro_y, MPU6500_gyro_z, MPU6500_temp,
-        heart_rate, spo2, MAX30102_temp FROM SensorBoard ORDER BY time DESC LIMIT 1
-    ''')
+        SELECT {} FROM SensorBoard ORDER BY rowid DESC LIMIT 1
+    '''.format(COLUMNS))
     result = cursor.fetchone()
 
     conn.close()
@@ -22,25 +56,161 @@ def get_latest_data():
     else:
         return None
 
+def row_time(value):
+    #SensorBoard time as TIME_FORMAT text; tables keyed by epoch microseconds (timestamps.py) store an integer
+    if isinstance(value, int):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(value // 1000000))
+    return value
+
+def to_dict(row, keys = None):
+    info = dict(zip((key for key, _ in FIELDS), row))
+    if keys:
+        return {key: info[key] for key in keys if key in info}
+    return info
+
+
+class LatestCache:
+    #keeps the newest rows in memory; a background thread checks PRAGMA data_version,
+    #which only changes when another connection committed, and then reads just the new rows;
+    #rowid is the time key, after the logger's clock stepped back new rows sort below the ones already read, so then
+    #the window is reloaded from the newest rows not ahead of the clock
+    def __init__(self, db_name, recent_rows = RECENT_ROWS):
+        self.db_name = db_name
+        self.recent = deque(maxlen = recent_rows) #(time, row)
+        self.lock = threading.Lock()
+        self.last_rowid = 0
+        self.data_version = None
+        self.conn = None
+        self.error = None #last error printed, repeats are not
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_name, check_same_thread = False)
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version == self.data_version:
+            return False
+        horizon = int(time.time() * 1000000) + FUTURE_US
+        rows = None
+        if 0 < self.last_rowid <= horizon:
+            rows = self.conn.execute('SELECT rowid, time, {} FROM SensorBoard WHERE rowid > ? AND rowid <= ? ORDER BY rowid'
+                    .format(COLUMNS), (self.last_rowid, horizon)).fetchall()
+            if not rows and (self.conn.execute('SELECT MAX(rowid) FROM SensorBoard').fetchone()[0] or 0) < self.last_rowid:
+                rows = None
+        reload = rows is None
+        if reload:
+            rows = self.conn.execute('SELECT rowid, time, {} FROM SensorBoard WHERE rowid <= ? ORDER BY rowid DESC LIMIT ?'
+                    .format(COLUMNS), (horizon, self.recent.maxlen)).fetchall()[::-1]
+        #only after the read: while the logger has not created SensorBoard yet every refresh tries again
+        self.data_version = data_version
+        if rows:
+            with self.lock:
+                if reload:
+                    self.recent.clear()
+                for row in rows:
+                    self.recent.append((row_time(row[1]), row[2:]))
+                self.last_rowid = rows[-1][0]
+        return True
+
+    def try_refresh(self):
+        #the service may start before the logger (first boot): errors such as no such table are printed once and
+        #retried, /latest answers 'no data' until rows arrive
+        try:
+            self.refresh()
+            self.error = None
+        except sqlite3.Error as e:
+            if str(e) != self.error:
+                self.error = str(e)
+                print("Sqlite3 Error: ", e, "- retrying")
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.try_refresh()
+            self.stopped.wait(REFRESH_INTERVAL)
+
+    def start(self):
+        self.try_refresh()
+        threading.Thread(target = self.run, name = 'LatestCache', daemon = True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def latest(self):
+        with self.lock:
+            return self.recent[-1] if self.recent else None
+
+    def since(self, start_time):
+        #rows newer than start_time (a TIME_FORMAT string), oldest first
+        with self.lock:
+            return [entry for entry in self.recent if entry[0] >= start_time]
+
+
+def serve(db_name = DB_NAME, host = SERVICE_HOST, port = SERVICE_PORT):
+    #GET /latest[?fields=TVOC,AL]  GET /recent?seconds=60[&fields=...]
+    #http.server is only imported here, the one-shot mode stays as cheap to start as before
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlparse, parse_qs
+
+    cache = LatestCache(db_name)
+    cache.start()
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        #headers and body go out as separate writes, Nagle + delayed ACK would add ~40 ms to each reply
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            keys = query['fields'][0].split(',') if 'fields' in query else None
+            if url.path == '/latest':
+                entry = cache.latest()
+                if entry is None:
+                    return self.reply(404, {'error': 'no data'})
+                return self.reply(200, to_dict(entry[1], keys))
+            if url.path == '/recent':
+                try:
+                    seconds = float(query.get('seconds', ['60'])[0])
+                except ValueError:
+                    return self.reply(400, {'error': 'seconds must be a number'})
+                start = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - seconds))
+                rows = [dict(to_dict(row, keys), time = row_time) for row_time, row in cache.since(start)]
+                return self.reply(200, rows)
+            self.reply(404, {'error': 'unknown path'})
+
+        def reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    return server
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', default = DB_NAME)
+    parser.add_argument('--serve', action = 'store_true', help = 'answer HTTP requests from memory instead of printing once')
+    parser.add_argument('--port', type = int, default = SERVICE_PORT)
+    args = parser.parse_args()
+    DB_NAME = args.db
+
+    if args.serve:
+        server = serve(DB_NAME, SERVICE_HOST, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.server_close()
+        sys.exit(0)
+
     latest_data = get_latest_data()
-    SensorBoardinfo = {}
-    SensorBoardinfo['DHT20_T'] = latest_data[0]
-    SensorBoardinfo['DHT20_H'] = latest_data[1]
-    SensorBoardinfo['TVOC'] = latest_data[2]
-    SensorBoardinfo['AL'] = latest_data[3]
-    SensorBoardinfo['BMP581_T'] = latest_data[4]
-    SensorBoardinfo['BMP581_P'] = latest_data[5]
-    SensorBoardinfo['Accel_X'] = latest_data[6]
-    SensorBoardinfo['Accel_Y'] = latest_data[7]
-    SensorBoardinfo['Accel_Z'] = latest_data[8]
-    SensorBoardinfo['Gyro_X'] = latest_data[9]
-    SensorBoardinfo['Gyro_Y'] = latest_data[10]
-    SensorBoardinfo['Gyro_Z'] = latest_data[11]
-    SensorBoardinfo['MPU6500_T'] = latest_data[12]
-    SensorBoardinfo['Heart_Rate'] = latest_data[13]
-    SensorBoardinfo['Spo2'] = latest_data[14]
-    SensorBoardinfo['MAX30102_T'] = latest_data[15]
-    
+    SensorBoardinfo = to_dict(latest_data) if latest_data else {}
+
     print(json.dumps(SensorBoardinfo))
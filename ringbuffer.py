@@ -0,0 +1,39 @@
+import numpy as np
+
+
+class RingBuffer:
+    #fixed-capacity sample window; every sample is stored twice (at i and i + capacity)
+    #so the newest samples are always one contiguous slice and view() never copies
+    def __init__(self, capacity, dtype = np.float64):
+        self.capacity = capacity
+        self.buf = np.zeros(2 * capacity, dtype = dtype)
+        self.head = 0 #next write position
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, values):
+        values = np.asarray(values)
+        if len(values) > self.capacity:
+            values = values[-self.capacity:]
+        n = len(values)
+        first = min(n, self.capacity - self.head)
+        rest = n - first
+        self.buf[self.head:self.head + first] = values[:first]
+        self.buf[self.head + self.capacity:self.head + self.capacity + first] = values[:first]
+        self.buf[:rest] = values[first:]
+        self.buf[self.capacity:self.capacity + rest] = values[first:]
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def view(self):
+        #oldest to newest, a read-only view that is overwritten by later extend() calls
+        end = self.head + self.capacity
+        window = self.buf[end - self.size:end]
+        window.flags.writeable = False
+        return window
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
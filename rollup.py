@@ -0,0 +1,127 @@
+from datetime import datetime, timedelta
+
+from sensordb import RetentionPruner, is_missing, is_time_us, SENSORBOARD_COLUMNS, TIME_FORMAT, RETENTION_DAYS
+from narrowdb import is_narrow
+
+#(table suffix, bucket seconds, TIME_FORMAT prefix length, padding to a full timestamp)
+ROLLUPS = (
+    ('1m', 60, 16, ':00'),
+    ('1h', 3600, 13, ':00:00'),
+)
+ROLLUP_RETENTION_DAYS = {'1m': 31, '1h': 366}
+RAW_STEP = 0.5 #seconds between raw rows, DB_PERIOD in SensorBoard.py
+STATS = ('mean', 'min', 'max', 'count')
+
+
+def rollup_tables(table):
+    return ['{}_{}'.format(table, suffix) for suffix, _, _, _ in ROLLUPS]
+
+
+def create_rollup_tables(conn, table = 'SensorBoard', columns = SENSORBOARD_COLUMNS):
+    #per bucket and column: min, max, sum and count of the valid (not missing) values
+    fields = ['time TEXT PRIMARY KEY']
+    for c in columns[1:]:
+        fields += ['{0}_min REAL'.format(c), '{0}_max REAL'.format(c),
+                '{0}_sum REAL NOT NULL DEFAULT 0'.format(c), '{0}_count INTEGER NOT NULL DEFAULT 0'.format(c)]
+    for name in rollup_tables(table):
+        conn.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(name, ', '.join(fields)))
+    conn.commit()
+
+
+def rollup_pruners(db_name, table = 'SensorBoard'):
+    #rollups outlive the raw rows, each level has its own retention window
+    return [RetentionPruner(db_name, [name], ROLLUP_RETENTION_DAYS[suffix], index = False)
+            for (suffix, _, _, _), name in zip(ROLLUPS, rollup_tables(table))]
+
+
+def _upsert_sql(name, columns):
+    fields = ['time']
+    updates = []
+    for c in columns[1:]:
+        fields += ['{}_min'.format(c), '{}_max'.format(c), '{}_sum'.format(c), '{}_count'.format(c)]
+        updates += [
+            '{0}_min = CASE WHEN {0}_min IS NULL OR excluded.{0}_min < {0}_min THEN excluded.{0}_min ELSE {0}_min END'.format(c),
+            '{0}_max = CASE WHEN {0}_max IS NULL OR excluded.{0}_max > {0}_max THEN excluded.{0}_max ELSE {0}_max END'.format(c),
+            '{0}_sum = {0}_sum + excluded.{0}_sum'.format(c),
+            '{0}_count = {0}_count + excluded.{0}_count'.format(c),
+        ]
+    return 'INSERT INTO {} ({}) VALUES ({}) ON CONFLICT(time) DO UPDATE SET {}'.format(
+        name, ', '.join(fields), ', '.join('?' * len(fields)), ', '.join(updates))
+
+
+def update_rollups(conn, rows, table = 'SensorBoard', columns = SENSORBOARD_COLUMNS):
+    #aggregates a batch of raw rows in memory, then merges one row per touched bucket;
+    #used as a SensorDBWriter flush hook so rollups commit together with the raw rows
+    #row times are TIME_FORMAT text or epoch microseconds, the buckets are keyed by local TIME_FORMAT text either way;
+    #a microsecond time is only formatted when it leaves the bucket of the row before
+    names = columns[1:]
+    for (suffix, seconds, prefix, pad), name in zip(ROLLUPS, rollup_tables(table)):
+        buckets = {}
+        start = end = 0
+        for row in rows:
+            t = row[0]
+            if isinstance(t, str):
+                key = t[:prefix] + pad
+            elif not start <= t < end:
+                local = datetime.fromtimestamp(t // 1000000)
+                key = local.strftime(TIME_FORMAT)[:prefix] + pad
+                start = t - ((local.minute * 60 + local.second) % seconds * 1000000 + t % 1000000)
+                end = start + seconds * 1000000
+            agg = buckets.get(key)
+            if agg is None:
+                agg = buckets[key] = [[None, None, 0.0, 0] for _ in names]
+            for a, column, value in zip(agg, names, row[1:]):
+                if is_missing(column, value):
+                    continue
+                if a[0] is None or value < a[0]:
+                    a[0] = value
+                if a[1] is None or value > a[1]:
+                    a[1] = value
+                a[2] += value
+                a[3] += 1
+        conn.executemany(_upsert_sql(name, columns),
+                [[key] + [x for a in agg for x in a] for key, agg in buckets.items()])
+
+
+def choose_resolution(start, end, max_points, now = None):
+    #coarsest data that is still needed: the finest resolution that covers start and stays under max_points
+    now = now or datetime.now()
+    span = (end - start).total_seconds()
+    levels = [(None, RAW_STEP, RETENTION_DAYS)] + [(suffix, seconds, ROLLUP_RETENTION_DAYS[suffix])
+            for suffix, seconds, _, _ in ROLLUPS]
+    for suffix, step, retention_days in levels:
+        if start >= now - timedelta(days = retention_days) and span / step <= max_points:
+            return suffix
+    return levels[-1][0]
+
+
+def query_range(conn, start, end, columns = None, stat = 'mean', max_points = 2000, table = 'SensorBoard'):
+    #rows of (time, value per column) between start and end (datetimes), returns (resolution, rows);
+    #resolution is None for raw rows (stat is ignored) or a ROLLUPS suffix
+    columns = columns or SENSORBOARD_COLUMNS[1:]
+    if stat not in STATS:
+        raise ValueError("Unknown statistic: {}".format(stat))
+    resolution = choose_resolution(start, end, max_points)
+    if resolution is None:
+        name = table
+        fields = list(columns)
+    else:
+        name = '{}_{}'.format(table, resolution)
+        if stat == 'mean':
+            fields = ['{0}_sum / NULLIF({0}_count, 0)'.format(c) for c in columns]
+        else:
+            fields = ['{}_{}'.format(c, stat) for c in columns]
+    if resolution is None and is_narrow(conn, table):
+        #the narrow view's rowid is the time in microseconds, the sensor tables are keyed by it
+        cursor = conn.execute('SELECT time, {} FROM {} WHERE rowid >= ? AND rowid < ? ORDER BY rowid'.format(
+                ', '.join(fields), name), (int(start.timestamp() * 1000000), int(end.timestamp() * 1000000)))
+        return resolution, cursor.fetchall()
+    if resolution is None and is_time_us(conn, table):
+        #rows keyed by epoch microseconds, returned with TIME_FORMAT text like the rollups
+        cursor = conn.execute('''SELECT strftime('{}', time / 1000000, 'unixepoch', 'localtime'), {} FROM {}
+                WHERE time >= ? AND time < ? ORDER BY time'''.format(TIME_FORMAT, ', '.join(fields), name),
+                (int(start.timestamp() * 1000000), int(end.timestamp() * 1000000)))
+        return resolution, cursor.fetchall()
+    cursor = conn.execute('SELECT time, {} FROM {} WHERE time >= ? AND time < ? ORDER BY time'.format(
+            ', '.join(fields), name), (start.strftime(TIME_FORMAT), end.strftime(TIME_FORMAT)))
+    return resolution, cursor.fetchall()
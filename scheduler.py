@@ -0,0 +1,194 @@
+import threading
+import time
+import metrics
+from timestamps import time_us
+
+
+class LockedBus:
+    #wraps an smbus handle so every transaction holds the bus lock,
+    #sleeps between transactions (conversion waits) run without it
+    def __init__(self, bus, lock = None):
+        self.bus = bus
+        self.lock = lock if lock is not None else threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.bus, name)
+        if not callable(attr):
+            return attr
+
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        #cache the wrapper, __getattr__ only runs on the first lookup
+        setattr(self, name, locked)
+        return locked
+
+
+#sensor health: HEALTHY reads every period, FAILING still does but has failed lately,
+#BACKOFF waits an exponentially growing time and re-runs init() before the next read
+HEALTHY = 'healthy'
+FAILING = 'failing'
+BACKOFF = 'backoff'
+FAILURE_THRESHOLD = 3 #consecutive failures before a sensor is backed off
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+
+class SensorTask:
+    #read() returns the sensor values, on_error() gives the values stored when read() raised one of errors
+    #(None: fields missing); any other exception is logged and stores None
+    #init() configures the chip; it runs on the sensor's thread before the first read and again after every backoff
+    #with an event (set from a GPIO edge callback) the task reads as soon as it is set,
+    #period is then only the longest wait before reading anyway, in case an edge was missed
+    #retry: seconds before retrying a failed read, doubling with every failure in a row up to period;
+    #None waits for the next period
+    #read_time is the last read's timestamp (timestamps.time_us()), taken when it returned or failed
+    def __init__(self, name, period, read, on_error = None, errors = (OSError, ValueError), init = None,
+            failure_threshold = FAILURE_THRESHOLD, min_backoff = MIN_BACKOFF, max_backoff = MAX_BACKOFF, event = None,
+            retry = None):
+        self.name = name
+        self.period = period
+        self.read = read
+        self.on_error = on_error
+        self.errors = errors
+        self.init = init
+        self.event = event
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.retry = retry
+        self.samples = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.backoff = 0.0
+        self.state = HEALTHY
+        self.initialized = init is None
+        self.read_time = None
+
+    def poll(self):
+        try:
+            if not self.initialized:
+                self.init()
+                self.initialized = True
+            return self.read()
+        finally:
+            self.read_time = time_us()
+
+    def succeeded(self):
+        self.samples += 1
+        self.consecutive_failures = 0
+        self.backoff = 0.0
+        self.state = HEALTHY
+
+    def failed(self):
+        #returns how long to wait before the next attempt beyond the normal period
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures < self.failure_threshold:
+            self.state = FAILING
+            if self.retry is None:
+                return 0.0
+            return min(self.period, self.retry * 2 ** (self.consecutive_failures - 1))
+        self.backoff = min(self.max_backoff, self.backoff * 2 if self.backoff else self.min_backoff)
+        self.state = BACKOFF
+        #an unplugged or browned-out chip comes back unconfigured
+        self.initialized = self.init is None
+        return self.backoff
+
+
+class PollScheduler:
+    #one thread per sensor, each on its own period, results are kept in self.latest
+    #on_read(name, values, read_time) is called on the sensor's thread after every read, values None when it failed,
+    #read_time in epoch microseconds (SensorTask.read_time)
+    #log_errors = False only prints backoffs, for sensors that fail often and are simply retried
+    def __init__(self, tasks, on_read = None, log_errors = True):
+        self.tasks = list(tasks)
+        self.on_read = on_read
+        self.log_errors = log_errors
+        self.latest = {}
+        self.read_times = {} #name -> read_time of the values in latest
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.threads = []
+        self.started = None
+
+    def start(self):
+        self.started = time.monotonic()
+        for task in self.tasks:
+            thread = threading.Thread(target = self._run, args = (task,), name = task.name, daemon = True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout = None):
+        self.stopped.set()
+        for task in self.tasks:
+            if task.event is not None:
+                task.event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.latest)
+
+    def newest_read_time(self):
+        #read_time of the newest values in latest, to stamp a row built from snapshot(); None before the first read
+        with self.lock:
+            return max(self.read_times.values(), default = None)
+
+    def rates(self):
+        elapsed = time.monotonic() - self.started
+        return {task.name: task.samples / elapsed for task in self.tasks}
+
+    def health(self):
+        return {task.name: task.state for task in self.tasks}
+
+    def _run(self, task):
+        next_time = time.monotonic()
+        while not self.stopped.is_set():
+            wait = 0.0
+            try:
+                values = task.poll()
+                task.succeeded()
+            except Exception as e:
+                #anything else (a driver bug, a bad value) fails the read the same way instead of ending the thread,
+                #which would leave the sensor's last values in latest and stored as if they were new
+                expected = isinstance(e, task.errors)
+                wait = task.failed()
+                if task.state == BACKOFF:
+                    print(task.name, "Error: ", e if expected else repr(e), "- retrying in {:.0f} s".format(wait))
+                    if metrics.ENABLED:
+                        metrics.inc('sensor_backoffs_total', sensor = task.name)
+                elif not expected:
+                    print(task.name, "Unexpected Error: ", repr(e))
+                elif self.log_errors:
+                    print(task.name, "Error: ", e)
+                values = task.on_error() if task.on_error and expected else None
+            with self.lock:
+                self.latest[task.name] = values
+                self.read_times[task.name] = task.read_time
+            if self.on_read is not None:
+                try:
+                    self.on_read(task.name, values, task.read_time)
+                except Exception as e:
+                    #a failing consumer (the database, a subscriber) must not stop the sensor either
+                    print(task.name, "on_read Error: ", repr(e))
+
+            if task.event is not None and not wait:
+                #edges during the read leave the event set, so they are not lost
+                task.event.wait(task.period)
+                task.event.clear()
+                continue
+            next_time += task.period
+            if wait:
+                #backing off or retrying is not an overrun, restart the period grid after the wait
+                next_time = time.monotonic() + wait
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                #overran, start the next period now instead of bursting to catch up
+                if metrics.ENABLED:
+                    metrics.inc('loop_overruns_total', sensor = task.name)
+                next_time = time.monotonic()
+                delay = 0
+            if self.stopped.wait(delay):
+                break
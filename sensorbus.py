@@ -0,0 +1,78 @@
+import os
+
+#'smbus' (python3-smbus, the default), 'smbus2', or 'sim' for the simulated board in simboard.py
+BUS_BACKEND = os.environ.get('SENSORBOARD_BUS', 'smbus')
+#seconds per simulated transaction, unset = timed like a 100 kHz bus, 0 = as fast as the CPU allows
+SIM_LATENCY = float(os.environ['SENSORBOARD_SIM_LATENCY']) if os.environ.get('SENSORBOARD_SIM_LATENCY') else None
+_sim_boards = {} #bus_id -> (SimBus, SimGPIO)
+
+
+def _sim(bus_id = 1):
+    #a simulated board per bus; its GPIO is shared so INT pins follow the chips on the bus
+    if bus_id not in _sim_boards:
+        from simboard import SimBus, SimGPIO
+        bus = SimBus(latency = SIM_LATENCY, seed = bus_id)
+        _sim_boards[bus_id] = (bus, SimGPIO(bus))
+    return _sim_boards[bus_id]
+
+
+def open_bus(bus_id = 1, backend = None):
+    backend = backend or BUS_BACKEND
+    if backend == 'sim':
+        return _sim(bus_id)[0]
+    if backend == 'smbus2':
+        import smbus2
+        return smbus2.SMBus(bus_id)
+    if backend == 'smbus':
+        import smbus
+        return smbus.SMBus(bus_id)
+    raise ValueError("Unknown bus backend: {}".format(backend))
+
+
+def open_gpio(backend = None, bus_id = 1):
+    #returns a module-like object with the RPi.GPIO interface
+    #(the simulated one drives the INT pins of the board on bus_id)
+    backend = backend or BUS_BACKEND
+    if backend == 'sim':
+        return _sim(bus_id)[1]
+    import RPi.GPIO as GPIO
+    return GPIO
+
+
+class AdafruitDHT22:
+    #a DHT22 on a GPIO pin (BCM number, 18 is board.D18) through adafruit_dht, with the interface of simboard.SimDHT22
+    def __init__(self, pin):
+        import board
+        import adafruit_dht
+        self.device = adafruit_dht.DHT22(getattr(board, 'D{}'.format(pin)))
+        # you can pass DHT22 use_pulseio=False if you wouldn't like to use pulseio.
+        # This may be necessary on a Linux single board computer like the Raspberry Pi,
+        # but it will not work in CircuitPython.
+        if not hasattr(self.device, '_last_called'):
+            #fail at startup rather than have every retry read the library's cache
+            raise RuntimeError("adafruit_dht {} has no DHT._last_called, see AdafruitDHT22.measure()".format(
+                    getattr(adafruit_dht, '__version__', '?')))
+
+    def measure(self):
+        #the one place that relies on adafruit_dht internals, checked against adafruit-circuitpython-dht 4.0.12:
+        #measure() answers from its cache within 2 s of DHT._last_called (time.monotonic() of the last attempt, failed
+        #ones included), so a retry after a failed read (dht22.DHT22_RETRY) would never reach the sensor
+        self.device._last_called = 0
+        self.device.measure()
+
+    def read(self):
+        self.measure()
+        return self.device.temperature, self.device.humidity
+
+    def exit(self):
+        #stops the libgpiod pulsein helper, a helper left running keeps the pin busy for the next run
+        self.device.exit()
+
+
+def open_dht22(pin, backend = None):
+    #one DHT22 on its data pin; with SENSORBOARD_BUS=sim a simulated one
+    backend = backend or BUS_BACKEND
+    if backend == 'sim':
+        from simboard import SimDHT22
+        return SimDHT22(seed = pin)
+    return AdafruitDHT22(pin)
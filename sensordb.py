@@ -0,0 +1,354 @@
+import glob
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+import metrics
+from timestamps import TIME_FORMAT
+
+SENSORBOARD_COLUMNS = ('time', 'DHT20_temperature', 'DHT20_humidity', 'AGS10_TVOC', 'AL', 'BMP581_Temperature', 'BMP581_Pressure',
+        'MPU6500_accel_x', 'MPU6500_accel_y', 'MPU6500_accel_z', 'MPU6500_gyro_x', 'MPU6500_gyro_y', 'MPU6500_gyro_z', 'MPU6500_temp',
+        'heart_rate', 'spo2', 'MAX30102_temp')
+DHT22_COLUMNS = ('time', 'temperature', 'humidity')
+
+#failed readings are stored as NULL; older rows used -2.0, and heart rate / SpO2 use -1.0 when not valid
+MISSING_VALUES = {'heart_rate': (-1.0, -2.0), 'spo2': (-1.0, -2.0)}
+DEFAULT_MISSING = (-2.0,)
+
+RETENTION_DAYS = 7
+PRUNE_INTERVAL = 60.0 #seconds between retention passes
+PRUNE_BATCH_ROWS = 2000 #rows deleted per transaction
+TEXT_SUFFIX = '_text' #a TEXT-time table is kept under <table>_text by migrate_time(), drop it once checked
+MAX_FLUSH_FAILURES = 5 #flushes failing in a row before a writer drops its buffered rows
+
+
+def table_sql(table, columns, time_us = False):
+    #columns as declared (SENSORBOARD_COLUMNS, DHT22_COLUMNS): time first, then the values
+    fields = ['{} {}'.format(columns[0], 'INTEGER PRIMARY KEY' if time_us else 'TEXT')]
+    fields += ['{} REAL'.format(c) for c in columns[1:]]
+    return 'CREATE TABLE IF NOT EXISTS {} ({})'.format(table, ', '.join(fields))
+
+
+def create_table(conn, table, columns, time_us = False):
+    #first column is the TEXT timestamp, the rest are REAL values;
+    #time_us keys the table by epoch microseconds (timestamps.time_us()): time is the rowid, no index is needed
+    conn.execute(table_sql(table, columns, time_us))
+    conn.commit()
+
+
+def is_time_us(conn, table):
+    return conn.execute("SELECT type FROM pragma_table_info(?) WHERE name = 'time'", (table,)).fetchone() == ('INTEGER',)
+
+
+def migrate_time(conn, table, columns):
+    #rebuilds a TEXT-time table as create_table(conn, table, columns, time_us = True) and keeps the old one under
+    #<table>_text; the old table's time column is found by name, other columns it has (an id key, say) are left
+    #behind and declared columns it lacks are NULL; the rows written in the same second are spread over it in insert
+    #order; returns the rows moved
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    if kind != ('table',) or is_time_us(conn, table):
+        return 0
+    existing = {row[0] for row in conn.execute('SELECT name FROM pragma_table_info(?)', (table,))}
+    if columns[0] not in existing:
+        raise ValueError("{} has no {} column to migrate".format(table, columns[0]))
+    old = table + TEXT_SUFFIX
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (old,)).fetchone():
+        raise ValueError("{0} has TEXT times but {1} already exists; drop or rename {1} to migrate {0}".format(table, old))
+    values = [c if c in existing else 'NULL' for c in columns[1:]]
+    conn.execute('BEGIN')
+    with conn:
+        conn.execute('ALTER TABLE {} RENAME TO {}'.format(table, old))
+        #index names are global, create_time_index() on the old name would otherwise find it and do nothing
+        conn.execute('DROP INDEX IF EXISTS {}_time_idx'.format(table))
+        conn.execute(table_sql(table, columns, time_us = True))
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO {0} ({1})
+            SELECT * FROM (
+                SELECT CAST(strftime('%s', {2}, 'utc') AS INTEGER) * 1000000
+                        + (ROW_NUMBER() OVER second - 1) * 1000000 / COUNT(*) OVER whole_second AS t, {3}
+                FROM {4}
+                WINDOW second AS (PARTITION BY {2} ORDER BY rowid), whole_second AS (PARTITION BY {2}))
+            WHERE t IS NOT NULL
+        '''.format(table, ', '.join(columns), columns[0], ', '.join(values), old))
+    return cursor.rowcount
+
+
+def insert_sql(table, columns):
+    #a row whose time is already stored (timestamps.time_us() can repeat a stamp after re-anchoring back) is ignored:
+    #the stored row is kept and the new one counted in db_rows_dropped_total, so it cannot block every later flush
+    return 'INSERT OR IGNORE INTO {} ({}) VALUES ({})'.format(table, ', '.join(columns), ', '.join('?' * len(columns)))
+
+
+def count_dropped(table, count, reason):
+    if count and metrics.ENABLED:
+        metrics.inc('db_rows_dropped_total', count, table = table, reason = reason)
+
+
+def is_missing(column, value):
+    return value is None or value in MISSING_VALUES.get(column, DEFAULT_MISSING)
+
+
+def create_time_index(conn, table):
+    #older databases were created without it, building it once takes a few seconds on a full week
+    conn.execute('CREATE INDEX IF NOT EXISTS {0}_time_idx ON {0} (time)'.format(table))
+    conn.commit()
+
+
+def prune(conn, table, retention_days = RETENTION_DAYS, batch_rows = PRUNE_BATCH_ROWS, pause = 0.0, archive = None,
+        time_us = False):
+    #deletes expired rows in short transactions so the writer never waits long for the lock;
+    #archive(table, columns, rows) is handed each batch before it is deleted, and again by the next prune when the
+    #process died or the DELETE failed in between, so it has to be safe to repeat (archive.archive_rows() is)
+    #time_us for tables keyed by epoch microseconds instead of TIME_FORMAT text (narrowdb.py)
+    delete_timeline = datetime.now() - timedelta(days = retention_days)
+    if time_us:
+        delete_timeline = int(delete_timeline.timestamp() * 1000000)
+    else:
+        delete_timeline = delete_timeline.strftime(TIME_FORMAT)
+    deleted = 0
+    while True:
+        if archive is None:
+            with conn:
+                cursor = conn.execute('''
+                    DELETE FROM {0} WHERE rowid IN
+                    (SELECT rowid FROM {0} WHERE time < ? ORDER BY time LIMIT ?)
+                '''.format(table), (delete_timeline, batch_rows))
+            count = cursor.rowcount
+        else:
+            cursor = conn.execute('SELECT rowid, * FROM {} WHERE time < ? ORDER BY time LIMIT ?'.format(table),
+                    (delete_timeline, batch_rows))
+            columns = [d[0] for d in cursor.description[1:]]
+            rows = cursor.fetchall()
+            if rows:
+                archive(table, columns, [row[1:] for row in rows])
+                with conn:
+                    conn.executemany('DELETE FROM {} WHERE rowid = ?'.format(table), [(row[0],) for row in rows])
+            count = len(rows)
+        deleted += count
+        if count < batch_rows:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def prune_files(patterns, retention_days = RETENTION_DAYS):
+    #deletes the files matching the glob patterns that were last written before the retention window, for per-day
+    #files such as SensorBoard.py's MPU6500_<day>.bin; returns how many
+    delete_timeline = time.time() - retention_days * 86400
+    deleted = 0
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            if os.path.getmtime(path) < delete_timeline:
+                os.remove(path)
+                deleted += 1
+    return deleted
+
+
+class RetentionPruner(threading.Thread):
+    #background thread applying the retention window every interval seconds
+    #index = False for tables whose time column is already a key, archive and time_us are passed on to prune(),
+    #files are glob patterns passed to prune_files()
+    def __init__(self, db_name, tables, retention_days = RETENTION_DAYS, interval = PRUNE_INTERVAL,
+            batch_rows = PRUNE_BATCH_ROWS, index = True, archive = None, time_us = False, files = ()):
+        super().__init__(name = 'RetentionPruner', daemon = True)
+        self.db_name = db_name
+        self.tables = tuple(tables)
+        self.index = index
+        self.archive = archive
+        self.time_us = time_us
+        self.files = tuple(files)
+        self.retention_days = retention_days
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self.stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_name)
+        try:
+            if self.index:
+                for table in self.tables:
+                    create_time_index(conn, table)
+            while True:
+                for table in self.tables:
+                    try:
+                        prune(conn, table, self.retention_days, self.batch_rows, pause = 0.05, archive = self.archive,
+                                time_us = self.time_us)
+                    except (sqlite3.Error, OSError) as e:
+                        print("Retention Error: ", e)
+                try:
+                    prune_files(self.files, self.retention_days)
+                except OSError as e:
+                    print("Retention Error: ", e)
+                if self.stopped.wait(self.interval):
+                    break
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class SensorDBWriter:
+    #keeps one connection open and writes buffered rows in a single transaction
+    #once flush_rows rows are queued or flush_interval seconds have passed,
+    #flush_hooks are called as hook(conn, rows) inside that transaction
+    #with a compressor (see deadband.py) only the rows it keeps are inserted, the hooks still get every row
+    #dropped counts the rows not stored: repeated times, and batches given up after MAX_FLUSH_FAILURES failed flushes
+    def __init__(self, db_name, table, columns, flush_rows = 20, flush_interval = 10.0, compressor = None):
+        self.table = table
+        self.columns = tuple(columns)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.insert_sql = insert_sql(table, self.columns)
+        self.rows = []
+        self.kept = []
+        self.compressor = compressor
+        self.flush_hooks = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.failures = 0
+        self.dropped = 0
+
+        self.conn = sqlite3.connect(db_name, check_same_thread = False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        #WAL + NORMAL only syncs on checkpoint, not on every commit
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def insert(self, row):
+        if len(row) != len(self.columns):
+            raise ValueError("{} expects {} values, got {}".format(self.table, len(self.columns), len(row)))
+        with self.lock:
+            row = tuple(row)
+            self.rows.append(row)
+            if self.compressor is not None:
+                self.kept.extend(self.compressor.add(row))
+            if (len(self.rows) >= self.flush_rows
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows and not self.kept:
+            return
+        #rows stay buffered if the transaction fails, so the next flush retries them; after MAX_FLUSH_FAILURES failures
+        #in a row (a full disk, a failing hook) they are dropped instead of being retried forever while the buffer grows
+        start = time.perf_counter()
+        kept = self.rows if self.compressor is None else self.kept
+        try:
+            with self.conn:
+                stored = self.conn.executemany(self.insert_sql, kept).rowcount
+                for hook in self.flush_hooks:
+                    hook(self.conn, self.rows)
+        except Exception:
+            self.failures += 1
+            if self.failures >= MAX_FLUSH_FAILURES:
+                self.dropped += len(kept)
+                count_dropped(self.table, len(kept), 'failed')
+                self.rows = []
+                self.kept = []
+                self.failures = 0
+            raise
+        self.failures = 0
+        self.dropped += len(kept) - stored
+        count_dropped(self.table, len(kept) - stored, 'duplicate')
+        if metrics.ENABLED:
+            metrics.observe('db_flush_seconds', time.perf_counter() - start, table = self.table)
+            metrics.inc('db_rows_total', stored, table = self.table)
+        self.rows = []
+        self.kept = []
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.compressor is not None:
+                    self.kept.extend(self.compressor.finish())
+                self._flush()
+            finally:
+                self.conn.close()
+
+
+class MultiTableWriter:
+    #SensorDBWriter for several tables of the same process: one connection, and the rows of every table are written in
+    #one transaction once flush_rows rows are queued or flush_interval seconds have passed;
+    #tables maps table -> columns, compressor (a deadband.py class) is applied per table; dropped as in SensorDBWriter
+    def __init__(self, db_name, tables, flush_rows = 20, flush_interval = 10.0, compressor = None):
+        self.tables = {table: tuple(columns) for table, columns in tables.items()}
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.insert_sql = {table: insert_sql(table, columns) for table, columns in self.tables.items()}
+        self.compressors = {table: compressor(columns) for table, columns in self.tables.items()} if compressor else None
+        self.rows = {table: [] for table in self.tables}
+        self.queued = 0
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.failures = 0
+        self.dropped = 0
+
+        self.conn = sqlite3.connect(db_name, check_same_thread = False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+
+    def insert(self, table, row):
+        columns = self.tables[table]
+        if len(row) != len(columns):
+            raise ValueError("{} expects {} values, got {}".format(table, len(columns), len(row)))
+        with self.lock:
+            row = tuple(row)
+            self.rows[table].extend(self.compressors[table].add(row) if self.compressors is not None else (row,))
+            self.queued += 1
+            if (self.queued >= self.flush_rows
+                    or time.monotonic() - self.last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = time.monotonic()
+        if not any(self.rows.values()):
+            self.queued = 0
+            return
+        #rows stay buffered if the transaction fails, so the next flush retries them, up to MAX_FLUSH_FAILURES times
+        start = time.perf_counter()
+        stored = {}
+        try:
+            with self.conn:
+                for table, rows in self.rows.items():
+                    if rows:
+                        stored[table] = self.conn.executemany(self.insert_sql[table], rows).rowcount
+        except Exception:
+            self.failures += 1
+            if self.failures >= MAX_FLUSH_FAILURES:
+                for table, rows in self.rows.items():
+                    self.dropped += len(rows)
+                    count_dropped(table, len(rows), 'failed')
+                self.rows = {table: [] for table in self.tables}
+                self.queued = 0
+                self.failures = 0
+            raise
+        self.failures = 0
+        for table, count in stored.items():
+            self.dropped += len(self.rows[table]) - count
+            count_dropped(table, len(self.rows[table]) - count, 'duplicate')
+        if metrics.ENABLED:
+            metrics.observe('db_flush_seconds', time.perf_counter() - start, table = ','.join(self.tables))
+            for table, count in stored.items():
+                metrics.inc('db_rows_total', count, table = table)
+        self.rows = {table: [] for table in self.tables}
+        self.queued = 0
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.compressors is not None:
+                    for table, compressor in self.compressors.items():
+                        self.rows[table].extend(compressor.finish())
+                self._flush()
+            finally:
+                self.conn.close()
@@ -0,0 +1,522 @@
+import math
+import random
+import threading
+import time
+from crc8 import crc8
+
+DHT20_ADDRESS = 0x38
+AGS10_ADDRESS = 0x1A
+BH1750FVI_ADDRESS = 0x23
+BMP581_ADDRESS = 0x46
+MPU6500_ADDRESS = 0x68
+MAX30102_ADDRESS = 0x57
+#ADDR / SDO strapped high; the simulated chips answer on either address
+ALTERNATE_ADDRESSES = {0x5C: BH1750FVI_ADDRESS, 0x47: BMP581_ADDRESS, 0x69: MPU6500_ADDRESS}
+
+
+class Environment:
+    #slowly varying room conditions plus a pulse, shared by all simulated chips
+    def __init__(self, seed = 0):
+        self.rng = random.Random(seed)
+        self.start = time.monotonic()
+
+    def now(self):
+        return time.monotonic() - self.start
+
+    def temperature(self):
+        return 23.0 + 1.5 * math.sin(self.now() / 600) + self.rng.gauss(0, 0.02)
+
+    def humidity(self):
+        return 45.0 + 5.0 * math.sin(self.now() / 900) + self.rng.gauss(0, 0.1)
+
+    def pressure(self):
+        return 101325.0 + 50.0 * math.sin(self.now() / 1800) + self.rng.gauss(0, 2.0)
+
+    def lux(self):
+        return max(0.0, 300.0 + 20.0 * math.sin(self.now() / 300) + self.rng.gauss(0, 1.0))
+
+    def tvoc(self):
+        return max(0.0, 0.15 + 0.05 * math.sin(self.now() / 1200) + self.rng.gauss(0, 0.002))
+
+    def motion(self):
+        #(accel xyz in g, gyro xyz in dps), board lying flat with some vibration
+        accel = (self.rng.gauss(0, 0.01), self.rng.gauss(0, 0.01), 1.0 + self.rng.gauss(0, 0.01))
+        gyro = tuple(self.rng.gauss(0, 0.5) for _ in range(3))
+        return accel, gyro
+
+    def ppg(self, t):
+        #(red, ir) at time t, 72 bpm
+        phase = 2 * math.pi * 1.2 * t
+        return (80000 + 280 * math.sin(phase) + self.rng.gauss(0, 30),
+                100000 + 700 * math.sin(phase) + self.rng.gauss(0, 30))
+
+
+class Chip:
+    #register file with byte-level defaults, chips override what they model
+    def __init__(self, env):
+        self.env = env
+        self.regs = bytearray(256)
+
+    def read_byte(self):
+        return 0
+
+    def write_byte(self, value):
+        pass
+
+    def read_reg(self, reg, length):
+        return list(self.regs[reg:reg + length])
+
+    def write_reg(self, reg, data):
+        for i, value in enumerate(data):
+            self.regs[(reg + i) & 0xFF] = value
+
+    def interrupt(self):
+        #level of the chip's INT pin, None when it has none
+        return None
+
+
+class DHT20(Chip):
+    CONVERSION_TIME = 0.08
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.triggered = None
+
+    def busy(self):
+        return self.triggered is not None and time.monotonic() - self.triggered < self.CONVERSION_TIME
+
+    def read_byte(self):
+        #calibrated (0x18), bit 7 while a measurement is running
+        return 0x98 if self.busy() else 0x18
+
+    def write_reg(self, reg, data):
+        if reg == 0xAC:
+            self.triggered = time.monotonic()
+
+    def read_reg(self, reg, length):
+        hum = int(self.env.humidity() / 100 * (1 << 20)) & 0xFFFFF
+        temp = int((self.env.temperature() + 50.0) / 200 * (1 << 20)) & 0xFFFFF
+        data = [self.read_byte(), hum >> 12, (hum >> 4) & 0xFF, ((hum & 0x0F) << 4) | (temp >> 16),
+                (temp >> 8) & 0xFF, temp & 0xFF]
+        data.append(crc8(data))
+        return data[:length]
+
+
+class AGS10(Chip):
+    def read_reg(self, reg, length):
+        ppb = int(self.env.tvoc() * 1000)
+        data = [0x00, (ppb >> 16) & 0xFF, (ppb >> 8) & 0xFF, ppb & 0xFF]
+        data.append(crc8(data))
+        return data[:length]
+
+
+class BH1750FVI(Chip):
+    def read_reg(self, reg, length):
+        raw = min(0xFFFF, int(self.env.lux() * 1.2))
+        return [raw >> 8, raw & 0xFF][:length]
+
+
+class BMP581(Chip):
+    CONVERSION_TIME = 0.2 #continuous mode at 128x pressure / temperature oversampling
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.regs[0x01] = 0x50 #CHIP_ID
+        self.regs[0x27] = 0x10 #INT_STATUS: POR
+        self.regs[0x28] = 0x02 #STATUS: NVM_RDY
+        self.conversions = 0
+        self.ages = [] #seconds since the conversion, per data read
+
+    def interrupt(self):
+        #INT_CONFIG int_en + INT_SOURCE drdy, one pulse per conversion (pulsed mode, active high)
+        if not (self.regs[0x14] & 0x08 and self.regs[0x15] & 0x01):
+            return None
+        conversions = int(self.env.now() / self.CONVERSION_TIME)
+        fired = conversions != self.conversions
+        self.conversions = conversions
+        return 1 if fired else 0
+
+    def read_reg(self, reg, length):
+        if reg == 0x1D:
+            temp = int(self.env.temperature() * (1 << 16)) & 0xFFFFFF
+            pressure = int(self.env.pressure() * (1 << 6)) & 0xFFFFFF
+            self.write_reg(0x1D, [temp & 0xFF, (temp >> 8) & 0xFF, temp >> 16,
+                    pressure & 0xFF, (pressure >> 8) & 0xFF, pressure >> 16])
+            self.ages.append(self.env.now() % self.CONVERSION_TIME)
+        elif reg == 0x27:
+            #INT_STATUS clears on read
+            data = super().read_reg(reg, length)
+            self.regs[0x27] = 0
+            return data
+        return super().read_reg(reg, length)
+
+    def write_reg(self, reg, data):
+        if reg == 0x7E and data[0] == 0xB6:
+            #CMD soft reset
+            self.__init__(self.env)
+            return
+        super().write_reg(reg, data)
+
+
+class MPU6500(Chip):
+    ACCEL_SCALE = 4096.0 #8g
+    GYRO_SCALE = 32.8 #1000 dps
+
+    def sample(self):
+        #14 bytes from ACCEL_XOUT_H: accel xyz, temp, gyro xyz, big-endian
+        accel, gyro = self.env.motion()
+        temp = int((self.env.temperature() + 2.0 - 21.0) * 333.87 + 21.0)
+        words = [int(a * self.ACCEL_SCALE) for a in accel] + [temp] + [int(g * self.GYRO_SCALE) for g in gyro]
+        data = []
+        for word in words:
+            word &= 0xFFFF
+            data += [word >> 8, word & 0xFF]
+        return data
+
+    FIFO_SIZE = 512
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.fifo = bytearray()
+        self.fifo_start = None
+        self.fifo_samples = 0
+        self.drdy_samples = 0
+        self.ages = [] #seconds since the sample, per data register read
+
+    def sample_period(self):
+        #SMPLRT_DIV only applies with DLPF_CFG 1..6, otherwise the data registers update at 8 kHz
+        return (1 + self.regs[0x19]) / 1000 if 0 < self.regs[0x1A] & 0x07 < 7 else 1 / 8000
+
+    def interrupt(self):
+        #RAW_RDY_EN, latched when INT_PIN_CFG LATCH_INT_EN, active high
+        if not self.regs[0x38] & 0x01:
+            return None
+        samples = int(self.env.now() / self.sample_period())
+        if samples != self.drdy_samples:
+            self.drdy_samples = samples
+            self.regs[0x3A] |= 0x01
+            return 1
+        return 1 if self.regs[0x37] & 0x20 and self.regs[0x3A] & 0x01 else 0
+
+    def _fill(self):
+        #USER_CTRL FIFO_EN and at least one FIFO_EN source, at 1kHz / (1 + SMPLRT_DIV)
+        if not (self.regs[0x6A] & 0x40 and self.regs[0x23]):
+            self.fifo_start = None
+            return
+        now = self.env.now()
+        if self.fifo_start is None:
+            self.fifo_start = now
+            self.fifo_samples = 0
+        due = int((now - self.fifo_start) * 1000 / (1 + self.regs[0x19]))
+        #only the last FIFO_SIZE bytes can survive, skip generating the rest
+        self.fifo_samples = max(self.fifo_samples, due - self.FIFO_SIZE // 14 - 1)
+        while self.fifo_samples < due:
+            self.fifo += bytes(self.sample())
+            self.fifo_samples += 1
+        if len(self.fifo) > self.FIFO_SIZE:
+            del self.fifo[:len(self.fifo) - self.FIFO_SIZE]
+            self.regs[0x3A] |= 0x10 #INT_STATUS FIFO_OFLOW
+
+    def read_reg(self, reg, length):
+        self._fill()
+        if self.regs[0x37] & 0x10:
+            #INT_ANYRD_2CLEAR
+            self.regs[0x3A] &= ~0x01
+        if 0x3B <= reg < 0x49:
+            self.write_reg(0x3B, self.sample())
+            self.ages.append(self.env.now() % self.sample_period())
+        elif reg == 0x72:
+            count = len(self.fifo)
+            self.regs[0x72], self.regs[0x73] = count >> 8, count & 0xFF
+        elif reg == 0x74:
+            data = list(self.fifo[:length])
+            del self.fifo[:length]
+            return data + [0] * (length - len(data))
+        elif reg == 0x3A:
+            #INT_STATUS clears on read
+            data = super().read_reg(reg, length)
+            self.regs[0x3A] = 0
+            return data
+        return super().read_reg(reg, length)
+
+    def write_reg(self, reg, data):
+        if reg == 0x6A and data[0] & 0x04:
+            #USER_CTRL FIFO_RST
+            self.fifo = bytearray()
+            self.fifo_start = None
+            self.regs[0x3A] &= ~0x10
+            data = [data[0] & ~0x04]
+        super().write_reg(reg, data)
+        #start the FIFO clock as soon as it is enabled
+        self._fill()
+
+
+class MAX30102(Chip):
+    FIFO_DEPTH = 32
+    SAMPLE_RATE = 400 / 16
+
+    def __init__(self, env):
+        super().__init__(env)
+        self.fifo = []
+        self.produced = 0 #samples generated since start
+        self.regs[0x1F] = 30
+        self.regs[0x20] = 4
+        self.ages = [] #seconds each sample waited in the FIFO
+
+    def interrupt(self):
+        #A_FULL once 32 - FIFO_A_FULL samples are unread, open drain active low, cleared by reading status or data
+        if not self.regs[0x02] & 0x80:
+            return None
+        self._fill()
+        if len(self.fifo) >= self.FIFO_DEPTH - (self.regs[0x08] & 0x0F):
+            self.regs[0x00] |= 0x80
+        return 0 if self.regs[0x00] & 0x80 else 1
+
+    def _fill(self):
+        due = int(self.env.now() * self.SAMPLE_RATE)
+        while self.produced < due:
+            red, ir = self.env.ppg(self.produced / self.SAMPLE_RATE)
+            if len(self.fifo) == self.FIFO_DEPTH:
+                #oldest sample is lost, like the chip without FIFO_ROLLOVER_EN
+                self.fifo.pop(0)
+                self.regs[0x05] = min(0x1F, self.regs[0x05] + 1)
+            self.fifo.append((int(red) & 0x3FFFF, int(ir) & 0x3FFFF))
+            self.produced += 1
+        self.regs[0x04] = (self.regs[0x06] + len(self.fifo)) % self.FIFO_DEPTH
+
+    def read_reg(self, reg, length):
+        self._fill()
+        if reg == 0x07:
+            data = []
+            for _ in range(length // 6):
+                if not self.fifo:
+                    break
+                red, ir = self.fifo.pop(0)
+                self.ages.append(self.env.now() - (self.produced - len(self.fifo) - 1) / self.SAMPLE_RATE)
+                data += [red >> 16, (red >> 8) & 0xFF, red & 0xFF, ir >> 16, (ir >> 8) & 0xFF, ir & 0xFF]
+                self.regs[0x06] = (self.regs[0x06] + 1) % self.FIFO_DEPTH
+            self.regs[0x05] = 0
+            self.regs[0x00] &= ~0x80
+            return data + [0] * (length - len(data))
+        if reg == 0x00:
+            data = super().read_reg(reg, length)
+            self.regs[0x00] = 0
+            return data
+        return super().read_reg(reg, length)
+
+    def write_reg(self, reg, data):
+        if reg == 0x09 and data[0] & 0x40:
+            #reset empties the FIFO
+            self.fifo = []
+            self.produced = int(self.env.now() * self.SAMPLE_RATE)
+            self.regs[0x04] = self.regs[0x05] = self.regs[0x06] = 0
+            return
+        super().write_reg(reg, data)
+
+
+CHIPS = {
+    DHT20_ADDRESS: DHT20,
+    AGS10_ADDRESS: AGS10,
+    BH1750FVI_ADDRESS: BH1750FVI,
+    BMP581_ADDRESS: BMP581,
+    MPU6500_ADDRESS: MPU6500,
+    MAX30102_ADDRESS: MAX30102,
+}
+
+
+class SimBus:
+    #drop-in for smbus.SMBus with the six SensorBoard chips attached
+    #latency: None = time each transaction as on a bit_rate bus, otherwise seconds per transaction
+    #error_rate: probability that a transaction fails with OSError, dead: addresses that never answer
+    #timeout: seconds a failing transaction holds the bus (a hung chip stretching SCL), None = like a good one
+    def __init__(self, latency = None, bit_rate = 100000, error_rate = 0.0, dead = (), seed = 0, timeout = None):
+        self.env = Environment(seed)
+        self.chips = {address: chip(self.env) for address, chip in CHIPS.items()}
+        for alternate, address in ALTERNATE_ADDRESSES.items():
+            self.chips[alternate] = self.chips[address]
+        self.latency = latency
+        self.bit_rate = bit_rate
+        self.error_rate = error_rate
+        self.dead = set(dead)
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.chip_lock = threading.Lock()
+        self.transactions = 0
+        self.bytes = 0
+        self.failed = 0
+
+    def _transfer(self, address, nbytes, op):
+        with self.lock:
+            self.transactions += 1
+            self.bytes += nbytes
+            failed = address in self.dead or address not in self.chips or self.rng.random() < self.error_rate
+            self.failed += failed
+        #address byte and ACK bits included
+        delay = self.latency if self.latency is not None else (nbytes + 1) * 9 / self.bit_rate
+        if failed and self.timeout is not None:
+            delay = self.timeout
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise OSError(121, "Remote I/O error")
+        #SimGPIO samples INT lines from another thread
+        with self.chip_lock:
+            return op(self.chips[address])
+
+    def read_byte(self, address):
+        return self._transfer(address, 1, lambda chip: chip.read_byte())
+
+    def write_byte(self, address, value):
+        self._transfer(address, 1, lambda chip: chip.write_byte(value))
+
+    def read_byte_data(self, address, register):
+        return self._transfer(address, 2, lambda chip: chip.read_reg(register, 1)[0])
+
+    def write_byte_data(self, address, register, value):
+        self._transfer(address, 2, lambda chip: chip.write_reg(register, [value]))
+
+    def read_i2c_block_data(self, address, register, length = 32):
+        return self._transfer(address, 1 + length, lambda chip: chip.read_reg(register, length))
+
+    def write_i2c_block_data(self, address, register, data):
+        self._transfer(address, 1 + len(data), lambda chip: chip.write_reg(register, list(data)))
+
+    def close(self):
+        pass
+
+
+class SimDHT22:
+    #a single-wire DHT22 read like adafruit_dht does: a read_time pulse capture, then a checksum or short-frame error
+    #with probability failure_rate (the Pi missed edges); a dead sensor never answers
+    READ_TIME = 0.25
+
+    def __init__(self, failure_rate = 0.0, read_time = READ_TIME, dead = False, seed = 0):
+        self.env = Environment(seed)
+        self.failure_rate = failure_rate
+        self.read_time = read_time
+        self.dead = dead
+        self.rng = random.Random(seed)
+        self.reads = 0
+        self.failed = 0
+
+    def read(self):
+        #(temperature, humidity) or RuntimeError, as adafruit_dht raises them
+        time.sleep(self.read_time)
+        self.reads += 1
+        if self.dead:
+            self.failed += 1
+            raise RuntimeError("DHT sensor not found, check wiring")
+        if self.rng.random() < self.failure_rate:
+            self.failed += 1
+            raise RuntimeError("Checksum did not validate. Try again.")
+        #0.1 degree and 0.1 % steps, like the sensor reports them
+        return round(self.env.temperature(), 1), round(self.env.humidity(), 1)
+
+    def exit(self):
+        pass
+
+
+#INT pins in GPIO.BOARD numbering, as wired in SensorBoard.py
+INT_PINS = {
+    35: BMP581_ADDRESS,
+    11: MPU6500_ADDRESS,
+    37: MAX30102_ADDRESS,
+}
+
+
+class SimGPIO:
+    #the parts of RPi.GPIO used by SensorBoard.py; with a SimBus attached, INT pins follow the chips
+    #and edge callbacks run on one watcher thread like RPi.GPIO's
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    WATCH_INTERVAL = 0.0005 #seconds between INT line samples
+
+    def __init__(self, bus = None):
+        self.bus = bus
+        self.mode = None
+        self.pins = {}
+        self.pulls = {}
+        self.detect = {} #pin -> (edge, callbacks)
+        self.detected = set()
+        self.lock = threading.Lock()
+        self.watcher = None
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, initial = LOW, pull_up_down = PUD_OFF):
+        self.pulls[pin] = pull_up_down
+        self.pins[pin] = initial if direction == self.OUT else (self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def output(self, pin, value):
+        self.pins[pin] = value
+
+    def input(self, pin):
+        return self.pins.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback = None, bouncetime = None):
+        with self.lock:
+            if pin in self.detect:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            self.detect[pin] = (edge, [callback] if callback else [])
+        if self.bus is not None and self.watcher is None:
+            self.watcher = threading.Thread(target = self._watch, name = 'SimGPIO', daemon = True)
+            self.watcher.start()
+
+    def add_event_callback(self, pin, callback):
+        with self.lock:
+            self.detect[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        with self.lock:
+            self.detect.pop(pin, None)
+
+    def event_detected(self, pin):
+        with self.lock:
+            if pin in self.detected:
+                self.detected.discard(pin)
+                return True
+        return False
+
+    def _watch(self):
+        while True:
+            with self.lock:
+                watched = dict(self.detect)
+            for pin, (edge, callbacks) in watched.items():
+                chip = self.bus.chips.get(INT_PINS.get(pin))
+                if chip is None:
+                    continue
+                with self.bus.chip_lock:
+                    level = chip.interrupt()
+                if level is None:
+                    #INT output disabled, the line rests at its pull
+                    level = self.HIGH if self.pulls.get(pin) == self.PUD_UP else self.LOW
+                previous = self.pins.get(pin, level)
+                self.pins[pin] = level
+                if level == previous:
+                    continue
+                if edge == self.BOTH or (edge == self.RISING) == (level == self.HIGH):
+                    with self.lock:
+                        self.detected.add(pin)
+                    for callback in callbacks:
+                        callback(pin)
+            time.sleep(self.WATCH_INTERVAL)
+
+    def cleanup(self):
+        self.pins = {}
+        with self.lock:
+            self.detect = {}
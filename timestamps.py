@@ -0,0 +1,47 @@
+import threading
+import time
+from datetime import datetime
+
+#readings are stamped with integer epoch microseconds; TIME_FORMAT is what databases from before used and what is shown
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+RESYNC_US = 100000 #a wall clock step larger than this moves the anchor (NTP syncing after boot, a manual change)
+
+#the clock runs on time.monotonic_ns() from an anchor to the wall clock: small steps of the system clock do not reorder
+#readings, a larger one (a Pi without RTC starts before NTP has synced) re-anchors on the next stamp, so rows are not
+#stamped hours off for the life of the process
+_anchor_ns = time.time_ns() - time.monotonic_ns()
+_lock = threading.Lock()
+_last = 0
+
+
+def time_us():
+    #strictly increasing between re-anchors, so stamps are unique keys even for readings taken in the same microsecond;
+    #after a step back the stamps go back with the wall clock, a stamp equal to an older row's is then dropped by the
+    #writer (sensordb.insert_sql())
+    global _anchor_ns, _last
+    monotonic = time.monotonic_ns()
+    wall = time.time_ns()
+    with _lock:
+        if abs(wall - monotonic - _anchor_ns) > RESYNC_US * 1000:
+            _anchor_ns = wall - monotonic
+            _last = 0
+        now = (_anchor_ns + monotonic) // 1000
+        if now <= _last:
+            now = _last + 1
+        _last = now
+    return now
+
+
+def format_time(us, fmt = TIME_FORMAT):
+    #local time text for display; fmt = TIME_FORMAT + '.%f' keeps the microseconds
+    return to_datetime(us).strftime(fmt)
+
+
+def parse_time(text, fmt = TIME_FORMAT):
+    #local time text (TIME_FORMAT, or fmt) to epoch microseconds
+    return int(datetime.strptime(text, fmt).timestamp() * 1000000)
+
+
+def to_datetime(us):
+    #local datetime, exact to the microsecond (a float of epoch seconds is not)
+    return datetime.fromtimestamp(us // 1000000).replace(microsecond = us % 1000000)